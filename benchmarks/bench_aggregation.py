@@ -0,0 +1,298 @@
+# encoding: utf-8
+"""
+Benchmark building NcML aggregations from synthetic CCI-like netCDF files
+with CCIAggregationCreator (files with a time variable) and
+CCIAerosolAggregationCreator (files with only time_coverage attributes).
+
+For each case the wall time, the peak memory of the process and the number
+of files opened are recorded. Each case runs in a fresh process so that the
+peak memory is its own.
+
+The files are kept in --data-dir and reused, as generating 50k files takes a
+few minutes.
+
+With --stream, each case is also run with write_aggregation, which writes the
+NcML as it is built rather than building the whole document in memory.
+
+With --filename-dates, the coordinate values are taken from the filenames
+after checking a sample of the files, as with the filename_dates option.
+
+With --compare, the results are compared with those of the same cases in a
+previous --output file. The script exits with status 1 if the wall time or
+peak memory of any case grew by more than --threshold percent, or it opened
+more files.
+
+Usage:
+    python benchmarks/bench_aggregation.py --files 10 1000 50000 --data-dir /tmp/cci_bench
+    python benchmarks/bench_aggregation.py --files 1000 --metadata-cache
+    python benchmarks/bench_aggregation.py --files 50000 --creator time --stream
+    python benchmarks/bench_aggregation.py --files 50000 --creator time --filename-dates
+    python benchmarks/bench_aggregation.py --files 1000 50000 --compare baseline.jsonl
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.aggregation.aerosol import CCIAerosolAggregationCreator
+from cci_publisher.aggregation.base import CCIAggregationCreator
+from cci_publisher.aggregation.cache import MetadataCache
+from cci_publisher.datasets.threddsdataset import NcMLStreamWriter
+from synthetic import make_netcdf_dataset
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+CREATORS = {
+    'time': (CCIAggregationCreator, False),
+    'aerosol': (CCIAerosolAggregationCreator, True),
+}
+
+# Fields which identify a case, with the values assumed for results written
+# before the field was recorded
+CASE_FIELDS = (
+    ('creator', None),
+    ('files', None),
+    ('workers', 1),
+    ('cache', 'none'),
+    ('stream', False),
+    ('filename_dates', False),
+)
+
+
+def counting(creator_cls):
+    """
+    Subclass of creator_cls whose dataset reader counts the files it opens.
+    With a metadata cache or workers, this is the reader behind the cache.
+    The count is shared with the processes which read the files for the
+    workers.
+    """
+    reader_cls = creator_cls.dataset_reader_cls
+    opened = multiprocessing.Value('i', 0)
+
+    class CountingReader(reader_cls):
+
+        def __enter__(self):
+            with opened.get_lock():
+                opened.value += 1
+            return super().__enter__()
+
+        @classmethod
+        def opened(cls):
+            return opened.value
+
+    # Found by name when sent to the worker processes, which are forked
+    # after this
+    CountingReader.__name__ = CountingReader.__qualname__ = f'Counting{reader_cls.__name__}'
+    globals()[CountingReader.__name__] = CountingReader
+
+    class CountingCreator(creator_cls):
+        dataset_reader_cls = CountingReader
+
+    return CountingCreator, CountingReader
+
+
+def run_case(creator_name, file_list, workers, cache_path, stream, filename_dates, conn):
+    """
+    Build one aggregation and send the measurements back to the parent
+    """
+    creator_cls, reader_cls = counting(CREATORS[creator_name][0])
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    cache = MetadataCache(cache_path) if cache_path else None
+
+    start = time.perf_counter()
+    creator = creator_cls('time', metadata_cache=cache, workers=workers)
+    if filename_dates:
+        units = creator.find_coordinate_units(file_list)
+        if units:
+            with contextlib.redirect_stdout(None):
+                creator.use_filename_coordinates(file_list, units, seed=0)
+    if stream:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = NcMLStreamWriter(os.path.join(tmpdir, 'agg.ncml'))
+            creator.write_aggregation('esacci.BENCHMARK', 'data.cci.ceda.ac.uk', file_list, writer, cache=True)
+    else:
+        creator.create_aggregation('esacci.BENCHMARK', 'data.cci.ceda.ac.uk', file_list, cache=True)
+    wall_time = time.perf_counter() - start
+
+    if cache is not None:
+        cache.close()
+
+    # ru_maxrss is in kB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    conn.send({
+        'creator': creator_name,
+        'files': len(file_list),
+        'wall_time': wall_time,
+        'peak_rss_mb': peak / 1024,
+        'peak_increase_mb': (peak - baseline) / 1024,
+        'files_opened': reader_cls.opened(),
+    })
+    conn.close()
+
+
+def measure(creator_name, file_list, workers=1, cache_path=None, stream=False, filename_dates=False):
+    """
+    Run a case in a child process
+
+    :return: dict of measurements
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_case,
+                                      args=(creator_name, file_list, workers, cache_path, stream, filename_dates,
+                                            sender))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def case_key(result):
+    """
+    :param result: dict of measurements
+    :return: tuple identifying the case
+    """
+    return tuple(result.get(field, default) for field, default in CASE_FIELDS)
+
+
+def read_results(path):
+    """
+    Read the results written with --output. Where a case was run more than
+    once, the last result is kept.
+
+    :param path: JSON lines file
+    :return: dict of case key to result
+    """
+    results = {}
+    with open(path) as reader:
+        for line in reader:
+            if line.strip():
+                result = json.loads(line)
+                results[case_key(result)] = result
+    return results
+
+
+def percent_change(new, old):
+    """
+    :return: Change from old to new as a percentage of old
+    """
+    if not old:
+        return 0.0 if not new else float('inf')
+    return 100 * (new - old) / old
+
+
+def compare(results, previous, threshold):
+    """
+    Print the change in each measurement from a previous run
+
+    :param results: list of results from this run
+    :param previous: dict of case key to result, see read_results
+    :param threshold: Percentage increase in wall time or peak memory
+                      counted as a regression
+    :return: Number of cases which regressed
+    """
+    print(f'\nChange from previous run (regression: wall or peak RSS > +{threshold:g}%, or more files opened)')
+    print(f'{"creator":>8} {"files":>7} {"cache":>6} {"stream":>6} {"wall":>9} {"peak RSS":>14} {"opened":>7}')
+
+    regressions = 0
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+
+        wall = percent_change(result['wall_time'], old['wall_time'])
+        rss = percent_change(result['peak_rss_mb'], old['peak_rss_mb'])
+        opened = result['files_opened'] - old['files_opened']
+
+        regressed = wall > threshold or rss > threshold or opened > 0
+        regressions += regressed
+
+        print(f'{result["creator"]:>8} {result["files"]:>7} {result["cache"]:>6} '
+              f'{"yes" if result["stream"] else "no":>6} {wall:>+8.1f}% {rss:>+13.1f}% {opened:>+7}'
+              f'{"  REGRESSION" if regressed else ""}')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, nargs='+', default=[10, 1000, 50000],
+                        help='Number of files in the aggregation. Default: %(default)s')
+    parser.add_argument('--creator', choices=CREATORS, nargs='+', default=list(CREATORS),
+                        help='Aggregation creators to run. Default: %(default)s')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'cci_publisher_benchmark'),
+                        help='Directory for the synthetic files. Default: %(default)s')
+    parser.add_argument('--workers', type=int, default=1, help='Files to read concurrently. Default: %(default)s')
+    parser.add_argument('--metadata-cache', action='store_true',
+                        help='Also run with a cold then warm metadata cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='Also run with write_aggregation, streaming the NcML to disk')
+    parser.add_argument('--filename-dates', action='store_true',
+                        help='Take the coordinate values from the filenames, checked against a sample')
+    parser.add_argument('--output', help='Write the results to this file as JSON lines')
+    parser.add_argument('--compare', metavar='PREVIOUS',
+                        help='Compare the results with those of the same cases in this --output file')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percentage increase in wall time or peak RSS which fails --compare. '
+                             'Default: %(default)s')
+    args = parser.parse_args()
+
+    # Read first, in case it is also the output file
+    previous = read_results(args.compare) if args.compare else None
+
+    results = []
+
+    print(f'{"creator":>8} {"files":>7} {"cache":>6} {"stream":>6} {"wall (s)":>9} {"peak RSS (MB)":>14} '
+          f'{"increase (MB)":>14} {"opened":>7}')
+
+    for creator_name in args.creator:
+        aerosol = CREATORS[creator_name][1]
+        for n_files in args.files:
+            directory = os.path.join(args.data_dir, creator_name)
+            file_list = make_netcdf_dataset(directory, max(args.files), aerosol=aerosol)[:n_files]
+
+            for stream in ([False, True] if args.stream else [False]):
+                runs = [('none', None)]
+                if args.metadata_cache:
+                    cache_file = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+                    cache_file.close()
+                    os.remove(cache_file.name)
+                    runs += [('cold', cache_file.name), ('warm', cache_file.name)]
+
+                for cache_state, cache_path in runs:
+                    result = measure(creator_name, file_list, args.workers, cache_path, stream, args.filename_dates)
+                    result['cache'] = cache_state
+                    result['workers'] = args.workers
+                    result['stream'] = stream
+                    result['filename_dates'] = args.filename_dates
+                    results.append(result)
+
+                    print(f'{creator_name:>8} {n_files:>7} {cache_state:>6} {"yes" if stream else "no":>6} '
+                          f'{result["wall_time"]:>9.3f} {result["peak_rss_mb"]:>14.1f} '
+                          f'{result["peak_increase_mb"]:>14.1f} {result["files_opened"]:>7}')
+
+                if args.metadata_cache:
+                    os.remove(cache_path)
+
+    if args.output:
+        with open(args.output, 'a') as writer:
+            for result in results:
+                writer.write(json.dumps(result) + '\n')
+
+    if previous is not None and compare(results, previous, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# encoding: utf-8
+"""
+Benchmark finding the time coverage of an aggregation with min_date and
+max_date, comparing the numpy reduction against parsing every date with
+str_to_date. The results of the two are checked to be identical.
+
+Usage:
+    python benchmarks/bench_dates.py --files 1000 10000 100000
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.aggregation.base import min_date, max_date, str_to_date, date_to_str
+
+import argparse
+from datetime import datetime, timedelta
+import time
+
+FORMATS = {
+    'basic': '%Y%m%dT%H%M%SZ',
+    'extended': '%Y-%m-%dT%H:%M:%SZ',
+    'compact': '%Y%m%d%H%MZ',
+}
+
+
+def make_dates(n_files, fmt):
+    """
+    time_coverage_start and time_coverage_end values for daily files
+
+    :return: (starts, ends)
+    """
+    first = datetime(1980, 1, 1)
+    starts = [(first + timedelta(days=i)).strftime(fmt) for i in range(n_files)]
+    ends = [(first + timedelta(days=i, hours=23, minutes=59, seconds=59)).strftime(fmt) for i in range(n_files)]
+    return starts, ends
+
+
+def reduce_each(starts, ends):
+    """
+    The previous implementation of min_date and max_date
+    """
+    return date_to_str(min(map(str_to_date, starts))), date_to_str(max(map(str_to_date, ends)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Number of files in the aggregation. Default: %(default)s')
+    parser.add_argument('--format', choices=FORMATS, default='basic',
+                        help='Date format. Default: %(default)s')
+    args = parser.parse_args()
+
+    print(f'{"files":>8} {"per date (s)":>13} {"numpy (s)":>10} {"speed up":>9}')
+
+    for n_files in args.files:
+        starts, ends = make_dates(n_files, FORMATS[args.format])
+
+        start = time.perf_counter()
+        expected = reduce_each(starts, ends)
+        each_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = min_date(starts), max_date(ends)
+        numpy_time = time.perf_counter() - start
+
+        assert result == expected, f'{result} != {expected}'
+
+        print(f'{n_files:>8} {each_time:>13.3f} {numpy_time:>10.3f} {each_time / numpy_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# encoding: utf-8
+"""
+End-to-end benchmark of publishing and unpublishing a synthetic catalog,
+with an in-memory Elasticsearch stand-in in place of the real indices.
+
+Phases timed:
+
+- discover:  find the datasets to aggregate from the collections index
+- plan:      file statistics and state checks for all datasets
+- publish:   build the catalog records and aggregations
+- republish: a second run with nothing changed, which should only plan
+- unpublish: remove the records for a tenth of the datasets
+
+The number of requests of each type made to the stand-in are also reported.
+
+Usage:
+    python benchmarks/bench_pipeline.py --datasets 100 1000 10000
+    python benchmarks/bench_pipeline.py --datasets 1000 --state-store sqlite
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.publisher import CCIPublisher
+from cci_publisher.utils import DRSAggregation, set_es_client
+from fake_es import FakeElasticsearch
+from synthetic import SyntheticMappings, make_catalog, make_netcdf_dataset
+
+import argparse
+from configparser import ConfigParser
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+import io
+import os
+import tempfile
+import time
+
+
+def make_config(repo, state_store='elasticsearch'):
+    conf = ConfigParser()
+    conf.read_dict({
+        'elasticsearch': {
+            'files_index': 'bench-files',
+            'collections_index': 'bench-collections',
+            'state_index': 'bench-state',
+        },
+        'remote': {
+            'aggregations_dir': '/usr/local/aggregations',
+            'thredds_server': 'data.cci.ceda.ac.uk',
+        },
+        'aggregation': {
+            'metadata_cache': '',
+            'json_mappings_snapshot': '',
+        },
+        'output': {
+            'thredds_catalog_repo_path': repo,
+        },
+        'state_store': {
+            'backend': state_store,
+            'path': os.path.join(repo, 'state.sqlite'),
+        },
+    })
+    return conf
+
+
+def make_args(args):
+    """
+    Command line arguments for CCIPublisher, as from publish_aggregations.py
+    """
+    return argparse.Namespace(
+        datasets='all', wms=False, force=False, incremental=False, workers=args.workers, threads=False,
+        filename_dates=False,
+        lotus=False, executor=args.executor, array_limit=None, processes=args.processes, timeout=None,
+        skip_unpublish=False, skip_publish=False, force_unpublish=False
+    )
+
+
+@contextmanager
+def timer(timings, phase):
+    start = time.perf_counter()
+    yield
+    timings[phase] = timings.get(phase, 0) + time.perf_counter() - start
+
+
+def discover(es, conf):
+    return DRSAggregation(conf.get('elasticsearch', 'collections_index'), es=es,
+                          mappings=SyntheticMappings()).get_aggregations()
+
+
+def run(n_datasets, file_pool, args):
+    """
+    Run all the phases for a catalog of n_datasets
+
+    :return: (timings, request counts, number of catalog records removed)
+    """
+    es = FakeElasticsearch()
+    set_es_client(es)
+    timings = {}
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as repo:
+        conf = make_config(repo, args.state_store)
+
+        with timer(timings, 'generate'):
+            ids = make_catalog(es, conf, n_datasets, file_pool)
+
+        es.calls.clear()
+
+        with timer(timings, 'discover'):
+            datasets = discover(es, conf)
+
+        # The publisher prints a line per dataset and progress bars
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            publisher = CCIPublisher(make_args(args), datasets, config=conf)
+
+            get_tasks = publisher.get_tasks
+            phase = ['plan']
+
+            def timed_get_tasks():
+                with timer(timings, phase[0]):
+                    return get_tasks()
+
+            publisher.get_tasks = timed_get_tasks
+
+            with timer(timings, 'publish'):
+                publisher.publish_datasets()
+
+            phase[0] = 'replan'
+            with timer(timings, 'republish'):
+                publisher.publish_datasets()
+
+            # Withdraw a tenth of the datasets, without counting the requests
+            calls = dict(es.calls)
+            for drs in ids[::10]:
+                es.index(index=conf.get('elasticsearch', 'collections_index'), id=drs,
+                         body={'drsId': drs, 'path': '', 'is_published': False})
+            es.calls = calls
+
+            publisher.datasets = discover(es, conf)
+            with timer(timings, 'unpublish'):
+                publisher.unpublish_datasets()
+
+            catalog_dir = os.path.join(repo, 'data', 'catalog', 'datasets')
+            removed = n_datasets - len(os.listdir(catalog_dir))
+
+    set_es_client(None)
+
+    # The planning is part of each publish run
+    timings['publish'] -= timings['plan']
+    timings['republish'] -= timings['replan']
+
+    return timings, dict(es.calls), removed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Number of datasets in the catalog. Default: %(default)s')
+    parser.add_argument('--files-per-dataset', type=int, default=3,
+                        help='Files in each dataset. Default: %(default)s')
+    parser.add_argument('--executor', choices=['serial', 'local'], default='serial',
+                        help='Executor to publish with. Default: %(default)s')
+    parser.add_argument('--processes', type=int, help='Processes for the local executor')
+    parser.add_argument('--workers', type=int, default=1, help='Files to read concurrently per dataset')
+    parser.add_argument('--state-store', choices=['elasticsearch', 'sqlite'], default='elasticsearch',
+                        help='State store backend. Default: %(default)s')
+    parser.add_argument('--dir', help='Directory for the synthetic files and catalog repo. '
+                                      'Default: system temp directory')
+    args = parser.parse_args()
+
+    phases = ['generate', 'discover', 'plan', 'publish', 'replan', 'republish', 'unpublish']
+    print(f'{"datasets":>8} ' + ' '.join(f'{phase:>10}' for phase in phases) + f' {"removed":>8}  requests')
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as data_dir:
+        file_pool = make_netcdf_dataset(data_dir, args.files_per_dataset)
+
+        for n_datasets in args.datasets:
+            timings, calls, removed = run(n_datasets, file_pool, args)
+            requests = ', '.join(f'{name}={count}' for name, count in sorted(calls.items()))
+            print(f'{n_datasets:>8} ' + ' '.join(f'{timings[phase]:>10.3f}' for phase in phases) + f' {removed:>8}  {requests}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# encoding: utf-8
+"""
+Benchmark writing a large NcML aggregation with cached coordinate values,
+comparing the in-process serialiser against the previous approach of writing
+a temporary file and reformatting it with `xmllint --format`.
+
+Usage:
+    python benchmarks/bench_xml_write.py --files 1000 10000 100000 --dir /path/on/target/filesystem
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.datasets.threddsdataset import ThreddsXMLBase
+
+import argparse
+import os
+import tempfile
+import time
+import xml.etree.cElementTree as ET
+
+NCML_NS = 'http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2'
+
+
+def make_ncml(n_files):
+    """
+    Build an NcML document shaped like a daily joinExisting aggregation
+    """
+    root = ET.Element('netcdf', xmlns=NCML_NS)
+    ET.SubElement(root, 'attribute', name='id', value='esacci.TEST.day.L3C')
+    agg = ET.SubElement(root, 'aggregation', dimName='time', type='joinExisting')
+
+    for i in range(n_files):
+        ET.SubElement(agg, 'netcdf',
+                      location=f'/neodc/esacci/test/data/{i:06d}-ESACCI-L3C-TEST-v2.0.nc',
+                      ncoords='1', coordValue=str(10957.5 + i))
+    return root
+
+
+def write_xmllint(tree, filename):
+    """
+    The previous implementation of ThreddsXMLBase.write
+    """
+    tmpfile = filename + '.tmp'
+    tree.write(tmpfile, encoding='UTF-8', xml_declaration=True)
+    os.system('xmllint --format %s > %s' % (tmpfile, filename))
+    os.remove(tmpfile)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Number of files in the aggregation. Default: %(default)s')
+    parser.add_argument('--dir', help='Directory to write to. The cost of the extra temporary file '
+                                      'depends on the filesystem. Default: system temp directory')
+    args = parser.parse_args()
+
+    print(f'{"files":>8} {"xmllint (s)":>12} {"in-process (s)":>15} {"speed up":>9}')
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        out_file = os.path.join(tmpdir, 'agg.ncml')
+
+        for n_files in args.files:
+            tree = ET.ElementTree(make_ncml(n_files))
+            start = time.perf_counter()
+            write_xmllint(tree, out_file)
+            xmllint_time = time.perf_counter() - start
+
+            xml = ThreddsXMLBase()
+            xml.set_root(make_ncml(n_files))
+            start = time.perf_counter()
+            xml.write(out_file)
+            in_process_time = time.perf_counter() - start
+
+            print(f'{n_files:>8} {xmllint_time:>12.3f} {in_process_time:>15.3f} '
+                  f'{xmllint_time / in_process_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+# encoding: utf-8
+"""
+In-memory stand-in for the Elasticsearch client, so that the publishing
+pipeline can be run and measured offline.
+
+Only the calls and query features used by cci_publisher are implemented:
+
+- indices.exists/create/delete
+- index, get, delete, mget and bulk (via elasticsearch.helpers.bulk)
+- count, and search with scroll (via elasticsearch.helpers.scan)
+- term, terms and bool filter/must queries
+- composite aggregations with terms sources and sum, max and the path hash
+  scripted_metric from cci_publisher.utils.inventory as sub-aggregations
+
+Install it with cci_publisher.utils.es.set_es_client so that every component
+which calls get_es_client uses it.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.serializer import JSONSerializer
+from types import SimpleNamespace
+import copy
+import itertools
+import json
+
+MASK_64 = (1 << 64) - 1
+
+
+def java_string_hash(string):
+    """
+    Java's String.hashCode, as used by the painless path hash script
+    """
+    data = string.encode('utf-16-be')
+    h = 0
+    for i in range(0, len(data), 2):
+        h = (31 * h + int.from_bytes(data[i:i + 2], 'big')) & 0xFFFFFFFF
+    return h - (1 << 32) if h >= (1 << 31) else h
+
+
+def to_signed(value):
+    value &= MASK_64
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def path_hash(docs):
+    """
+    Python version of inventory.PATH_HASH_SCRIPT
+    """
+    total = 0
+    for doc in docs:
+        directory = get_field(doc, 'info.directory')
+        name = get_field(doc, 'info.name')
+        if directory and name:
+            h = to_signed(java_string_hash(f'{directory[0]}/{name[0]}') * -7046029254386353131)
+            total = to_signed(total + (h ^ ((h & MASK_64) >> 29)))
+    return str(total)
+
+
+def get_field(doc, field):
+    """
+    Values of a dotted field in a document, as a list. Keyword sub-fields
+    are treated as the field itself.
+
+    :param doc: Document source
+    :param field: e.g. projects.opensearch.drsId.keyword
+    :return: list of values
+    """
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+
+    values = [doc]
+    for key in field.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict) and key in value:
+                item = value[key]
+                next_values.extend(item if isinstance(item, list) else [item])
+        values = next_values
+
+    return values
+
+
+def as_term(value):
+    """
+    Terms are compared as strings, as Elasticsearch does for keywords
+    """
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def prepare(query):
+    """
+    Copy of a query with the values of terms clauses converted to sets, so
+    that they are not converted for every document
+    """
+    if isinstance(query, list):
+        return [prepare(clause) for clause in query]
+
+    if not isinstance(query, dict):
+        return query
+
+    if 'terms' in query:
+        field, values = next(iter(query['terms'].items()))
+        return {'terms': {field: frozenset(map(as_term, values))}}
+
+    return {key: prepare(value) for key, value in query.items()}
+
+
+def matches(doc, query):
+    """
+    Evaluate a query against a document
+
+    :param doc: Document source
+    :param query: Query clause
+    :return: bool
+    """
+    if not query or 'match_all' in query:
+        return True
+
+    if 'bool' in query:
+        clauses = query['bool'].get('filter', []) + query['bool'].get('must', [])
+        if isinstance(clauses, dict):
+            clauses = [clauses]
+        return all(matches(doc, clause) for clause in clauses)
+
+    if 'term' in query:
+        field, value = next(iter(query['term'].items()))
+        if isinstance(value, dict):
+            value = value['value']
+        return as_term(value) in map(as_term, get_field(doc, field))
+
+    if 'terms' in query:
+        field, values = next(iter(query['terms'].items()))
+        if not isinstance(values, frozenset):
+            values = frozenset(map(as_term, values))
+        return any(as_term(value) in values for value in get_field(doc, field))
+
+    raise NotImplementedError(f'Query not supported: {query}')
+
+
+class FakeIndices:
+
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, index, **kwargs):
+        return index in self.client.data
+
+    def create(self, index, **kwargs):
+        self.client.data.setdefault(index, {})
+        return {'acknowledged': True}
+
+    def delete(self, index, **kwargs):
+        self.client.data.pop(index, None)
+        return {'acknowledged': True}
+
+
+class FakeElasticsearch:
+    """
+    In-memory Elasticsearch client. Documents are kept in
+    data[index][id] = source.
+    """
+
+    SHARDS = {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}
+
+    def __init__(self):
+        self.data = {}
+        self.indices = FakeIndices(self)
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+
+        # Number of calls to each method, to see how chatty the pipeline is
+        self.calls = {}
+        self._scrolls = {}
+        self._ids = itertools.count()
+
+        # Inverted index of (index, field) -> term -> ids, built on first use
+        self._terms = {}
+
+    def _count_call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _index(self, index):
+        return self.data.setdefault(index, {})
+
+    def _changed(self, index):
+        for key in [key for key in self._terms if key[0] == index]:
+            del self._terms[key]
+
+    def _term_ids(self, index, field, value):
+        """
+        Ids of the documents with the given term, in the order they were
+        indexed, from the inverted index
+        """
+        key = (index, field)
+        if key not in self._terms:
+            terms = {}
+            for id, doc in self._index(index).items():
+                for term in set(map(as_term, get_field(doc, field))):
+                    terms.setdefault(term, []).append(id)
+            self._terms[key] = terms
+
+        return self._terms[key].get(as_term(value), [])
+
+    def _clause_ids(self, index, clause):
+        """
+        Ids of the documents which match a term or terms clause
+        """
+        if 'term' in clause:
+            field, value = next(iter(clause['term'].items()))
+            if isinstance(value, dict):
+                value = value['value']
+            return self._term_ids(index, field, value)
+
+        field, values = next(iter(clause['terms'].items()))
+        selected = {id for value in values for id in self._term_ids(index, field, value)}
+        return [id for id in self._index(index) if id in selected]
+
+    # Document APIs
+
+    def index(self, index, body, id=None, **kwargs):
+        self._count_call('index')
+        id = id or str(next(self._ids))
+        self._index(index)[id] = copy.deepcopy(body)
+        self._changed(index)
+        return {'_index': index, '_id': id, 'result': 'created'}
+
+    def get(self, index, id, **kwargs):
+        self._count_call('get')
+        try:
+            source = self._index(index)[id]
+        except KeyError:
+            raise NotFoundError(404, 'not_found', {'found': False})
+        return {'_index': index, '_id': id, 'found': True, '_source': copy.deepcopy(source)}
+
+    def delete(self, index, id, **kwargs):
+        self._count_call('delete')
+        try:
+            del self._index(index)[id]
+            self._changed(index)
+        except KeyError:
+            raise NotFoundError(404, 'not_found', {'result': 'not_found'})
+        return {'_index': index, '_id': id, 'result': 'deleted'}
+
+    def mget(self, body, index=None, **kwargs):
+        self._count_call('mget')
+        docs = []
+        for id in body['ids']:
+            source = self._index(index).get(id)
+            if source is None:
+                docs.append({'_index': index, '_id': id, 'found': False})
+            else:
+                docs.append({'_index': index, '_id': id, 'found': True, '_source': copy.deepcopy(source)})
+        return {'docs': docs}
+
+    def bulk(self, body, index=None, **kwargs):
+        self._count_call('bulk')
+        lines = iter(line for line in body.splitlines() if line.strip())
+        items = []
+        errors = False
+
+        for line in lines:
+            action = json.loads(line)
+            op_type, meta = next(iter(action.items()))
+            target = meta.get('_index', index)
+            id = meta.get('_id') or str(next(self._ids))
+
+            if op_type == 'delete':
+                found = self._index(target).pop(id, None) is not None
+                status = 200 if found else 404
+                errors = errors or not found
+            else:
+                self._index(target)[id] = json.loads(next(lines))
+                status = 201
+
+            items.append({op_type: {'_index': target, '_id': id, 'status': status}})
+
+        for target in {list(item.values())[0]['_index'] for item in items}:
+            self._changed(target)
+
+        return {'took': 0, 'errors': errors, 'items': items}
+
+    # Search APIs
+
+    def _search_docs(self, index, body):
+        query = prepare((body or {}).get('query'))
+        docs = self._index(index)
+        ids = docs
+
+        # Narrow down the documents with the most selective term or terms
+        # clause, so that searching for each dataset in turn is not quadratic
+        clauses = [query] if query and ('term' in query or 'terms' in query) else []
+        if query and 'bool' in query:
+            clauses = [clause for clause in query['bool'].get('filter', []) + query['bool'].get('must', [])
+                       if 'term' in clause or 'terms' in clause]
+
+        candidates = [self._clause_ids(index, clause) for clause in clauses]
+        if candidates:
+            ids = min(candidates, key=len)
+
+        return [(id, docs[id]) for id in ids if matches(docs[id], query)]
+
+    def count(self, index, body=None, **kwargs):
+        self._count_call('count')
+        return {'count': len(self._search_docs(index, body)), '_shards': self.SHARDS}
+
+    def search(self, index, body=None, scroll=None, size=None, **kwargs):
+        self._count_call('search')
+        body = body or {}
+        docs = self._search_docs(index, body)
+
+        response = {'_shards': self.SHARDS, 'hits': {'total': {'value': len(docs)}, 'hits': []}}
+
+        if 'aggs' in body:
+            response['aggregations'] = {
+                name: self._aggregate(agg, [doc for _, doc in docs]) for name, agg in body['aggs'].items()
+            }
+
+        size = body.get('size', 10) if size is None else size
+        hits = [self._hit(index, id, doc, body.get('_source')) for id, doc in (docs if scroll else docs[:size])]
+
+        if scroll:
+            scroll_id = str(next(self._ids))
+            response['_scroll_id'] = scroll_id
+            response['hits']['hits'] = hits[:size]
+            self._scrolls[scroll_id] = (hits[size:], size)
+        else:
+            response['hits']['hits'] = hits[:size]
+
+        return response
+
+    def scroll(self, body, **kwargs):
+        self._count_call('scroll')
+        scroll_id = body['scroll_id']
+        hits, size = self._scrolls[scroll_id]
+        self._scrolls[scroll_id] = (hits[size:], size)
+        return {'_scroll_id': scroll_id, '_shards': self.SHARDS, 'hits': {'hits': hits[:size]}}
+
+    def clear_scroll(self, body, **kwargs):
+        for scroll_id in body['scroll_id']:
+            self._scrolls.pop(scroll_id, None)
+        return {'succeeded': True}
+
+    @staticmethod
+    def _hit(index, id, doc, source_filter):
+        source = doc
+        if source_filter:
+            source = {}
+            for field in source_filter.get('includes', []):
+                value = get_field(doc, field)
+                if value:
+                    target = source
+                    keys = field.split('.')
+                    for key in keys[:-1]:
+                        target = target.setdefault(key, {})
+                    target[keys[-1]] = value[0]
+        return {'_index': index, '_id': id, '_source': copy.deepcopy(source)}
+
+    # Aggregations
+
+    def _aggregate(self, agg, docs):
+        if 'composite' in agg:
+            return self._composite(agg, docs)
+
+        if 'sum' in agg:
+            return {'value': float(sum(v for doc in docs for v in get_field(doc, agg['sum']['field'])))}
+
+        if 'max' in agg:
+            values = [v for doc in docs for v in get_field(doc, agg['max']['field'])]
+            return {'value': max(values) if values else None}
+
+        if 'scripted_metric' in agg:
+            return {'value': path_hash(docs)}
+
+        raise NotImplementedError(f'Aggregation not supported: {agg}')
+
+    def _composite(self, agg, docs):
+        composite = agg['composite']
+        sources = [(name, source['terms']['field'])
+                   for source_def in composite['sources'] for name, source in source_def.items()]
+
+        buckets = {}
+        for doc in docs:
+            value_lists = [get_field(doc, field) for _, field in sources]
+            for values in itertools.product(*value_lists):
+                buckets.setdefault(values, []).append(doc)
+
+        keys = sorted(buckets)
+        after = composite.get('after')
+        if after:
+            after_values = tuple(after[name] for name, _ in sources)
+            keys = [key for key in keys if key > after_values]
+
+        page = keys[:composite.get('size', 10)]
+        sub_aggs = agg.get('aggs', {})
+
+        result = {'buckets': []}
+        for key in page:
+            bucket = {'key': dict(zip((name for name, _ in sources), key)), 'doc_count': len(buckets[key])}
+            for name, sub_agg in sub_aggs.items():
+                bucket[name] = self._aggregate(sub_agg, buckets[key])
+            result['buckets'].append(bucket)
+
+        if page:
+            result['after_key'] = result['buckets'][-1]['key']
+
+        return result
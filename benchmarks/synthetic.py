@@ -0,0 +1,179 @@
+# encoding: utf-8
+"""
+Generators for synthetic data shaped like CCI products, for the benchmarks.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from datetime import datetime, timedelta
+import os
+import uuid
+
+from netCDF4 import Dataset
+import numpy as np
+
+PLATFORMS = ['NOAA-18', 'NOAA-19', 'Metop-A', 'Metop-B']
+SENSORS = ['AVHRR-2', 'AVHRR-3']
+EPOCH = datetime(1970, 1, 1)
+
+
+def netcdf_filename(day, aerosol=False):
+    """
+    CCI style filename for a daily file
+
+    :param day: datetime
+    :param aerosol: Use the aerosol naming, which has the date range first
+    :return: filename
+    """
+    if aerosol:
+        return f'{day:%Y%m%d}-{day:%Y%m%d}-ESACCI-L2P_AEROSOL-AER_PRODUCTS-AATSR_ENVISAT-SU_DAILY-v4.3.nc'
+    return f'{day:%Y%m%d}-ESACCI-L3C_CLOUD-CLD_PRODUCTS-AVHRR_NOAA-fv3.0.nc'
+
+
+def write_netcdf(path, day, aerosol=False, shape=(4, 8)):
+    """
+    Write one small file with the global attributes used by the aggregation
+
+    :param path: Output path
+    :param day: datetime of the file
+    :param aerosol: Aerosol style file with no time variable, only the
+                    time_coverage attributes
+    :param shape: (lat, lon) size of the data variable
+    """
+    n_lat, n_lon = shape
+
+    with Dataset(path, 'w') as ds:
+        ds.createDimension('lat', n_lat)
+        ds.createDimension('lon', n_lon)
+        dims = ('lat', 'lon')
+
+        if not aerosol:
+            ds.createDimension('time', None)
+            time = ds.createVariable('time', 'f8', ('time',))
+            time.units = 'days since 1970-01-01 00:00:00'
+            time.standard_name = 'time'
+            time[:] = [(day - EPOCH).days + 0.5]
+            dims = ('time',) + dims
+
+        lat = ds.createVariable('lat', 'f4', ('lat',))
+        lat[:] = np.linspace(-90, 90, n_lat)
+        lon = ds.createVariable('lon', 'f4', ('lon',))
+        lon[:] = np.linspace(-180, 180, n_lon)
+
+        data = ds.createVariable('data', 'f4', dims)
+        data[:] = np.random.random(data.shape)
+
+        ordinal = day.toordinal()
+        ds.platform = PLATFORMS[ordinal % len(PLATFORMS)]
+        ds.sensor = SENSORS[ordinal % len(SENSORS)]
+        ds.source = 'Synthetic CCI benchmark data'
+        ds.tracking_id = str(uuid.uuid4())
+        ds.creation_date = datetime.now().strftime('%Y%m%dT%H%M%SZ')
+        ds.time_coverage_start = day.strftime('%Y%m%dT%H%M%SZ')
+        ds.time_coverage_end = (day + timedelta(hours=23, minutes=59, seconds=59)).strftime('%Y%m%dT%H%M%SZ')
+        ds.geospatial_lat_min = -90.
+        ds.geospatial_lat_max = 90.
+        ds.geospatial_lon_min = -180.
+        ds.geospatial_lon_max = 180.
+
+
+def make_netcdf_dataset(directory, n_files, aerosol=False, start=datetime(1980, 1, 1)):
+    """
+    Create a dataset of daily files. Existing files are kept, so a directory
+    can be reused between runs.
+
+    :param directory: Output directory
+    :param n_files: Number of files
+    :param aerosol: Aerosol style files
+    :param start: Date of the first file
+    :return: Sorted list of paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+
+    for i in range(n_files):
+        day = start + timedelta(days=i)
+        path = os.path.join(directory, netcdf_filename(day, aerosol))
+        if not os.path.exists(path):
+            write_netcdf(path, day, aerosol)
+        paths.append(path)
+
+    return paths
+
+
+class SyntheticMappings:
+    """
+    Stand-in for the json_tagger mappings which marks every synthetic
+    dataset for aggregation
+    """
+
+    FILTERS = [{'pattern': r'esacci\.BENCH\..*', 'wms': False}]
+
+    def get_aggregations(self, path):
+        return self.FILTERS if path.startswith('/neodc/esacci/bench/') else None
+
+    def save(self):
+        pass
+
+
+def dataset_id(i):
+    """
+    DRS ID of the ith synthetic dataset
+    """
+    return f'esacci.BENCH.day.L3C.PRODUCT.multi-sensor.multi-platform.SYNTH-{i:05d}.v1-0.r1'
+
+
+def make_catalog(es, conf, n_datasets, file_pool):
+    """
+    Index the collections and files for a synthetic catalog of datasets and
+    create an empty catalog repo for the output.
+
+    Every dataset lists the files in file_pool, so that many datasets can be
+    aggregated without creating a file for each.
+
+    :param es: Elasticsearch client to index into, e.g. FakeElasticsearch
+    :param conf: ConfigParser config object with the index names and the
+                 thredds_catalog_repo_path
+    :param n_datasets: Number of datasets
+    :param file_pool: Paths of existing netCDF files
+    :return: list of DRS IDs
+    """
+    repo = conf.get('output', 'thredds_catalog_repo_path')
+    os.makedirs(os.path.join(repo, 'data', 'catalog', 'datasets'), exist_ok=True)
+    os.makedirs(os.path.join(repo, 'data', 'aggregations'), exist_ok=True)
+
+    collections_index = conf.get('elasticsearch', 'collections_index')
+    files_index = conf.get('elasticsearch', 'files_index')
+
+    files = []
+    for path in file_pool:
+        stat = os.stat(path)
+        files.append({
+            'directory': os.path.dirname(path),
+            'name': os.path.basename(path),
+            'size': stat.st_size,
+            'format': 'NetCDF',
+            'last_modified': datetime.utcfromtimestamp(stat.st_mtime).strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+
+    ids = []
+    for i in range(n_datasets):
+        drs = dataset_id(i)
+        ids.append(drs)
+
+        es.index(index=collections_index, id=drs, body={
+            'drsId': drs,
+            'path': f'/neodc/esacci/bench/{i:05d}',
+            'is_published': True,
+        })
+
+        for j, info in enumerate(files):
+            es.index(index=files_index, id=f'{drs}/{j}', body={
+                'info': info,
+                'projects': {'opensearch': {'drsId': drs}},
+            })
+
+    return ids
@@ -42,6 +42,46 @@ class CCIAerosolDatasetReader(NetcdfDatasetReader):
         ("Startdate", "Stopdate")
     )
 
+    # Precompiled fixed-width parsers for the common formats above. These
+    # give the same result as strptime without its overhead. Strings which
+    # do not match the whole pattern still go through strptime.
+    fixed_width_formats = {
+        "%Y%m%dT%H%M%SZ": re.compile(r"([0-9]{4})([0-9]{2})([0-9]{2})T([0-9]{2})([0-9]{2})([0-9]{2})Z"),
+        "%Y-%m-%dT%H:%M:%SZ": re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})T([0-9]{2}):([0-9]{2}):([0-9]{2})Z"),
+        "%Y%m%d": re.compile(r"([0-9]{4})([0-9]{2})([0-9]{2})"),
+    }
+
+    # The format which parsed the last date. Files in a dataset all use the
+    # same format, so this is tried first.
+    _last_format = None
+
+    # The start and end attributes found in the last file, tried first for
+    # the same reason
+    _last_time_attr_names = None
+
+    @classmethod
+    def parse_datetime(cls, date_str, fmt):
+        """
+        Parse a date from a string with a single format
+
+        :param date_str: Date string to parse
+        :param fmt: strptime format
+        :return: parsed date
+        :rtype: datetime
+        :raises ValueError: if the string does not match the format
+        """
+        pattern = cls.fixed_width_formats.get(fmt)
+        if pattern:
+            match = pattern.fullmatch(date_str)
+            if match:
+                try:
+                    return datetime(*map(int, match.groups()), tzinfo=timezone.utc)
+                except ValueError:
+                    # Out of range values. strptime raises the error.
+                    pass
+
+        return datetime.strptime(date_str, fmt).replace(tzinfo=timezone.utc)
+
     @classmethod
     def get_datetime(cls, date_str):
         """
@@ -53,12 +93,19 @@ class CCIAerosolDatasetReader(NetcdfDatasetReader):
         :return: parsed date
         :rtype: datetime
         """
-        for fmt in cls.time_formats:
+        formats = cls.time_formats
+        if cls._last_format:
+            formats = (cls._last_format,) + formats
+
+        for fmt in formats:
             try:
-                return (datetime.strptime(date_str, fmt)
-                        .replace(tzinfo=timezone.utc))
+                date = cls.parse_datetime(date_str, fmt)
             except ValueError:
                 continue
+
+            cls._last_format = fmt
+            return date
+
         raise ValueError("Could not parse date string '{}'".format(date_str))
 
     def get_start_end_date(self):
@@ -69,13 +116,18 @@ class CCIAerosolDatasetReader(NetcdfDatasetReader):
         :returns: start, end
         :rtype: tuple(datetime, datetime)
         """
-        for attrs in self.time_attr_names:
+        time_attr_names = self.time_attr_names
+        if self._last_time_attr_names:
+            time_attr_names = (self._last_time_attr_names,) + time_attr_names
+
+        for attrs in time_attr_names:
             try:
-                date_strs = [getattr(self.ds, attr) for attr in attrs]
+                date_strs = [self.ds.getncattr(attr) for attr in attrs]
             except AttributeError:
                 continue
 
-            return [self.get_datetime(s) for s in date_strs]
+            type(self)._last_time_attr_names = attrs
+            return [self.get_datetime(date_str) for date_str in date_strs]
 
         # GOMOS data uses days since 'modified Julian day'
         if (hasattr(self.ds, "title") and "GOMOS" in self.ds.title and
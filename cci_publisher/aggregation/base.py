@@ -1,11 +1,21 @@
+import os
+import random
 import re
-from datetime import datetime
+import sys
+from datetime import datetime, timezone
 from uuid import uuid4
 
-from netCDF4 import Dataset
+import xml.etree.cElementTree as ET
+
 import isodate
+import numpy as np
+from netCDF4 import date2num
+
+from tds_utils.aggregation import AggregationCreator, AggregatedGlobalAttr, AggregationType, CoordinatesError
 
-from tds_utils.aggregation import AggregationCreator, AggregatedGlobalAttr
+from .cache import FileMetadata, cache_namespace, cached_reader, prefetch_metadata, read_file_metadata
+from .compact import COMPACT_TYPES, RELATIVE_TOLERANCE, RegularAxis, compact_aggregation, local_name, \
+    set_regular_axis
 
 
 # Functions to convert between ISO datetime string and datetime objects
@@ -46,6 +56,131 @@ def date_to_str(dt):
     return isodate.datetime_isoformat(dt, format=ISO_DATE_FORMAT)
 
 
+# Fixed width UTC formats known to be used in CCI data, keyed by length.
+# Letters mark the digits of each field, anything else must match exactly.
+DATE_LAYOUTS = {
+    16: "YYYYMMDDThhmmssZ",
+    20: "YYYY-MM-DDThh:mm:ssZ",
+    13: "YYYYMMDDhhmmZ",
+}
+
+# Layout understood by numpy.datetime64. Missing seconds are zero.
+NUMPY_DATE_LAYOUT = "YYYY-MM-DDThh:mm:ss"
+
+# Below this many dates, numpy costs more than it saves
+VECTORISE_MIN_DATES = 64
+
+
+def _layout_columns(layout):
+    """
+    Work out how to rearrange the characters of a string in the given layout
+    into NUMPY_DATE_LAYOUT
+
+    :param layout: One of DATE_LAYOUTS
+    :return: (columns, digits, literals) where columns gives the column of
+             the input (or a character to fill in) for each output column,
+             digits the columns which must be digits and literals the
+             (column, character) which must match exactly
+    """
+    field_columns = {}
+    digits = []
+    literals = []
+
+    for i, char in enumerate(layout):
+        if char.isalpha() and char != "T" and char != "Z":
+            field_columns.setdefault(char, []).append(i)
+            digits.append(i)
+        else:
+            literals.append((i, char))
+
+    columns = []
+    seen = {}
+    for char in NUMPY_DATE_LAYOUT:
+        if char in "YMDhms":
+            n = seen.get(char, 0)
+            seen[char] = n + 1
+            field = field_columns.get(char)
+            columns.append(field[n] if field else "0")
+        else:
+            columns.append(char)
+
+    return columns, digits, literals
+
+
+DATE_LAYOUT_COLUMNS = {length: _layout_columns(layout) for length, layout in DATE_LAYOUTS.items()}
+
+
+def to_datetime64(dates):
+    """
+    Convert date strings in DATE_LAYOUTS to numpy datetime64 without parsing
+    each string in Python
+
+    :param dates: list of str
+    :return: numpy array of datetime64[s], or None if any of the strings are
+             not in one of the layouts or are not valid dates
+    """
+    if not all(isinstance(date, str) for date in dates):
+        return None
+
+    strings = np.asarray(dates, dtype=str)
+    lengths = np.char.str_len(strings)
+    normalised = np.empty((len(dates), len(NUMPY_DATE_LAYOUT)), dtype="U1")
+    matched = np.zeros(len(dates), dtype=bool)
+
+    for length, (columns, digits, literals) in DATE_LAYOUT_COLUMNS.items():
+        rows = lengths == length
+        if not rows.any():
+            continue
+
+        # One character per column
+        chars = strings[rows].astype(f"U{length}").view("U1").reshape(-1, length)
+
+        digit_chars = chars[:, digits]
+        if not ((digit_chars >= "0") & (digit_chars <= "9")).all():
+            return None
+
+        for column, char in literals:
+            if not (chars[:, column] == char).all():
+                return None
+
+        group = np.empty((chars.shape[0], len(columns)), dtype="U1")
+        for i, column in enumerate(columns):
+            group[:, i] = chars[:, column] if isinstance(column, int) else column
+
+        normalised[rows] = group
+        matched |= rows
+
+    if not matched.all():
+        return None
+
+    try:
+        return normalised.view(f"U{len(NUMPY_DATE_LAYOUT)}").ravel().astype("datetime64[s]")
+    except ValueError:
+        # e.g. month 13
+        return None
+
+
+def _reduce_dates(dates, reducer, arg_reducer):
+    """
+    Find the earliest or latest date. The comparison is done with numpy
+    where possible and the winning string is then converted as before, so
+    the result is the same as reducer(map(str_to_date, dates)).
+
+    :param dates: list of date strings
+    :param reducer: min or max
+    :param arg_reducer: numpy.argmin or numpy.argmax
+    :return: date string
+    """
+    dates = list(dates)
+
+    if len(dates) >= VECTORISE_MIN_DATES:
+        values = to_datetime64(dates)
+        if values is not None:
+            return date_to_str(str_to_date(dates[int(arg_reducer(values))]))
+
+    return date_to_str(reducer(map(str_to_date, dates)))
+
+
 def min_date(dates):
     """
     Find the earliest date from a list of iso format date strings
@@ -53,7 +188,7 @@ def min_date(dates):
     :param dates: list
     :return: earliest date in list
     """
-    return date_to_str(min(map(str_to_date, dates)))
+    return _reduce_dates(dates, min, np.argmin)
 
 
 def max_date(dates):
@@ -63,7 +198,7 @@ def max_date(dates):
     :param dates: list
     :return: latest date in list
     """
-    return date_to_str(max(map(str_to_date, dates)))
+    return _reduce_dates(dates, max, np.argmax)
 
 
 def combine_lists(lists):
@@ -89,6 +224,55 @@ def unique_strings(strings):
     return ",".join(sorted(set(filter(None, map(str.strip, strings)))))
 
 
+# Date at the start of CCI filenames, e.g. 20000101-ESACCI-... or 200001-ESACCI-...
+FILENAME_DATE = re.compile(r"^([0-9]{4})([0-9]{2})?([0-9]{2})?([0-9]{2})?([0-9]{2})?([0-9]{2})?-")
+
+
+def filename_date(filename):
+    """
+    Date at the start of a CCI filename. Missing fields are the start of the
+    period, e.g. 200001-ESACCI-... is 1st January 2000.
+
+    :param filename: Path to the file
+    :return: UTC datetime or None if the filename does not start with a date
+    """
+    match = FILENAME_DATE.match(os.path.basename(filename))
+    if not match:
+        return None
+
+    year, month, day, hour, minute, second = match.groups()
+    try:
+        return datetime(int(year), int(month or 1), int(day or 1),
+                        int(hour or 0), int(minute or 0), int(second or 0), tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+# Placeholder for the <netcdf> entries in the header of a streamed aggregation
+STREAM_ENTRIES_TAG = "__entries__"
+
+
+def distinct(values):
+    """
+    Remove repeated values, keeping the first of each. Unhashable values are
+    all kept.
+
+    :param values: list
+    :return: list
+    """
+    seen = set()
+    result = []
+    for value in values:
+        try:
+            if value in seen:
+                continue
+            seen.add(value)
+        except TypeError:
+            pass
+        result.append(value)
+    return result
+
+
 class CCIAggregationCreator(AggregationCreator):
 
     # List of (start_attr, end_attr) for possible attribute names for time
@@ -108,15 +292,299 @@ class CCIAggregationCreator(AggregationCreator):
          "southernmost_latitude", "westernmost_longitude")
     ]
 
-    def create_aggregation(self, drs, thredds_url, file_list,
-                           *args, **kwargs):
+    # Files per call to AggregationCreator.create_aggregation in write_aggregation
+    STREAM_CHUNK_SIZE = 1000
+
+    # Number of files, chosen at random, opened to check coordinate values
+    # taken from the filenames. The first and last files are always checked.
+    FILENAME_SAMPLE_SIZE = 20
+    # Write evenly spaced coordinate values as a start and increment on the
+    # coordinate variable instead of on every file
+    compact_coordinates = True
+
+    # process_root_element is skipped while the chunks of a streamed
+    # aggregation are built, and run once on the final header
+    _defer_root_processing = False
+
+    def __init__(self, dimension, metadata_cache=None, known_metadata=None,
+                 workers=1, use_threads=False):
+        """
+        :param dimension: Aggregation dimension
+        :param metadata_cache: Optional MetadataCache. When given, files are
+                               only opened if they are not in the cache.
+        :param known_metadata: Optional mapping of file path to FileMetadata
+                               for files which do not need to be opened
+        :param workers: Number of files to read concurrently
+        :param use_threads: Check the metadata cache in threads. Files are
+                            always read in processes, see prefetch_metadata.
+        """
+        super().__init__(dimension)
+
+        self.metadata_cache = metadata_cache
+        self.known_metadata = dict(known_metadata or {})
+
+        # RegularAxis for the coordinate values of the last aggregation
+        self.regular_axis = None
+
+        # Files whose coordinate values were derived, see set_coordinate_units
+        self.derived_coordinates = set()
+
+        # Attributes removed rather than aggregated, as some of the files
+        # were not opened, see use_filename_coordinates
+        self.unaggregated_attrs = set()
+        self.workers = workers
+        self.use_threads = use_threads
+
+        # Reader which actually opens the files
+        self.file_reader_cls = self.dataset_reader_cls
+
+        if metadata_cache is not None or known_metadata or workers > 1:
+            self.dataset_reader_cls = cached_reader(self.file_reader_cls, dimension,
+                                                    cache=metadata_cache,
+                                                    known_metadata=self.known_metadata)
+
+    def find_coordinate_units(self, file_list):
+        """
+        Find the units of the aggregation coordinate variable from the first
+        file where it can be read. At most FILENAME_SAMPLE_SIZE files are
+        opened, so a dataset without a readable coordinate variable is not
+        read in full just to find that out.
+
+        :param file_list: Paths to the netCDF files
+        :return: units or None if it cannot be read in any of the files tried
+        """
+        for filename in file_list[:self.FILENAME_SAMPLE_SIZE]:
+            with self.dataset_reader_cls(filename) as reader:
+                try:
+                    units, _ = reader.get_coord_values(self.dimension)
+                except CoordinatesError:
+                    continue
+            return units
+
+        return None
+
+    def set_coordinate_units(self, units):
+        """
+        Derive coordinate values, in the given units, for files where the
+        coordinate variable cannot be read, so that the values of every file
+        can be cached in the NcML. The value is the midpoint of the time
+        coverage attributes or, failing that, the date in the filename.
+
+        For joinExisting aggregations, a value is only derived when the file
+        has a single step along the dimension.
+
+        :param units: Units of the coordinate variable in the other files
+        """
+        dimension = self.dimension
+        join_existing = self.aggregation_type == AggregationType.JOIN_EXISTING
+        derive_date = self.derive_coord_date
+        derived = self.derived_coordinates
+
+        class FallbackDatasetReader(self.dataset_reader_cls):
+
+            def get_coord_values(self, dim):
+                try:
+                    return super().get_coord_values(dim)
+                except CoordinatesError as ex:
+                    if dim != dimension:
+                        raise
+                    error = ex
+
+                filename = self.ds.filepath()
+
+                if join_existing:
+                    size = len(self.ds.dimensions[dim]) if dim in self.ds.dimensions else None
+                    if size != 1:
+                        raise CoordinatesError(f"{error}, and cannot derive a value for {size} steps")
+
+                date = derive_date(self.ds)
+                if date is None:
+                    raise CoordinatesError(f"{error}, and no date in the attributes or filename")
+
+                # Dates without a timezone are UTC
+                if date.tzinfo is not None:
+                    date = date.astimezone(timezone.utc).replace(tzinfo=None)
+
+                try:
+                    value = date2num(date, units, "standard")
+                except ValueError as ex:
+                    raise CoordinatesError(f"{error}, and cannot convert date to '{units}': {ex}")
+
+                derived.add(filename)
+                return units, [value]
+
+        self.dataset_reader_cls = FallbackDatasetReader
+
+    def use_filename_coordinates(self, file_list, units, seed=None):
+        """
+        Take the coordinate value of each file from the date in its filename,
+        rather than opening the file, if the values in a random sample of the
+        files are the dates in their filenames plus the same offset (e.g. 12
+        hours for daily files with the time at midday).
+
+        The files which are not opened are given the global attributes of one
+        of the sampled files, without the attributes which are aggregated. The
+        first and last files are in the sample, so the time coverage is
+        complete, but values which only appear in files outside the sample
+        (e.g. an extra platform or a wider geospatial bound) would be missed,
+        so those attributes are removed from the aggregation instead and a
+        warning names them.
+
+        Files in known_metadata or the metadata cache already have all their
+        attributes and are left as they are. Call this before
+        set_coordinate_units.
+
+        :param file_list: Paths to the netCDF files
+        :param units: Units of the coordinate variable
+        :param seed: Seed for choosing the sample
+        :return: True if the values are taken from the filenames. If False,
+                 the files are all read as usual.
+        """
+        self.unaggregated_attrs = set()
+
+        # Cached files are not opened, so their attributes can be aggregated
+        if self.metadata_cache is not None:
+            namespace = cache_namespace(self.file_reader_cls, self.dimension)
+            for filename in file_list:
+                if filename not in self.known_metadata:
+                    metadata = self.metadata_cache.get(filename, namespace)
+                    if metadata is not None:
+                        self.known_metadata[filename] = metadata
+
+        to_derive = [f for f in file_list if f not in self.known_metadata]
+        if not to_derive:
+            return False
+
+        dates = [filename_date(f) for f in to_derive]
+        if None in dates:
+            print("Filename dates not used: some filenames do not start with a date")
+            return False
+
+        try:
+            filename_values = date2num([d.replace(tzinfo=None) for d in dates], units, "standard")
+        except ValueError as ex:
+            print(f"Filename dates not used: cannot convert to '{units}': {ex}")
+            return False
+
+        # The first and last files by date and by path, as the first by path
+        # decides which attributes are aggregated, and a random sample of the rest
+        sample = {dates.index(min(dates)), dates.index(max(dates)), to_derive.index(min(to_derive))}
+        others = [i for i in range(len(dates)) if i not in sample]
+        sample.update(random.Random(seed).sample(others, min(len(others), self.FILENAME_SAMPLE_SIZE)))
+
+        # Sampled files are read as usual and kept, so they are not read again
+        sampled = {}
+        offset = None
+        dtype = None
+        for i in sorted(sample):
+            metadata = read_file_metadata(self.dataset_reader_cls, to_derive[i], self.dimension)
+            sampled[to_derive[i]] = metadata
+
+            if metadata.coord_error or metadata.units != units or np.size(metadata.values) != 1:
+                disagrees = to_derive[i]
+                break
+
+            value = np.ravel(metadata.values)[0]
+            if offset is None:
+                offset = value - filename_values[i]
+                dtype = np.asarray(metadata.values).dtype
+
+            derived = np.asarray(filename_values[i] + offset).astype(dtype)
+            if abs(derived - value) > RELATIVE_TOLERANCE * max(1.0, abs(value)):
+                disagrees = to_derive[i]
+                break
+        else:
+            disagrees = None
+
+        self.known_metadata.update(sampled)
+
+        if self.dataset_reader_cls is self.file_reader_cls:
+            self.dataset_reader_cls = cached_reader(self.file_reader_cls, self.dimension,
+                                                    cache=self.metadata_cache,
+                                                    known_metadata=self.known_metadata)
+
+        if disagrees:
+            print(f"Filename dates not used: coordinate values in '{disagrees}' do not match its filename")
+            return False
+
+        # All the derived files share one attributes dict, without the
+        # attributes aggregated in get_aggregation_options. Those which are
+        # not complete from the sample are not aggregated at all.
+        from_sample = {"platform", "sensor", "source"}.union(*self.geospatial_bounds_formats)
+        aggregated = from_sample.union(*self.date_range_formats)
+
+        sample_attributes = next(iter(sampled.values())).attributes
+        attributes = {name: value for name, value in sample_attributes.items() if name not in aggregated}
+
+        for filename, value in zip(to_derive, filename_values):
+            if filename not in sampled:
+                values = np.asarray([value + offset]).astype(dtype)
+                self.known_metadata[filename] = FileMetadata(units, values, attributes, None)
+
+        n_derived = len(to_derive) - len(sampled)
+        print(f"Coordinate values taken from the filenames of {n_derived} files, "
+              f"checked against {len(sampled)} files")
+
+        # The time coverage is complete as the first and last files are sampled
+        if n_derived:
+            self.unaggregated_attrs = from_sample.intersection(
+                name for metadata in sampled.values() for name in metadata.attributes
+            )
+            if self.unaggregated_attrs:
+                print(f"WARNING: {', '.join(sorted(self.unaggregated_attrs))} removed from the aggregation "
+                      f"as {n_derived} files were not opened", file=sys.stderr)
+
+        return True
+
+    def derive_coord_date(self, ds):
+        """
+        Date for a file without a readable coordinate variable
+
+        :param ds: netCDF4 Dataset
+        :return: datetime or None
+        """
+        for start_attr, end_attr in self.date_range_formats:
+            if hasattr(ds, start_attr) and hasattr(ds, end_attr):
+                try:
+                    start = str_to_date(getattr(ds, start_attr))
+                    end = str_to_date(getattr(ds, end_attr))
+                except (TypeError, ValueError):
+                    continue
+                return start + (end - start) / 2
+
+        return filename_date(ds.filepath())
+
+    def prefetch(self, file_list):
+        """
+        Read the metadata for all the files which are not already known using
+        a pool of workers. The aggregation is then built from the results in
+        the original file order without opening the files again.
+
+        :param file_list: Paths to the netCDF files
+        """
+        to_read = [f for f in file_list if f not in self.known_metadata]
+
+        self.known_metadata.update(
+            prefetch_metadata(self.file_reader_cls, self.dimension, to_read, self.workers,
+                              use_threads=self.use_threads, cache=self.metadata_cache)
+        )
+
+    def get_aggregation_options(self, drs, thredds_url, first_file, **kwargs):
+        """
+        Work out the global attributes to add, aggregate and remove
+
+        :param drs: DRS ID
+        :param thredds_url: URL of the catalog, for the history attribute
+        :param first_file: Attributes present in this file decide which time
+                           coverage and geospatial bounds are aggregated
+        :return: (global_attrs, attr_aggs, remove_attrs)
+        """
         # Add extra global attributes
         global_attrs = kwargs.pop("global_attrs", {})
         global_attrs.update(self.get_global_attrs(drs, thredds_url))
 
         # Add aggregated global attributes
         attr_aggs = kwargs.pop("attr_aggs", [])
-        ds = Dataset(file_list[0])
 
         # Platform, sensor and source
         attr_aggs += [
@@ -125,24 +593,29 @@ class CCIAggregationCreator(AggregationCreator):
             AggregatedGlobalAttr(attr="source", callback=unique_strings)
         ]
 
-        # Time coverage
-        for start_attr, end_attr in self.date_range_formats:
-            if hasattr(ds, start_attr) and hasattr(ds, end_attr):
-                attr_aggs += [
-                    AggregatedGlobalAttr(attr=start_attr, callback=min_date),
-                    AggregatedGlobalAttr(attr=end_attr, callback=max_date)
-                ]
-
-        # Geospatial bounds
-        for attr_names in self.geospatial_bounds_formats:
-            if all(hasattr(ds, attr) for attr in attr_names):
-                n_attr, e_attr, s_attr, w_attr = attr_names
-                attr_aggs += [
-                    AggregatedGlobalAttr(attr=n_attr, callback=max),
-                    AggregatedGlobalAttr(attr=e_attr, callback=max),
-                    AggregatedGlobalAttr(attr=s_attr, callback=min),
-                    AggregatedGlobalAttr(attr=w_attr, callback=min)
-                ]
+        # Use the dataset reader so that the first file is served from the
+        # metadata cache, if there is one
+        with self.dataset_reader_cls(first_file) as reader:
+            ds = reader.ds
+
+            # Time coverage
+            for start_attr, end_attr in self.date_range_formats:
+                if hasattr(ds, start_attr) and hasattr(ds, end_attr):
+                    attr_aggs += [
+                        AggregatedGlobalAttr(attr=start_attr, callback=min_date),
+                        AggregatedGlobalAttr(attr=end_attr, callback=max_date)
+                    ]
+
+            # Geospatial bounds
+            for attr_names in self.geospatial_bounds_formats:
+                if all(hasattr(ds, attr) for attr in attr_names):
+                    n_attr, e_attr, s_attr, w_attr = attr_names
+                    attr_aggs += [
+                        AggregatedGlobalAttr(attr=n_attr, callback=max),
+                        AggregatedGlobalAttr(attr=e_attr, callback=max),
+                        AggregatedGlobalAttr(attr=s_attr, callback=min),
+                        AggregatedGlobalAttr(attr=w_attr, callback=min)
+                    ]
 
         # Attributes to remove
         remove_attrs = [
@@ -151,11 +624,183 @@ class CCIAggregationCreator(AggregationCreator):
             "creation_date"
         ]
 
-        return super().create_aggregation(file_list, *args,
+        # Attributes which could not be read from every file
+        if self.unaggregated_attrs:
+            attr_aggs = [attr_agg for attr_agg in attr_aggs if attr_agg.attr not in self.unaggregated_attrs]
+            remove_attrs += sorted(self.unaggregated_attrs)
+
+        return global_attrs, attr_aggs, remove_attrs
+
+    def create_aggregation(self, drs, thredds_url, file_list,
+                           *args, **kwargs):
+        if self.workers > 1:
+            self.prefetch(file_list)
+
+        global_attrs, attr_aggs, remove_attrs = self.get_aggregation_options(
+            drs, thredds_url, file_list[0],
+            global_attrs=kwargs.pop("global_attrs", {}),
+            attr_aggs=kwargs.pop("attr_aggs", [])
+        )
+
+        root = super().create_aggregation(file_list, *args,
                                           global_attrs=global_attrs,
                                           attr_aggs=attr_aggs,
                                           remove_attrs=remove_attrs, **kwargs)
 
+        # The metadata is not needed once the NcML is built. Large datasets
+        # should use write_aggregation, which only keeps a chunk at a time.
+        for filename in file_list:
+            self.known_metadata.pop(filename, None)
+
+        if self.compact_coordinates:
+            self.regular_axis = compact_aggregation(root, self.dimension)
+
+        return root
+
+    def write_aggregation(self, drs, thredds_url, file_list, writer, cache=False):
+        """
+        As create_aggregation, but the NcML is built STREAM_CHUNK_SIZE files at
+        a time and each chunk of <netcdf> entries is passed to the writer, so
+        the entries for all the files are never in memory together. The
+        header, with the attributes aggregated over all the chunks, is passed
+        to the writer at the end.
+
+        Every chunk starts with the first file, so that each one is built
+        against the same reference as a single aggregation would be. Files
+        are written in path order.
+
+        :param drs: DRS ID
+        :param thredds_url: URL of the catalog, for the history attribute
+        :param file_list: Paths to the netCDF files
+        :param writer: NcMLStreamWriter
+        :param cache: Cache the coordinate values in the NcML
+        """
+        file_list = sorted(file_list)
+        first_file = file_list[0]
+
+        global_attrs, attr_aggs, remove_attrs = self.get_aggregation_options(drs, thredds_url, first_file)
+
+        # Values to aggregate over all the files, the result for the current
+        # chunk and how each result was written in the NcML, so that the
+        # final value is written the same way
+        collected = {attr_agg.attr: [] for attr_agg in attr_aggs}
+        chunk_results = {}
+        formatted = {attr_agg.attr: {} for attr_agg in attr_aggs}
+
+        header = None
+        axis = RegularAxis(self.dimension)
+        self._defer_root_processing = True
+
+        try:
+            for start in range(0, len(file_list), self.STREAM_CHUNK_SIZE):
+                chunk = file_list[start:start + self.STREAM_CHUNK_SIZE]
+                if start:
+                    chunk = [first_file] + chunk
+
+                if self.workers > 1:
+                    self.prefetch(chunk)
+
+                root = super().create_aggregation(
+                    chunk, cache=cache,
+                    global_attrs=dict(global_attrs),
+                    attr_aggs=[AggregatedGlobalAttr(attr=attr_agg.attr,
+                                                    callback=self._collect(attr_agg, collected, chunk_results))
+                               for attr_agg in attr_aggs],
+                    remove_attrs=list(remove_attrs)
+                )
+
+                for element in root.findall("attribute"):
+                    name = element.get("name")
+                    if name in chunk_results:
+                        try:
+                            formatted[name][chunk_results.pop(name)] = element.get("value")
+                        except TypeError:
+                            pass
+                chunk_results.clear()
+
+                aggregation = next(child for child in root if local_name(child.tag) == "aggregation")
+                entries = [child for child in aggregation if local_name(child.tag) == "netcdf"]
+
+                if header is None:
+                    header = root
+                    placeholder = ET.Element(STREAM_ENTRIES_TAG)
+                    aggregation.insert(list(aggregation).index(entries[0]), placeholder)
+
+                for entry in entries:
+                    aggregation.remove(entry)
+
+                # The first file is only repeated to give the same reference
+                if start:
+                    entries = entries[1:]
+
+                for entry in entries:
+                    axis.add(entry.get("coordValue"))
+
+                writer.write_entries(entries)
+                del entries, root
+
+                # Metadata read for this chunk is not needed again
+                for filename in chunk:
+                    if filename != first_file:
+                        self.known_metadata.pop(filename, None)
+        finally:
+            self._defer_root_processing = False
+
+        self._set_aggregated_attrs(header, attr_aggs, collected, formatted)
+
+        compact = self.compact_coordinates and self.aggregation_type.value in COMPACT_TYPES and axis.compact
+        if compact:
+            set_regular_axis(header, self.dimension, axis)
+        if self.compact_coordinates:
+            self.regular_axis = axis
+
+        writer.finish(self.process_root_element(header), strip_coord_values=compact)
+
+    @staticmethod
+    def _collect(attr_agg, collected, chunk_results):
+        """
+        Wrap the callback of an AggregatedGlobalAttr to keep what is needed to
+        aggregate the attribute over all the chunks. The callbacks give the
+        same result when applied to the results for each chunk, apart from
+        unique_strings which needs the distinct values.
+        """
+        def callback(values):
+            result = attr_agg.callback(values)
+
+            if attr_agg.callback is unique_strings:
+                collected[attr_agg.attr] = distinct(collected[attr_agg.attr] + list(values))
+            else:
+                collected[attr_agg.attr].append(result)
+
+            chunk_results[attr_agg.attr] = result
+            return result
+
+        return callback
+
+    def _set_aggregated_attrs(self, header, attr_aggs, collected, formatted):
+        """
+        Replace the aggregated attributes of the first chunk with the values
+        for all the chunks
+        """
+        elements = {element.get("name"): element for element in header.findall("attribute")}
+
+        for attr_agg in attr_aggs:
+            values = collected[attr_agg.attr]
+            if not values:
+                continue
+
+            result = attr_agg.callback(values)
+            if not isinstance(result, str):
+                try:
+                    result = formatted[attr_agg.attr].get(result, str(result))
+                except TypeError:
+                    result = str(result)
+
+            if attr_agg.attr in elements:
+                elements[attr_agg.attr].set("value", result)
+            else:
+                self.add_global_attr(header, attr_agg.attr, result)
+
     @classmethod
     def get_global_attrs(cls, drs, thredds_url):
         """
@@ -189,6 +834,9 @@ class CCIAggregationCreator(AggregationCreator):
         return attrs
 
     def process_root_element(self, root):
+        if self._defer_root_processing:
+            return root
+
         # Add additional global attributes that require files to have been
         # read first
         attr_dict = {}
@@ -0,0 +1,368 @@
+# encoding: utf-8
+"""
+Persistent cache of the per-file metadata read while building aggregations.
+
+Building an aggregation opens every netCDF file in the dataset to read the
+coordinate values and the global attributes which are aggregated across the
+files. The cache stores these values keyed on the file path, size and
+modification time so that subsequent runs only open files which are new or
+have changed.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import json
+import os
+import sqlite3
+
+import numpy as np
+from netCDF4 import Dataset
+from tds_utils.aggregation import CoordinatesError
+
+# Increment when the content of FileMetadata changes to invalidate old entries
+CACHE_VERSION = 1
+
+
+class FileMetadata(namedtuple('FileMetadata', ['units', 'values', 'attributes', 'coord_error'])):
+    """
+    namedtuple to store the metadata read from a single netCDF file
+    - units       - units of the aggregation coordinate variable
+    - values      - values of the aggregation coordinate variable
+    - attributes  - dictionary of the global attributes
+    - coord_error - message if the coordinate values could not be read,
+                    otherwise None
+    """
+
+
+def cache_namespace(reader_cls, dimension):
+    """
+    Different readers can derive different coordinate values from the same
+    file, so entries are namespaced by reader class and dimension
+
+    :param reader_cls: NetcdfDatasetReader class
+    :param dimension: Aggregation dimension
+    :return: namespace
+    :rtype: str
+    """
+    return f'{reader_cls.__module__}.{reader_cls.__qualname__}:{dimension}'
+
+
+def read_file_metadata(reader_cls, filename, dimension):
+    """
+    Open a file and read the metadata needed to build an aggregation
+
+    :param reader_cls: NetcdfDatasetReader class used to open the file
+    :param filename: Path to the netCDF file
+    :param dimension: Aggregation dimension
+    :return: FileMetadata
+    """
+    with reader_cls(filename) as reader:
+        attributes = {name: reader.ds.getncattr(name) for name in reader.ds.ncattrs()}
+
+        try:
+            units, values = reader.get_coord_values(dimension)
+        except CoordinatesError as ex:
+            return FileMetadata(None, None, attributes, str(ex))
+
+    return FileMetadata(units, values, attributes, None)
+
+
+def _encode(value):
+    """
+    JSON encoder for numpy types. The dtype is kept so that values are
+    written to the NcML exactly as if they had been read from the file.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return {'__ndarray__': np.asarray(value).tolist(), 'dtype': str(value.dtype)}
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    raise TypeError(f'Cannot encode {type(value)}')
+
+
+def _decode(obj):
+    """
+    JSON object hook to reverse _encode
+    """
+    if '__ndarray__' in obj:
+        return np.array(obj['__ndarray__'], dtype=obj['dtype'])[()]
+    return obj
+
+
+class CachedDataset:
+    """
+    Stand-in for netCDF4.Dataset which serves the global attributes from the
+    cache. Anything else is delegated to the real file, which is only opened
+    if it is needed.
+    """
+
+    def __init__(self, filename, attributes, opener):
+        self._filename = filename
+        self._attributes = attributes
+        self._opener = opener
+        self._ds = None
+
+    def __getattr__(self, name):
+        attributes = self.__dict__['_attributes']
+        if name in attributes:
+            return attributes[name]
+
+        if name.startswith('_') or not hasattr(Dataset, name):
+            raise AttributeError(name)
+
+        if self._ds is None:
+            self._ds = self._opener(self._filename)
+        return getattr(self._ds, name)
+
+    def ncattrs(self):
+        return list(self._attributes)
+
+    def getncattr(self, name):
+        try:
+            return self._attributes[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def filepath(self):
+        return self._filename
+
+    def close(self):
+        if self._ds is not None:
+            self._ds.close()
+            self._ds = None
+
+
+class MetadataCache:
+    """
+    SQLite backed store of FileMetadata. The database uses write-ahead
+    logging and each entry is committed as it is written, so concurrent
+    builds sharing the cache only hold the write lock briefly.
+
+    Instance Parameters:
+
+        :arg path: Path to the SQLite database file. Created if it does not exist.
+    """
+
+    # SQLite limits the number of parameters in a statement
+    CHUNK_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS file_metadata ('
+                'path TEXT NOT NULL, '
+                'namespace TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'mtime INTEGER NOT NULL, '
+                'version INTEGER NOT NULL, '
+                'metadata TEXT NOT NULL, '
+                'PRIMARY KEY (path, namespace))'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, filename, namespace, stat=None):
+        """
+        Retrieve the metadata for a file. Returns None if there is no entry or
+        the file has changed since the entry was written.
+
+        :param filename: Path to the netCDF file
+        :param namespace: Cache namespace, see cache_namespace()
+        :param stat: os.stat result for the file, if already known
+        :return: FileMetadata | None
+        """
+        if stat is None:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return None
+
+        row = self.conn.execute(
+            'SELECT metadata FROM file_metadata '
+            'WHERE path = ? AND namespace = ? AND size = ? AND mtime = ? AND version = ?',
+            (filename, namespace, stat.st_size, stat.st_mtime_ns, CACHE_VERSION)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return FileMetadata(**json.loads(row[0], object_hook=_decode))
+
+    def put(self, filename, namespace, metadata):
+        """
+        Store the metadata for a file
+
+        :param filename: Path to the netCDF file
+        :param namespace: Cache namespace, see cache_namespace()
+        :param metadata: FileMetadata
+        """
+        stat = os.stat(filename)
+
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO file_metadata VALUES (?, ?, ?, ?, ?, ?)',
+                (filename, namespace, stat.st_size, stat.st_mtime_ns, CACHE_VERSION,
+                 json.dumps(metadata._asdict(), default=_encode))
+            )
+
+    def prune(self, prefix=None):
+        """
+        Remove the entries for files which no longer exist
+
+        :param prefix: Only check files whose path starts with this
+        :return: Number of files removed
+        """
+        if prefix:
+            cursor = self.conn.execute(
+                'SELECT DISTINCT path FROM file_metadata WHERE substr(path, 1, ?) = ?',
+                (len(prefix), prefix)
+            )
+        else:
+            cursor = self.conn.execute('SELECT DISTINCT path FROM file_metadata')
+
+        missing = [path for path, in cursor if not os.path.exists(path)]
+
+        for i in range(0, len(missing), self.CHUNK_SIZE):
+            chunk = missing[i:i + self.CHUNK_SIZE]
+            with self.conn:
+                self.conn.execute(
+                    f'DELETE FROM file_metadata WHERE path IN ({", ".join("?" * len(chunk))})',
+                    chunk
+                )
+
+        return len(missing)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def _stat(filename):
+    try:
+        return os.stat(filename)
+    except OSError:
+        return None
+
+
+def prefetch_metadata(reader_cls, dimension, file_list, workers, use_threads=False, cache=None):
+    """
+    Read the metadata for a list of files concurrently. Reading is dominated by
+    filesystem latency so several files are read at once in separate
+    processes.
+
+    The netCDF-C and HDF5 libraries are not thread safe, so files are never
+    opened in threads. use_threads only checks the cache in threads, which
+    overlaps the stat of each file.
+
+    :param reader_cls: NetcdfDatasetReader class used to open the files
+    :param dimension: Aggregation dimension
+    :param file_list: Paths to the netCDF files
+    :param workers: Number of concurrent readers
+    :param use_threads: Check the cache in threads
+    :param cache: Optional MetadataCache. Only files which are not in the
+                  cache are read and the results are added to it.
+    :return: Mapping of file path to FileMetadata
+    """
+    namespace = cache_namespace(reader_cls, dimension)
+    metadata = {}
+    to_read = []
+
+    stats = [None] * len(file_list)
+    if cache is not None and use_threads:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stats = list(executor.map(_stat, file_list))
+
+    for filename, stat in zip(file_list, stats):
+        file_metadata = cache.get(filename, namespace, stat) if cache is not None else None
+        if file_metadata is None:
+            to_read.append(filename)
+        else:
+            metadata[filename] = file_metadata
+
+    if not to_read:
+        return metadata
+
+    read = partial(read_file_metadata, reader_cls, dimension=dimension)
+
+    chunksize = max(1, len(to_read) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns results in the order of to_read
+        for filename, file_metadata in zip(to_read, executor.map(read, to_read, chunksize=chunksize)):
+            metadata[filename] = file_metadata
+            if cache is not None:
+                cache.put(filename, namespace, file_metadata)
+
+    return metadata
+
+
+def cached_reader(reader_cls, dimension, cache=None, known_metadata=None):
+    """
+    Wrap a NetcdfDatasetReader class so that files are only opened when their
+    metadata is not already known or in the cache. Metadata read from files
+    is added to the cache and to known_metadata.
+
+    :param reader_cls: NetcdfDatasetReader class to wrap
+    :param dimension: Aggregation dimension
+    :param cache: Optional MetadataCache
+    :param known_metadata: Optional mapping of file path to FileMetadata,
+                           checked before the cache
+    :return: NetcdfDatasetReader subclass
+    """
+    namespace = cache_namespace(reader_cls, dimension)
+    if known_metadata is None:
+        known_metadata = {}
+
+    class CachedDatasetReader(reader_cls):
+
+        def __init__(self, filename):
+            super().__init__(filename)
+            self._filename = filename
+            self.metadata = None
+
+        def __enter__(self):
+            self.metadata = known_metadata.get(self._filename)
+
+            if self.metadata is None and cache is not None:
+                self.metadata = cache.get(self._filename, namespace)
+
+            if self.metadata is None:
+                self.metadata = read_file_metadata(reader_cls, self._filename, dimension)
+                if cache is not None:
+                    cache.put(self._filename, namespace, self.metadata)
+
+            # Files are opened more than once while building an aggregation
+            known_metadata[self._filename] = self.metadata
+
+            self.ds = CachedDataset(self._filename, self.metadata.attributes, Dataset)
+            return self
+
+        def __exit__(self, *args):
+            self.ds.close()
+
+        def get_coord_values(self, dim):
+            if dim != dimension:
+                raise CoordinatesError(f"Coordinate values for '{dim}' are not cached")
+
+            if self.metadata.coord_error:
+                raise CoordinatesError(self.metadata.coord_error)
+
+            return self.metadata.units, self.metadata.values
+
+    return CachedDatasetReader
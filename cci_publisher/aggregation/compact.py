@@ -0,0 +1,311 @@
+# encoding: utf-8
+"""
+Compact encoding of the coordinate values cached in an NcML aggregation.
+
+Many CCI products are on a regular time axis. Rather than writing the
+coordinate values of every file in its coordValue attribute, an evenly
+spaced axis is written once as
+
+    <variable name="time">
+      <values start="10957.5" increment="1.0" />
+    </variable>
+
+in the outer <netcdf> element. The NcML schema only documents this for the
+new coordinate of a joinNew aggregation, which has one value per file, so
+only joinNew aggregations are compacted. joinExisting aggregations keep the
+coordValue and ncoords of every file, which THREDDS needs to avoid opening
+the files. Irregular axes keep the values on every file.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import re
+import xml.etree.cElementTree as ET
+
+# Largest difference between a value and start + i * increment, relative to
+# the size of the value, for the axis to count as regular
+RELATIVE_TOLERANCE = 1e-9
+
+# Aggregation types whose coordinate values can be given as a start and increment
+COMPACT_TYPES = ('joinNew',)
+
+
+def local_name(tag):
+    """
+    Strip the namespace from an ElementTree tag
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def same_namespace(element, name):
+    """
+    :param element: ElementTree element
+    :param name: Tag name without a namespace
+    :return: Tag for an element in the same namespace as the given one
+    """
+    if element.tag.startswith('{'):
+        return element.tag[:element.tag.index('}') + 1] + name
+    return name
+
+
+def split_coord_value(coord_value):
+    """
+    :param coord_value: coordValue attribute of a <netcdf> element
+    :return: list of str or None if there is no value
+    """
+    if not coord_value:
+        return None
+    return re.split(r'[,\s]+', coord_value.strip())
+
+
+def is_integer(value):
+    """
+    :param value: str
+    :return: True if the string is written as an integer
+    """
+    return re.match(r'^[+-]?\d+$', value) is not None
+
+
+def expand_values(start, increment, count):
+    """
+    Values of a regular axis, written the same way as the start and increment
+
+    :param start: str
+    :param increment: str
+    :param count: Number of values
+    :return: list of str
+    """
+    if is_integer(start) and is_integer(increment):
+        first, step = int(start), int(increment)
+    else:
+        first, step = float(start), float(increment)
+
+    return [str(first + i * step) for i in range(count)]
+
+
+class RegularAxis:
+    """
+    Check whether the coordinate values of an aggregation are evenly spaced.
+    Values are added in order, a file at a time, so the check can follow
+    the files of a streamed aggregation.
+
+    Attributes:
+        self.dimension: Name of the coordinate variable
+        self.start: First value, as written in the NcML
+        self.increment: Spacing of the values, or None until two values are seen
+        self.count: Number of values seen
+        self.regular: False once a value has not matched the spacing or a
+                      file did not have any values
+        self.explicit_bytes: Size of the coordValue attributes which the
+                             compact form replaces
+    """
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.start = None
+        self.increment = None
+        self.count = 0
+        self.regular = True
+        self.explicit_bytes = 0
+
+        self._start = None
+        self._increment = None
+        self._integer = True
+
+    def add(self, coord_value):
+        """
+        Add the values of the next file
+
+        :param coord_value: coordValue attribute of its <netcdf> element
+        """
+        values = split_coord_value(coord_value)
+        if values is None:
+            self.regular = False
+            return
+
+        self.explicit_bytes += len(' coordValue=""') + len(coord_value)
+
+        if not self.regular:
+            return
+
+        for value in values:
+            self._add(value)
+
+    def _add(self, value):
+        self._integer = self._integer and is_integer(value)
+
+        try:
+            number = float(value)
+        except ValueError:
+            self.regular = False
+            return
+
+        if self.count == 0:
+            self.start = value
+            self._start = number
+
+        elif self.count == 1:
+            self._increment = number - self._start
+            if self._increment == 0:
+                self.regular = False
+                return
+
+            if self._integer:
+                self.increment = str(int(value) - int(self.start))
+            else:
+                self.increment = str(self._increment)
+
+        else:
+            expected = self._start + self.count * self._increment
+            if abs(number - expected) > RELATIVE_TOLERANCE * max(1.0, abs(number)):
+                self.regular = False
+                return
+
+        self.count += 1
+
+    @property
+    def compact(self):
+        """
+        True if the values can be written as a start and increment, and
+        doing so makes the NcML smaller
+        """
+        return self.regular and self.count > 1 and self.saved_bytes() > 0
+
+    def values_element(self, tag='values'):
+        """
+        :param tag: Tag, if the document uses namespaces
+        :return: <values> element giving the values of the axis
+        """
+        return ET.Element(tag, start=self.start, increment=self.increment)
+
+    def saved_bytes(self):
+        """
+        :return: Approximate reduction in the size of the NcML from writing
+                 the values in the compact form, ignoring indentation
+        """
+        variable = ET.Element('variable', name=self.dimension)
+        variable.append(self.values_element())
+        return self.explicit_bytes - len(ET.tostring(variable, encoding='unicode'))
+
+
+def coordinate_variable(root, dimension):
+    """
+    Find the <variable> element for the aggregation coordinate in the outer
+    <netcdf> element, adding one in front of the <aggregation> if there is
+    not one already (joinNew aggregations define it themselves).
+
+    :param root: Root <netcdf> element
+    :param dimension: Name of the aggregation dimension
+    :return: <variable> element
+    """
+    position = len(root)
+    for i, child in enumerate(root):
+        tag = local_name(child.tag)
+        if tag == 'variable' and child.get('name') == dimension:
+            return child
+        if tag == 'aggregation':
+            position = i
+            break
+
+    variable = ET.Element(same_namespace(root, 'variable'), name=dimension)
+    root.insert(position, variable)
+    return variable
+
+
+def set_regular_axis(root, dimension, axis):
+    """
+    Write the values of a regular axis on the coordinate variable
+
+    :param root: Root <netcdf> element
+    :param dimension: Name of the aggregation dimension
+    :param axis: RegularAxis
+    """
+    variable = coordinate_variable(root, dimension)
+    variable.append(axis.values_element(same_namespace(variable, 'values')))
+
+
+def compact_aggregation(root, dimension):
+    """
+    Replace the coordValue attributes of the files in an aggregation with a
+    start and increment on the coordinate variable, if the values are
+    evenly spaced
+
+    :param root: Root <netcdf> element
+    :param dimension: Name of the aggregation dimension
+    :return: RegularAxis, without any values if the aggregation type is not
+             in COMPACT_TYPES
+    """
+    aggregations = [child for child in root if local_name(child.tag) == 'aggregation']
+
+    axis = RegularAxis(dimension)
+    if not all(aggregation.get('type') in COMPACT_TYPES for aggregation in aggregations):
+        return axis
+
+    entries = [entry for aggregation in aggregations
+               for entry in aggregation if local_name(entry.tag) == 'netcdf']
+
+    for entry in entries:
+        axis.add(entry.get('coordValue'))
+
+    if axis.compact:
+        for entry in entries:
+            del entry.attrib['coordValue']
+        set_regular_axis(root, dimension, axis)
+
+    return axis
+
+
+def regular_axis_values(root, dimension):
+    """
+    Read the start and increment written by set_regular_axis
+
+    :param root: Root <netcdf> element
+    :param dimension: Name of the aggregation dimension
+    :return: (start, increment) or None
+    """
+    for child in root:
+        if local_name(child.tag) == 'variable' and child.get('name') == dimension:
+            for values in child:
+                if local_name(values.tag) == 'values' and values.get('increment') is not None:
+                    return values.get('start'), values.get('increment')
+    return None
+
+
+def expand_aggregation(root, dimension):
+    """
+    The reverse of compact_aggregation: write the values of a regular axis
+    back on to the files
+
+    :param root: Root <netcdf> element
+    :param dimension: Name of the aggregation dimension
+    :return: True if the aggregation was in the compact form
+    """
+    regular_axis = regular_axis_values(root, dimension)
+    if regular_axis is None:
+        return False
+
+    entries = [entry for child in root if local_name(child.tag) == 'aggregation'
+               for entry in child if local_name(entry.tag) == 'netcdf']
+
+    # joinNew aggregations have one value per file
+    counts = [int(entry.get('ncoords', 1)) for entry in entries]
+    values = expand_values(*regular_axis, sum(counts))
+
+    offset = 0
+    for entry, count in zip(entries, counts):
+        entry.set('coordValue', ','.join(values[offset:offset + count]))
+        offset += count
+
+    variable = coordinate_variable(root, dimension)
+    for child in list(variable):
+        if local_name(child.tag) == 'values':
+            variable.remove(child)
+
+    # Only added for the values
+    if not len(variable) and set(variable.attrib) == {'name'}:
+        root.remove(variable)
+
+    return True
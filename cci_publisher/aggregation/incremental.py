@@ -0,0 +1,276 @@
+# encoding: utf-8
+"""
+Support for extending an NcML aggregation written by a previous run.
+
+Most CCI datasets only gain new files at the end of the time series. Rather
+than reading every file again, the coordinate values of the files which are
+already in the aggregation are taken from the existing NcML document and
+only the new files are opened.
+
+The size and modification time of each file are written next to the NcML
+when it is written (see write_file_stats), so files which have been replaced
+since are found even if they kept their original modification time.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import xml.etree.cElementTree as ET
+
+from .base import CCIAggregationCreator
+from .cache import FileMetadata
+from .compact import expand_aggregation, local_name, split_coord_value
+
+# NcML attribute types which should be converted back to numbers
+NUMERIC_TYPES = {
+    'byte': int, 'short': int, 'int': int, 'long': int,
+    'float': float, 'double': float
+}
+
+# Attributes aggregated with unique_strings in
+# CCIAggregationCreator.get_aggregation_options. The aggregated value is the
+# distinct values joined with commas, so it is split again to seed the files.
+UNIQUE_STRING_ATTRIBUTES = ('source',)
+
+# Added to the NcML path for the file holding the size and modification time
+# of each file in the aggregation
+FILE_STATS_SUFFIX = '.files'
+
+
+def file_stats_path(ncml_path):
+    """
+    :param ncml_path: Path to the NcML file
+    :return: Path to the file stats written with it
+    """
+    return ncml_path + FILE_STATS_SUFFIX
+
+
+def write_file_stats(ncml_path, file_list):
+    """
+    Record the size and modification time of the files in an aggregation,
+    one tab separated line per file. Files which cannot be read are left out,
+    so they count as changed next time.
+
+    :param ncml_path: Path to the NcML file
+    :param file_list: Paths to the netCDF files
+    """
+    path = file_stats_path(ncml_path)
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as writer:
+        for filename in file_list:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            writer.write(f'{filename}\t{stat.st_size}\t{stat.st_mtime_ns}\n')
+
+    os.replace(tmp_path, path)
+
+
+def read_file_stats(ncml_path):
+    """
+    :param ncml_path: Path to the NcML file
+    :return: Mapping of file path to (size, mtime in ns). Empty if the stats
+             were not written.
+    """
+    stats = {}
+
+    try:
+        with open(file_stats_path(ncml_path)) as reader:
+            for line in reader:
+                try:
+                    filename, size, mtime = line.rstrip('\n').rsplit('\t', 2)
+                    stats[filename] = int(size), int(mtime)
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+
+    return stats
+
+
+class ExistingAggregation:
+    """
+    The parts of a previously generated NcML aggregation which can be reused
+
+    Attributes:
+        self.path: Path to the NcML file
+        self.attributes: Aggregated global attributes
+        self.coord_values: Mapping of file location to list of coordinate
+                           values. Values are kept as strings so that they are
+                           written back to the NcML unchanged.
+
+    Instance Parameters:
+
+        :arg path: Path to the existing NcML file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.attributes = {}
+        self.coord_values = {}
+
+        self._parse()
+
+    def _parse(self):
+        root = ET.parse(self.path).getroot()
+
+        for child in list(root):
+            tag = local_name(child.tag)
+
+            if tag == 'attribute':
+                self.attributes[child.get('name')] = self._attribute_value(child)
+
+            elif tag == 'aggregation':
+                # Coordinate values may be written once for a regular axis
+                expand_aggregation(root, child.get('dimName'))
+
+                for netcdf in child:
+                    if local_name(netcdf.tag) != 'netcdf':
+                        continue
+
+                    self.coord_values[netcdf.get('location')] = split_coord_value(netcdf.get('coordValue'))
+
+    @staticmethod
+    def _attribute_value(element):
+        """
+        Attribute values in the NcML are strings. Convert the geospatial bounds
+        back to numbers so that they compare with the values read from new files.
+        """
+        value = element.get('value')
+        convert = NUMERIC_TYPES.get(element.get('type'))
+
+        if convert is None and any(element.get('name') in names
+                                   for names in CCIAggregationCreator.geospatial_bounds_formats):
+            convert = float
+
+        if convert is not None:
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+
+        return value
+
+    def covers(self, file_list):
+        """
+        The existing aggregation can only be extended if none of its files
+        have been removed, otherwise the aggregated attributes may include
+        values from files which are no longer in the dataset.
+
+        :param file_list: Current list of files in the dataset
+        :return: bool
+        """
+        return set(self.coord_values).issubset(file_list)
+
+    def changed_files(self):
+        """
+        Files in the existing aggregation whose size or modification time
+        differ from those recorded when the NcML was written, or which have
+        no record or can no longer be read. The coordinate values and
+        attributes in the NcML may be out of date for these files.
+
+        The modification time of the NcML itself is not used, as the catalog
+        repository is cloned afresh for each run.
+
+        :return: list of file locations
+        """
+        recorded = read_file_stats(self.path)
+
+        changed = []
+        for location in self.coord_values:
+            try:
+                stat = os.stat(location)
+            except OSError:
+                changed.append(location)
+                continue
+
+            if recorded.get(location) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(location)
+
+        return changed
+
+    def seed_attributes(self):
+        """
+        Global attributes to present for each of the existing files. The
+        aggregation callbacks give the same result when the aggregated value is
+        fed back in, so these combine correctly with the values from new files.
+        The exception is unique_strings, see file_metadata.
+
+        :return: dict
+        """
+        attributes = dict(self.attributes)
+
+        # Derived in process_root_element, not read from the files
+        attributes.pop('time_coverage_duration', None)
+
+        # time_coverage_{start,end} are added in process_root_element when the
+        # files use different attribute names. Keeping them would stop them
+        # being updated from the new files.
+        start, end = CCIAggregationCreator.date_range_formats[0]
+        if any(s in attributes and e in attributes
+               for s, e in CCIAggregationCreator.date_range_formats[1:]):
+            attributes.pop(start, None)
+            attributes.pop(end, None)
+
+        return attributes
+
+    def file_metadata(self, units):
+        """
+        Build FileMetadata for each of the files in the existing aggregation
+
+        :param units: Units of the aggregation coordinate variable
+        :return: Mapping of file location to FileMetadata
+        """
+        attributes = self.seed_attributes()
+
+        # unique_strings would treat 'src A,src B' as a single value, so the
+        # items are shared out between the files instead
+        split = {}
+        for name in UNIQUE_STRING_ATTRIBUTES:
+            if isinstance(attributes.get(name), str):
+                split[name] = spread_items(attributes[name], len(self.coord_values))
+
+        # Files with the same items share one attributes dict
+        shared = {}
+
+        metadata = {}
+        for i, (location, values) in enumerate(self.coord_values.items()):
+            file_attributes = attributes
+            if split:
+                key = tuple(items[i] for items in split.values())
+                if key not in shared:
+                    shared[key] = dict(attributes)
+                    shared[key].update(zip(split, key))
+                file_attributes = shared[key]
+
+            if values is None:
+                metadata[location] = FileMetadata(None, None, file_attributes,
+                                                  'Coordinate values not cached in existing aggregation')
+            else:
+                metadata[location] = FileMetadata(units, values, file_attributes, None)
+
+        return metadata
+
+
+def spread_items(value, count):
+    """
+    Share out the items of a comma-separated string between a number of
+    files, so that every item is present in at least one of them
+    e.g. ("one,two", 3) -> ["one", "two", "one"]
+
+    :param value: Comma-separated string
+    :param count: Number of files
+    :return: list of str, one for each file
+    """
+    items = [item.strip() for item in value.split(',') if item.strip()] or [value]
+
+    if len(items) <= count:
+        return [items[i % len(items)] for i in range(count)]
+
+    # More items than files
+    return [','.join(items[i::count]) for i in range(count)]
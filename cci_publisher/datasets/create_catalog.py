@@ -10,6 +10,7 @@ __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 from tds_utils.create_catalog import CatalogBuilder, AccessMethod, DatasetRoot, AvailableServices, Aggregation, get_catalog_name, CatalogRef
 from collections import namedtuple
+from functools import lru_cache
 import os
 from jinja2 import Environment, PackageLoader
 
@@ -62,9 +63,10 @@ class CCICatalogBuilder(CatalogBuilder):
 
         return dataset
 
-    def dataset_catalog(self, ds_id, opendap=False):
+    def dataset_catalog(self, ds_id, opendap=False, aggregated=False, aggregation=None, wms=False, wcs=False):
         """
-        Build a THREDDS catalog and return the XML as a string
+        Build a THREDDS catalog and return the XML as a string. The whole
+        record, including the aggregation, is rendered in one pass.
 
         :param ds_id: DRS ID
         :type ds_id: str
@@ -72,21 +74,40 @@ class CCICatalogBuilder(CatalogBuilder):
         :param opendap: Whether or not the service is available via opendap
         :type opendap: bool
 
+        :param aggregated: Whether an aggregation was requested. Adds the
+                           metadata used by the aggregated datasets.
+        :type aggregated: bool
+
+        :param aggregation: How to link to the NcML aggregation
+        :type aggregation: CatalogAggregation
+
+        :param wms: Add the WMS service
+        :type wms: bool
+
+        :param wcs: Add the WCS service
+        :type wcs: bool
+
         :return: XML string
         :rtype: string
         """
         # Work out which services are required
         file_services = {AvailableServices.HTTP.value}
-        aggregation = None
 
         if opendap:
             file_services.add(AvailableServices.OPENDAP.value)
 
-        all_services = file_services.copy()
+        # Sorted so that the records do not change between runs
+        all_services = sorted(file_services, key=lambda service: service.name)
+
+        if wms:
+            all_services.insert(0, AvailableServices.WMS.value)
+            if wcs:
+                all_services.insert(0, AvailableServices.WCS.value)
 
         context = {
             "services": all_services,
             "dataset_id": ds_id,
+            "aggregated": aggregated,
             "aggregation": aggregation,
         }
 
@@ -119,4 +140,13 @@ class CCICatalogBuilder(CatalogBuilder):
             catalogs.append(CatalogRef(name=cat_name, title=cat_name,
                                        href=href))
 
-        return self.render("root_catalog.xml", name=name, catalogs=catalogs)
\ No newline at end of file
+        return self.render("root_catalog.xml", name=name, catalogs=catalogs)
+
+
+@lru_cache(maxsize=None)
+def get_catalog_builder():
+    """
+    Return a CCICatalogBuilder shared by all datasets so the template
+    environment is only set up once per process
+    """
+    return CCICatalogBuilder()
@@ -9,12 +9,16 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 import os
+import re
 import sys
+import tempfile
 from collections import namedtuple
 import xml.etree.cElementTree as ET
 from cached_property import cached_property
-from cci_publisher.aggregation.base import CCIAggregationCreator
+from cci_publisher.aggregation.base import CCIAggregationCreator, STREAM_ENTRIES_TAG
 from cci_publisher.aggregation.aerosol import CCIAerosolAggregationCreator
+from cci_publisher.aggregation.cache import MetadataCache
+from cci_publisher.aggregation.incremental import ExistingAggregation, write_file_stats
 from tds_utils.partition_files import partition_files
 from tds_utils.aggregation import AggregationError, CoordinatesError
 
@@ -39,17 +43,56 @@ def get_thredds_url(host, in_file):
     return "https://{host}/thredds/esacci/{path}.html".format(host=host, path=path)
 
 
+def indent(element, level=0, space="  "):
+    """
+    Indent an element tree in place so that it serialises with one element
+    per line, as `xmllint --format` would. Whitespace-only text is replaced.
+
+    :param element: Root ElementTree element
+    :param level: Depth of element in the tree
+    :param space: Indentation per level
+    """
+    children = list(element)
+    if not children:
+        return
+
+    child_indent = "\n" + space * (level + 1)
+    if not element.text or not element.text.strip():
+        element.text = child_indent
+
+    for child in children:
+        indent(child, level + 1, space)
+        if not child.tail or not child.tail.strip():
+            child.tail = child_indent
+
+    # The last child is followed by the closing tag of the parent
+    if not children[-1].tail.strip():
+        children[-1].tail = "\n" + space * level
+
+
 class AggregationInfo(namedtuple("AggregationInfo", ["xml_element", "basename",
                                                      "sub_dir"])):
     """
     namedtuple to store information about an NcML aggregation
-    - xml_element - instance of ThreddsXMLBase for the NcML document
+    - xml_element - instance of ThreddsXMLBase for the NcML document, or
+                    None if it was streamed to disk as it was built
     - basename    - basename of the to-be-created NcML file
     - sub_dir     - subdirectory of the root aggregations dir in which the
                     NcML file should be created
     """
 
 
+class CatalogAggregation(namedtuple("CatalogAggregation", ["url_path", "ncml_path",
+                                                           "services", "wms_viewer"])):
+    """
+    namedtuple to store how an NcML aggregation is linked from a catalog
+    - url_path   - urlPath of the aggregated dataset
+    - ncml_path  - location of the NcML file on the server
+    - services   - names of the services the aggregation is accessed with
+    - wms_viewer - whether to add the WMS viewer property
+    """
+
+
 class ThreddsXMLBase(object):
     """
     Base class re generic stuff we want to do to THREDDS XML files
@@ -80,10 +123,12 @@ class ThreddsXMLBase(object):
         self.root.set("xmlns:xlink", self.xlink)
 
     def write(self, filename):
-        tmpfile = filename + ".tmp"
-        self.tree.write(tmpfile, encoding=self.encoding, xml_declaration=True)
-        os.system("xmllint --format %s > %s" % (tmpfile, filename))
-        os.remove(tmpfile)
+        indent(self.root)
+
+        with open(filename, "wb") as writer:
+            writer.write('<?xml version="1.0" encoding="{}"?>\n'.format(self.encoding).encode(self.encoding))
+            self.tree.write(writer, encoding=self.encoding, xml_declaration=False)
+            writer.write(b"\n")
 
     def tag_full_name(self, tag_base_name):
         return "{%s}%s" % (self.ns, tag_base_name)
@@ -99,7 +144,7 @@ class ThreddsXMLBase(object):
         Add a child element, if possible putting it before another child with the same tag
         """
         new_tag = self.tag_base_name(new_child.tag)
-        for i, child in enumerate(parent.getchildren()):
+        for i, child in enumerate(parent):
             if not self.tag_base_name_is(child, new_tag):
                 parent.insert(i, new_child)
                 break
@@ -126,6 +171,82 @@ class ThreddsXMLBase(object):
         return child
 
 
+class NcMLStreamWriter(ThreddsXMLBase):
+    """
+    Writes an NcML aggregation built with CCIAggregationCreator.write_aggregation
+    without holding the whole document in memory. The <netcdf> entries are
+    serialised as each chunk is built and kept in a temporary file until the
+    header is known. The output is the same as ThreddsXMLBase.write would give
+    for the complete document.
+    """
+
+    # Indentation of the entries, which are children of <aggregation>
+    ENTRY_LEVEL = 2
+
+    COORD_VALUE_PATTERN = re.compile(r' coordValue="[^"]*"')
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(**kwargs)
+        self.filename = filename
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+
+        self._entries = tempfile.NamedTemporaryFile("w+", encoding=self.encoding, dir=directory,
+                                                    prefix=".entries-", suffix=".tmp")
+        self._separator = "\n" + "  " * self.ENTRY_LEVEL
+        self._first_entry = True
+
+    def write_entries(self, entries):
+        """
+        :param entries: <netcdf> elements, in order
+        """
+        for entry in entries:
+            indent(entry, level=self.ENTRY_LEVEL)
+            entry.tail = None
+
+            if not self._first_entry:
+                self._entries.write(self._separator)
+            self._entries.write(ET.tostring(entry, encoding="unicode"))
+            self._first_entry = False
+
+    def finish(self, root, strip_coord_values=False):
+        """
+        Write the document and move it into place
+
+        :param root: Root element, with a STREAM_ENTRIES_TAG element where the
+                     entries go
+        :param strip_coord_values: Remove the coordValue attributes from the
+                                   entries, when the values are given on the
+                                   coordinate variable instead
+        """
+        self.set_root(root)
+        indent(self.root)
+
+        document = ET.tostring(self.root, encoding="unicode")
+        head, tail = document.split("<{} />".format(STREAM_ENTRIES_TAG))
+
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w", encoding=self.encoding) as writer:
+            writer.write('<?xml version="1.0" encoding="{}"?>\n'.format(self.encoding))
+            writer.write(head)
+
+            self._entries.seek(0)
+            for line in self._entries:
+                if strip_coord_values:
+                    line = self.COORD_VALUE_PATTERN.sub("", line)
+                writer.write(line)
+
+            writer.write(tail)
+            writer.write("\n")
+
+        self.close()
+        os.replace(tmp_filename, self.filename)
+
+    def close(self):
+        self._entries.close()
+
+
 class ThreddsXMLDataset(ThreddsXMLBase):
     """
     A class for processing THREDDS XML files and tweaking them to add WMS tags
@@ -133,10 +254,30 @@ class ThreddsXMLDataset(ThreddsXMLBase):
     """
 
     def __init__(self, aggregations_dir, thredds_server,
-                 do_wcs=False, netcdf_files=[], **kwargs):
+                 do_wcs=False, netcdf_files=[], metadata_cache=None,
+                 existing_aggregations_dir=None, workers=1, use_threads=False,
+                 dataset_id=None, catalog_path=None, filename_dates=False, **kwargs):
         """
         aggregations_dir is the directory in which NcML files will be placed on the
         server (used to reference aggregations from the THREDDS catalog)
+
+        metadata_cache is an optional path to a MetadataCache database used to
+        avoid re-reading files which have not changed since the last run
+
+        existing_aggregations_dir is an optional local directory containing the
+        aggregations from the last run. If given, an existing aggregation is
+        extended with any new files rather than being rebuilt from scratch
+
+        workers is the number of files to read concurrently, in separate
+        processes, when building the aggregation. If use_threads is set the
+        metadata cache is checked in threads.
+
+        dataset_id and catalog_path allow the aggregation to be built with
+        build_aggregation without reading an existing catalog
+
+        filename_dates takes the coordinate values from the dates in the
+        filenames, if they match the values in a sample of the files, so that
+        the other files do not need to be opened
         """
         super().__init__(**kwargs)
         self.do_wcs = do_wcs
@@ -144,16 +285,26 @@ class ThreddsXMLDataset(ThreddsXMLBase):
         self.thredds_server = thredds_server
         self.aggregation = None
         self.netcdf_files = netcdf_files
+        self.metadata_cache = metadata_cache
+        self.existing_aggregations_dir = existing_aggregations_dir
+        self.workers = workers
+        self.use_threads = use_threads
+        self.filename_dates = filename_dates
+
+        if dataset_id:
+            self.dataset_id = dataset_id
+        if catalog_path:
+            self.in_filename = catalog_path
 
     @cached_property
     def top_level_dataset(self):
-        for child in self.root.getchildren():
+        for child in self.root:
             if self.tag_base_name_is(child, "dataset"):
                 return child
 
     @cached_property
     def second_level_datasets(self):
-        return [child for child in self.top_level_dataset.getchildren()
+        return [child for child in self.top_level_dataset
                 if self.tag_base_name_is(child, "dataset")]
 
     @cached_property
@@ -200,14 +351,21 @@ class ThreddsXMLDataset(ThreddsXMLBase):
         Write this catalog to 'filename', and save the aggregation in 'agg_dir'
         """
         super().write(filename)
+        self.write_aggregation(agg_dir)
 
-        if self.aggregation:
+    def write_aggregation(self, agg_dir):
+        """
+        Save the aggregation, if there is one, in 'agg_dir'
+        """
+        if self.aggregation and self.aggregation.xml_element is not None:
             agg = self.aggregation
             abs_subdir = os.path.join(agg_dir, agg.sub_dir)
             if not os.path.isdir(abs_subdir):
                 os.makedirs(abs_subdir)
 
-            agg.xml_element.write(os.path.join(abs_subdir, agg.basename))
+            agg_path = os.path.join(abs_subdir, agg.basename)
+            agg.xml_element.write(agg_path)
+            write_file_stats(agg_path, self.netcdf_files)
 
     def strip_restrict_access(self):
         """
@@ -218,7 +376,7 @@ class ThreddsXMLDataset(ThreddsXMLBase):
         if att_name in att_dict:
             del att_dict[att_name]
 
-    def get_aggregation_creator_cls(self, agg_dim):
+    def get_aggregation_creator_cls(self, agg_dim, **kwargs):
         """
         Return a subclass of CCIAggregationCreator used to create the NcML
         aggregation
@@ -228,7 +386,45 @@ class ThreddsXMLDataset(ThreddsXMLBase):
         else:
             creator = CCIAggregationCreator
 
-        return creator(agg_dim)
+        return creator(agg_dim, **kwargs)
+
+    def get_existing_metadata(self, agg_dim, agg_path):
+        """
+        Read the metadata for files which are already in the aggregation at
+        agg_path, so that they do not need to be opened again.
+
+        :param agg_dim: Aggregation dimension
+        :param agg_path: Path to the existing NcML file
+        :return: Mapping of file path to FileMetadata or None if the existing
+                 aggregation cannot be extended
+        """
+        if not os.path.exists(agg_path):
+            return None
+
+        existing = ExistingAggregation(agg_path)
+        if not existing.covers(self.netcdf_files):
+            print("Files have been removed from the dataset, rebuilding aggregation")
+            return None
+
+        changed = existing.changed_files()
+        if changed:
+            print(f"{len(changed)} files have changed or have no record from when the aggregation was written, "
+                  f"rebuilding aggregation")
+            return None
+
+        new_files = [f for f in self.netcdf_files if f not in existing.coord_values]
+        print(f"Extending existing aggregation with {len(new_files)} new files")
+
+        # Coordinate units are not stored per file in the NcML so are taken
+        # from one of the files which has to be opened anyway
+        reader_cls = self.get_aggregation_creator_cls(agg_dim).dataset_reader_cls
+        with reader_cls(new_files[0] if new_files else self.netcdf_files[0]) as reader:
+            try:
+                units, _ = reader.get_coord_values(agg_dim)
+            except CoordinatesError:
+                return None
+
+        return existing.file_metadata(units)
 
     def add_aggregation(self, add_wms=False):
         """
@@ -237,6 +433,53 @@ class ThreddsXMLDataset(ThreddsXMLBase):
 
         The NcML document and related info is saved in self.aggregation
         """
+        catalog_aggregation = self.build_aggregation(add_wms)
+        if catalog_aggregation is None:
+            return
+
+        ds = self.new_element("dataset", name=self.dataset_id, ID=self.dataset_id,
+                              urlPath=catalog_aggregation.url_path)
+
+        for service_name in catalog_aggregation.services:
+            # Add 'access' to new dataset so that it has the required
+            # endpoints in THREDDS
+            ds.append(self.new_element("access", serviceName=service_name,
+                                       urlPath=catalog_aggregation.url_path))
+            # Add 'access' to the top-level dataset so that the esgf
+            # publisher picks up the WMS endpoints when publishing to Solr
+            self.top_level_dataset.append(self.new_element("access", serviceName=service_name,
+                                                           urlPath=catalog_aggregation.url_path))
+
+        # Create a 'netcdf' element in the catalog that points to the file containing the
+        # aggregation
+        self.new_child(ds, "netcdf", location=catalog_aggregation.ncml_path,
+                       xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2")
+
+        if catalog_aggregation.wms_viewer:
+            self.insert_wms_viewer(ds)
+
+        self.top_level_dataset.append(ds)
+
+    def build_aggregation(self, add_wms=False, agg_dir=None):
+        """
+        Create an NcML aggregation from netCDF files in this dataset, without
+        changing the catalog. The NcML document and related info is saved in
+        self.aggregation.
+
+        :param add_wms: Whether the aggregation is also accessed with WMS (and WCS)
+        :param agg_dir: If given, the NcML is streamed to its place in this
+                        directory as it is built rather than being held in
+                        memory until write_aggregation
+        :return: CatalogAggregation describing how to link to the aggregation
+                 from the catalog, or None if it could not be created
+        """
+        if self.metadata_cache:
+            with MetadataCache(self.metadata_cache) as cache:
+                return self._build_aggregation(add_wms, agg_dir, cache)
+
+        return self._build_aggregation(add_wms, agg_dir)
+
+    def _build_aggregation(self, add_wms, agg_dir=None, metadata_cache=None):
         # Get directory to store aggregation in by splitting file name into
         # its facets and having a subdirectory for each component.
         components = os.path.basename(self.in_filename).split(".")
@@ -264,18 +507,32 @@ class ThreddsXMLDataset(ThreddsXMLBase):
             print(msg, file=sys.stderr)
 
         agg_dim = "time"
-        creator = self.get_aggregation_creator_cls(agg_dim)
-        # Open the first file to see if aggregation dimension is also a
-        # variable -- if so then its values can be cached in the ncml
-        cache = True
-        with creator.dataset_reader_cls(self.netcdf_files[0]) as reader:
-            try:
-                reader.get_coord_values(agg_dim)
-            except CoordinatesError:
-                cache = False
-                print("WARNING: Skipping coordinate value caching: variable "
-                      "'{}' could not be read in first file".format(agg_dim),
-                      file=sys.stderr)
+        agg_basename = f"{self.dataset_id}.ncml"
+
+        known_metadata = None
+        if self.existing_aggregations_dir:
+            known_metadata = self.get_existing_metadata(
+                agg_dim, os.path.join(self.existing_aggregations_dir, sub_dir, agg_basename)
+            )
+
+        creator = self.get_aggregation_creator_cls(agg_dim, metadata_cache=metadata_cache,
+                                                   known_metadata=known_metadata,
+                                                   workers=self.workers,
+                                                   use_threads=self.use_threads)
+        # Find a file where the aggregation dimension is also a variable --
+        # if there is one then its values can be cached in the ncml. Values
+        # are derived for any files where the variable cannot be read, so
+        # that THREDDS does not need to open the files.
+        units = creator.find_coordinate_units(self.netcdf_files)
+        cache = units is not None
+        if cache:
+            if self.filename_dates:
+                creator.use_filename_coordinates(self.netcdf_files, units)
+            creator.set_coordinate_units(units)
+        else:
+            print("WARNING: Skipping coordinate value caching: variable "
+                  "'{}' could not be read in the first {} files".format(agg_dim, creator.FILENAME_SAMPLE_SIZE),
+                  file=sys.stderr)
 
         # Construct URL to THREDDS catalog on remote server (even though the
         # catalog does not yet exist on the remote server!)
@@ -286,41 +543,40 @@ class ThreddsXMLDataset(ThreddsXMLBase):
             thredds_url = self.thredds_server
 
         try:
-            agg_element = creator.create_aggregation(self.dataset_id, thredds_url, self.netcdf_files, cache=cache)
+            if agg_dir:
+                agg_xml = None
+                agg_path = os.path.join(agg_dir, sub_dir, agg_basename)
+                writer = NcMLStreamWriter(agg_path)
+                try:
+                    creator.write_aggregation(self.dataset_id, thredds_url, self.netcdf_files, writer, cache=cache)
+                finally:
+                    writer.close()
+                write_file_stats(agg_path, self.netcdf_files)
+            else:
+                agg_element = creator.create_aggregation(self.dataset_id, thredds_url, self.netcdf_files, cache=cache)
+                agg_xml = ThreddsXMLBase()
+                agg_xml.set_root(agg_element)
         except AggregationError:
             print("WARNING: Failed to create aggregation", file=sys.stderr)
-            return
+            return None
 
-        ds = self.new_element("dataset", name=self.dataset_id, ID=self.dataset_id, urlPath=self.dataset_id)
+        if creator.derived_coordinates:
+            print(f"WARNING: Coordinate values derived from the time coverage or filename "
+                  f"for {len(creator.derived_coordinates)} files", file=sys.stderr)
 
-        for service_name in services:
-            access = self.new_element("access", serviceName=service_name,
-                                      urlPath=self.dataset_id)
-            # Add 'access' to new dataset so that it has the required
-            # endpoints in THREDDS
-            ds.append(access)
-            # Add 'access' to the top-level dataset so that the esgf
-            # publisher picks up the WMS endpoints when publishing to Solr
-            self.top_level_dataset.append(access)
-
-        agg_xml = ThreddsXMLBase()
-        agg_xml.set_root(agg_element)
+        axis = creator.regular_axis
+        if axis is not None and axis.compact:
+            print(f"Regular time axis of {axis.count} values from {axis.start} by {axis.increment}: "
+                  f"NcML is about {axis.saved_bytes()} bytes smaller than with values for every file")
 
-        agg_basename = f"{self.dataset_id}.ncml"
         self.aggregation = AggregationInfo(xml_element=agg_xml,
                                            basename=agg_basename,
                                            sub_dir=sub_dir)
 
-        # Create a 'netcdf' element in the catalog that points to the file containing the
-        # aggregation
-        agg_full_path = os.path.join(self.aggregations_dir, sub_dir, agg_basename)
-        self.new_child(ds, "netcdf", location=agg_full_path,
-                       xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2")
-
-        if add_wms:
-            self.insert_wms_viewer(ds)
-
-        self.top_level_dataset.append(ds)
+        return CatalogAggregation(url_path=self.dataset_id,
+                                  ncml_path=os.path.join(self.aggregations_dir, sub_dir, agg_basename),
+                                  services=services,
+                                  wms_viewer=add_wms)
 
     def all_changes(self, create_aggs=False, add_wms=False):
         self.strip_restrict_access()
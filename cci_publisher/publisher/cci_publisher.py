@@ -8,14 +8,18 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from cci_publisher.utils import DRSAggregation, write_catalog, get_all_catalog_files, get_state_store
+from cci_publisher.utils import DRSAggregation, write_catalog, get_all_catalog_files, get_state_store, get_es_client
+from cci_publisher.utils import DatasetInventory, EMPTY_STATS, get_mappings_snapshot
+from cci_publisher.state_store import SQLiteStateStore
 from .drs_dataset import DRSDataset
+from .cost import CostModel
+from .executors import SerialExecutor, LocalProcessExecutor, SlurmExecutor
+from .tasks import PublishTask
 
 from configparser import ConfigParser
 from tqdm import tqdm
-import importlib.util
-import subprocess
 import os
+import sys
 
 
 class CCIPublisher:
@@ -28,6 +32,7 @@ class CCIPublisher:
         self.datasets: List of datasets to process
         self.conf: Parsed config object
         self.state: StateStore object for interfacing with the state store
+        self.cost_model: CostModel to order and size the jobs
 
     Instance Parameters:
 
@@ -37,6 +42,13 @@ class CCIPublisher:
 
     """
 
+    # Number of state changes to collect before writing them to the state store
+    STATE_UPDATE_BATCH = 500
+
+    # Unpublishing is refused if fewer datasets than this fraction of those
+    # on disk are found, as the dataset list is probably incomplete
+    MIN_UNPUBLISH_FRACTION = 0.5
+
     def __init__(self, args, datasets, config=None):
         self.args = args
 
@@ -47,6 +59,7 @@ class CCIPublisher:
             self._parse_config()
 
         self.state = get_state_store(self.conf)
+        self.cost_model = CostModel.from_config(self.conf)
 
         print(f'Total Datasets to process: {len(self.datasets)}')
 
@@ -57,34 +70,116 @@ class CCIPublisher:
         self.conf = ConfigParser()
         self.conf.read(self.args.config)
 
-    def publish_datasets(self):
-        """
-        Generate the THREDDS catalog files for the published CCI datasets
+    def get_inventory(self, dataset_ids):
         """
+        Get the file statistics for the given datasets from the files index
 
-        for dataset in tqdm(self.datasets, desc='Generating catalog records'):
-
-            if self.args.lotus:
+        :param dataset_ids: DRS IDs
+        :return: Mapping of DRS ID to DatasetStats
+        """
+        inventory = DatasetInventory(self.conf.get('elasticsearch', 'files_index'), es=get_es_client(self.conf))
+        return inventory.get_stats(dataset_ids)
 
-                # Create lotus job
-                script_path = importlib.util.find_spec('cci_publisher.scripts.aggregate').origin
-                script_dir = os.path.dirname(script_path)
-                task = f'{script_dir}/publish_aggregations.sh {script_path} -d {dataset.id}'
+    def get_tasks(self):
+        """
+        Work out which datasets need publishing. The file statistics and state
+        of all the datasets are retrieved in bulk, so that only datasets which
+        have changed (or all of them, with --force) are passed to the executor.
 
-                # Add optional flags
-                if self.args.force:
-                    task = f'{task} --force'
-                if dataset.wms:
-                    task = f'{task} --wms'
+        :return: list of PublishTask, longest first
+        """
+        dataset_ids = [dataset.id for dataset in self.datasets]
+        inventory = self.get_inventory(dataset_ids)
+
+        rows = []
+        for dataset in self.datasets:
+            stats = inventory.get(dataset.id, EMPTY_STATS)
+            rows.append((dataset.id, stats.file_count, dataset.aggregate, dataset.wms, stats.fingerprint))
+
+        updated = self.state.has_updated_many(rows)
+
+        tasks = []
+        for dataset in self.datasets:
+            if not (updated[dataset.id] or self.args.force):
+                continue
+
+            tasks.append(PublishTask(
+                dataset_id=dataset.id,
+                wms=dataset.wms,
+                aggregate=dataset.aggregate,
+                force=self.args.force,
+                incremental=self.args.incremental,
+                workers=self.args.workers,
+                use_threads=self.args.threads,
+                stats=inventory.get(dataset.id, EMPTY_STATS),
+                updated=updated[dataset.id],
+                filename_dates=dataset.filename_dates or self.args.filename_dates
+            ))
+
+        print(f'Datasets to publish: {len(tasks)}')
+
+        # Start the longest running datasets first so the batch finishes sooner
+        return self.cost_model.order(tasks)
+
+    def get_executor(self):
+        """
+        Return the executor selected on the command line
 
-                # Submit job
-                command = f'sbatch --time 24:00:00 -e errors/{dataset.id}.err {task}'
-                print(command)
-                subprocess.call(command, shell=True)
+        :raises ValueError: If the jobs would run on other hosts but the
+                            state store is a local SQLite database
+        """
+        executor = 'slurm' if self.args.lotus else self.args.executor
+
+        if executor == 'slurm':
+            # The array tasks update the state store themselves
+            if isinstance(self.state, SQLiteStateStore):
+                raise ValueError('The sqlite state store cannot be used with --lotus or --executor slurm, '
+                                 'as the array tasks would write to it from other hosts. '
+                                 'Use the elasticsearch backend in the [state_store] section of the config.')
+
+            array_limit = self.args.array_limit or self.conf.getint('lotus', 'array_limit', fallback=None)
+            return SlurmExecutor(
+                self.conf,
+                cost_model=self.cost_model,
+                array_limit=array_limit,
+                max_array_size=self.conf.getint('lotus', 'max_array_size', fallback=1000),
+                manifest_dir=self.conf.get('lotus', 'manifest_dir', fallback='manifests'),
+                batch_seconds=self.conf.getfloat('lotus', 'batch_seconds', fallback=1800)
+            )
+
+        if executor == 'local':
+            return LocalProcessExecutor(self.conf, processes=self.args.processes, timeout=self.args.timeout)
+
+        return SerialExecutor(self.conf, self.state)
 
-            else:
-                ds = DRSDataset(dataset.id, self.state, self.conf, force=self.args.force, wms=dataset.wms)
-                ds.publish()
+    def publish_datasets(self):
+        """
+        Generate the THREDDS catalog files for the published CCI datasets
+        """
+        executor = self.get_executor()
+        tasks = self.get_tasks()
+
+        state_updates = []
+        failures = []
+
+        try:
+            for result in tqdm(executor.run(tasks), total=len(tasks), desc='Generating catalog records'):
+                if not result.success:
+                    failures.append(result)
+                elif result.state_row:
+                    state_updates.append(result.state_row)
+
+                if len(state_updates) >= self.STATE_UPDATE_BATCH:
+                    self.state.update_many(state_updates)
+                    state_updates = []
+        finally:
+            # Keep the state of the datasets which completed, even if the run
+            # was stopped
+            if state_updates:
+                self.state.update_many(state_updates)
+
+        for result in failures:
+            print(f'Failed to publish {result.dataset_id}: {result.error}', file=sys.stderr)
 
     def unpublish_datasets(self):
         """
@@ -95,15 +190,30 @@ class CCIPublisher:
         if self.args.datasets == 'all':
             dataset_list = self.datasets
         else:
-            dataset_list = DRSAggregation(self.conf.get('elasticsearch','collections_index')).get_aggregations()
+            dataset_list = DRSAggregation(self.conf.get('elasticsearch','collections_index'),
+                                          es=get_es_client(self.conf),
+                                          mappings=get_mappings_snapshot(self.conf)).get_aggregations()
 
-        ids_on_disk = {file.stem for file in get_all_catalog_files(self.conf.get('output','thredds_catalog_repo_path'))}
+        catalog_dir = os.path.join(self.conf.get('output', 'thredds_catalog_repo_path'), 'data', 'catalog')
+        ids_on_disk = {file.stem for file in get_all_catalog_files(catalog_dir)}
 
-        ids_to_delete = ids_on_disk - {ds.id for ds in dataset_list}
+        dataset_ids = {ds.id for ds in dataset_list}
+        ids_to_delete = ids_on_disk - dataset_ids
 
         print(f'Aggregations on disk: {len(ids_on_disk)}')
         print(f'Aggregations to delete: {len(ids_to_delete)}')
 
+        # An empty or partial result from the collections index would
+        # otherwise remove most of the catalog
+        if ids_to_delete and len(dataset_ids) < self.MIN_UNPUBLISH_FRACTION * len(ids_on_disk) \
+                and not self.args.force_unpublish:
+            print(f'Refusing to unpublish: only {len(dataset_ids)} datasets found for '
+                  f'{len(ids_on_disk)} aggregations on disk. Use --force-unpublish to remove them anyway',
+                  file=sys.stderr)
+            return
+
+        self.state.preload(ids_to_delete)
+
         for record in ids_to_delete:
             ds = DRSDataset(record, self.state, self.conf)
             ds.unpublish()
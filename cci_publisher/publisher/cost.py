@@ -0,0 +1,362 @@
+# encoding: utf-8
+"""
+Estimate how long, and how much memory, publishing a dataset will take.
+
+The estimate is a linear model of the number and size of the files in the
+dataset. Where a dataset has been published before, its last runtime, scaled
+by the change in file count, is used instead.
+
+The estimates are used to size the SLURM resource requests, to start the
+most expensive datasets first, so that the batch is not left waiting on one
+large dataset at the end, and to pack small datasets into shared jobs.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from collections import namedtuple
+import heapq
+import json
+import math
+import os
+
+GB = 1024 ** 3
+
+# Limits requested from SLURM are rounded up to one of these, so that tasks
+# with similar costs can share a job array
+TIME_TIERS = [30 * 60, 60 * 60, 2 * 60 * 60, 4 * 60 * 60, 8 * 60 * 60, 16 * 60 * 60, 24 * 60 * 60]
+MEMORY_TIERS = [1024, 2048, 4096, 8192, 16384, 32768]
+
+
+class TaskCost(namedtuple('TaskCost', ['seconds', 'memory'])):
+    """
+    namedtuple to store the estimated cost of a PublishTask
+    - seconds - Expected wall time in seconds
+    - memory  - Expected peak memory in MB
+    """
+
+
+# Mode of a run which opened every file
+FULL_READ = 'full'
+
+
+class RuntimeHistory:
+    """
+    Record of past runtimes in a JSON lines file. Each line holds the
+    dataset_id, mode, file_count and duration of a successful run. Later
+    lines replace earlier ones for the same dataset and mode. The mode says
+    how the files were read, see CostModel.run_mode, as incremental runs and
+    runs which take the metadata from a cache or the filenames are much
+    quicker than reading every file.
+
+    Each line is appended in a single write to a file opened in append mode,
+    so the file can be shared by concurrent jobs. When the file grows beyond
+    max_bytes, it is rewritten with the latest run for each dataset and mode
+    and replaced in one step. The file is only read when a runtime is looked up.
+    """
+
+    def __init__(self, path, max_bytes=8 * 1024 ** 2):
+        """
+        :param path: Path to the history file. It is created when first recorded to.
+        :param max_bytes: Size of the file at which it is compacted
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._runs = None
+
+    @staticmethod
+    def _read(path):
+        """
+        :param path: Path to the history file
+        :return: Mapping of (DRS ID, mode) to the last run, in the order last recorded
+        """
+        runs = {}
+
+        if os.path.exists(path):
+            with open(path) as reader:
+                for line in reader:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partial line left by a job which was killed
+                        continue
+
+                    # Entries written before the mode was recorded may be
+                    # from incremental runs, so are not used
+                    if 'mode' not in entry:
+                        continue
+
+                    key = entry['dataset_id'], entry['mode']
+                    runs.pop(key, None)
+                    runs[key] = entry
+
+        return runs
+
+    @property
+    def runs(self):
+        """
+        Mapping of (DRS ID, mode) to the last run, read from the file on first use
+        """
+        if self._runs is None:
+            self._runs = self._read(self.path)
+
+        return self._runs
+
+    def get(self, dataset_id, mode=FULL_READ):
+        """
+        :param dataset_id: DRS ID
+        :param mode: Mode of the run to estimate. Runs which read every file
+                     are used if there is not one in the same mode, as they
+                     give an upper bound.
+        :return: (file_count, duration) for the last run or None
+        """
+        entry = self.runs.get((dataset_id, mode)) or self.runs.get((dataset_id, FULL_READ))
+        if entry:
+            return entry['file_count'], entry['duration']
+
+    def record(self, dataset_id, file_count, duration, mode=FULL_READ):
+        """
+        Add a run to the history
+
+        :param dataset_id: DRS ID
+        :param file_count: Number of files in the dataset
+        :param duration: Wall time in seconds
+        :param mode: How the files were read, see CostModel.run_mode
+        """
+        entry = {'dataset_id': dataset_id, 'mode': mode, 'file_count': file_count, 'duration': round(duration, 3)}
+        if self._runs is not None:
+            self._runs[(dataset_id, mode)] = entry
+
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+        if os.path.getsize(self.path) > self.max_bytes:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the file with only the latest run for each dataset and mode,
+        dropping the oldest if that is still over half of max_bytes. The new
+        file replaces the old one in one step, so readers see one or the
+        other. Runs recorded by other jobs while the file is rewritten may be
+        lost.
+        """
+        runs = self._read(self.path)
+
+        lines = [json.dumps(entry) + '\n' for entry in runs.values()]
+        size = sum(len(line) for line in lines)
+        start = 0
+        while size > self.max_bytes // 2 and start < len(lines):
+            size -= len(lines[start])
+            start += 1
+
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as writer:
+            writer.writelines(lines[start:])
+        os.replace(tmp_path, self.path)
+
+        self._runs = None
+
+
+def round_up(value, tiers):
+    """
+    Round up to the nearest tier. Values beyond the last tier are limited to it.
+
+    :param value: Value to round
+    :param tiers: Ascending list of tiers
+    """
+    for tier in tiers:
+        if value <= tier:
+            return tier
+    return tiers[-1]
+
+
+def format_time(seconds):
+    """
+    Format seconds as a SLURM time limit
+
+    :param seconds: Seconds
+    :return: HH:MM:SS
+    :rtype: str
+    """
+    seconds = int(math.ceil(seconds))
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+class CostModel:
+    """
+    Estimate the cost of publishing a dataset
+
+    Instance Parameters:
+
+        :arg overhead: Fixed seconds per dataset, for start up and writing the catalog
+        :arg seconds_per_file: Seconds per file, mostly opening the file to read the coordinates
+        :arg seconds_per_gb: Seconds per GB of data
+        :arg base_memory: Fixed memory per dataset in MB
+        :arg memory_per_file: Memory per file in MB
+        :arg safety_factor: Multiplier applied to the time estimate for the time limit
+        :arg history: RuntimeHistory of previous runs
+        :arg metadata_cache: Whether the runs use a metadata cache
+    """
+
+    def __init__(self, overhead=30, seconds_per_file=0.2, seconds_per_gb=1, base_memory=768,
+                 memory_per_file=0.05, safety_factor=2, history=None, metadata_cache=False):
+        self.overhead = overhead
+        self.seconds_per_file = seconds_per_file
+        self.seconds_per_gb = seconds_per_gb
+        self.base_memory = base_memory
+        self.memory_per_file = memory_per_file
+        self.safety_factor = safety_factor
+        self.history = history
+        self.metadata_cache = metadata_cache
+
+    @classmethod
+    def from_config(cls, conf):
+        """
+        Create a CostModel from the cost section of the config file
+
+        :param conf: ConfigParser config object
+        :return: CostModel
+        """
+        kwargs = {}
+        for option in ('overhead', 'seconds_per_file', 'seconds_per_gb', 'base_memory',
+                       'memory_per_file', 'safety_factor'):
+            if conf.has_option('cost', option):
+                kwargs[option] = conf.getfloat('cost', option)
+
+        history = conf.get('cost', 'history', fallback=None)
+        if history:
+            if conf.has_option('cost', 'history_max_bytes'):
+                kwargs['history'] = RuntimeHistory(history, max_bytes=conf.getint('cost', 'history_max_bytes'))
+            else:
+                kwargs['history'] = RuntimeHistory(history)
+
+        kwargs['metadata_cache'] = bool(conf.get('aggregation', 'metadata_cache', fallback=None))
+
+        return cls(**kwargs)
+
+    def estimate(self, task):
+        """
+        Estimate the cost of a task
+
+        :param task: PublishTask
+        :return: TaskCost
+        """
+        file_count = task.stats.file_count if task.stats else 0
+        total_size = task.stats.total_size if task.stats else 0
+
+        seconds = self.overhead + self.seconds_per_file * file_count + self.seconds_per_gb * total_size / GB
+
+        previous = self.history.get(task.dataset_id, self.run_mode(task)) if self.history else None
+        if previous:
+            previous_count, duration = previous
+            # Scale the last run by the change in the number of files
+            seconds = duration * max(file_count, 1) / max(previous_count, 1)
+
+        memory = self.base_memory + self.memory_per_file * file_count
+
+        return TaskCost(seconds, memory)
+
+    def limits(self, task):
+        """
+        Resources to request for a task
+
+        :param task: PublishTask
+        :return: (time limit in seconds, memory in MB), rounded up to TIME_TIERS and MEMORY_TIERS
+        """
+        cost = self.estimate(task)
+        return (
+            round_up(cost.seconds * self.safety_factor, TIME_TIERS),
+            round_up(cost.memory, MEMORY_TIERS)
+        )
+
+    def batch_limits(self, batch):
+        """
+        Resources to request for a batch of tasks run one after another
+
+        :param batch: list of PublishTask
+        :return: (time limit in seconds, memory in MB), rounded up to TIME_TIERS and MEMORY_TIERS
+        """
+        costs = [self.estimate(task) for task in batch]
+        return (
+            round_up(sum(cost.seconds for cost in costs) * self.safety_factor, TIME_TIERS),
+            round_up(max(cost.memory for cost in costs), MEMORY_TIERS)
+        )
+
+    def pack(self, tasks, target):
+        """
+        Pack the tasks into batches with an estimated runtime of up to target
+        seconds. Tasks estimated to take longer than the target get a batch
+        to themselves.
+
+        Tasks are placed longest first into the open batch with the most time
+        left, so the batches end up with similar runtimes.
+
+        :param tasks: list of PublishTask
+        :param target: Target seconds per batch
+        :return: list of batches, each a list of PublishTask
+        """
+        batches = []
+
+        # (-seconds left, batch index) for batches with room for more tasks
+        open_batches = []
+
+        for task in self.order(tasks):
+            seconds = self.estimate(task).seconds
+
+            if open_batches and -open_batches[0][0] >= seconds:
+                left, index = heapq.heappop(open_batches)
+                batches[index].append(task)
+                heapq.heappush(open_batches, (left + seconds, index))
+                continue
+
+            batches.append([task])
+            if seconds < target:
+                heapq.heappush(open_batches, (seconds - target, len(batches) - 1))
+
+        return batches
+
+    def order(self, tasks):
+        """
+        Sort the tasks longest first
+
+        :param tasks: list of PublishTask
+        :return: list of PublishTask
+        """
+        return sorted(tasks, key=lambda task: self.estimate(task).seconds, reverse=True)
+
+    def run_mode(self, task):
+        """
+        How the files of a task are read. Runs are only compared with runs in
+        the same mode, or runs which read every file.
+
+        :param task: PublishTask
+        :return: FULL_READ or the options which avoid reading files, joined by '+'
+        """
+        options = []
+        if task.incremental:
+            options.append('incremental')
+        if self.metadata_cache:
+            options.append('metadata_cache')
+        if task.filename_dates:
+            options.append('filename_dates')
+
+        return '+'.join(options) or FULL_READ
+
+    def record(self, task, duration):
+        """
+        Add a run to the history, if there is one
+
+        :param task: PublishTask
+        :param duration: Wall time in seconds
+        """
+        if self.history is not None:
+            file_count = task.stats.file_count if task.stats else 0
+            self.history.record(task.dataset_id, file_count, duration, self.run_mode(task))
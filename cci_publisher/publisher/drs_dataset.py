@@ -8,12 +8,12 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from ceda_elasticsearch_tools.elasticsearch import CEDAElasticsearchClient
 from elasticsearch.helpers import scan
 from cci_publisher.datasets import ThreddsXMLDataset
+from cci_publisher.aggregation.incremental import file_stats_path
 import os
-from cci_publisher.datasets.create_catalog import CCICatalogBuilder
-from cci_publisher.utils import write_catalog, get_aggregation_subdir
+from cci_publisher.datasets.create_catalog import get_catalog_builder
+from cci_publisher.utils import write_catalog, get_aggregation_subdir, get_es_client, DatasetInventory, EMPTY_STATS
 
 
 class DRSDataset:
@@ -23,28 +23,42 @@ class DRSDataset:
 
     Attributes:
         total_files:    int     Total files in the DRS Dataset
-        results:        list    List of files in the DRS Dataset
+        total_size:     int     Total size of the files in bytes
+        fingerprint:    str     Fingerprint of the files, see DatasetInventory
         updated:        bool    Has the aggregation been updated
         id:             str     DRS ID
         state:          AggregationState
         force:          bool    Ignore state when deciding to aggreate
         wms:            bool    Provide WMS access
         aggregate:      bool    Whether or not to aggregate dataset
+        incremental:    bool    Extend the existing aggregation rather than rebuilding it
+        filename_dates: bool    Take the coordinate values from the filenames
+        workers:        int     Number of files to read concurrently
+        use_threads:    bool    Check the metadata cache in threads
         catalog_path:   str     xml Catalog file path
         ncml_root:      str     NCML file path
     """
 
-    def __init__(self, dataset_id, state, conf, force=False, wms=False, aggregate=True):
+    def __init__(self, dataset_id, state, conf, force=False, wms=False, aggregate=True, incremental=False,
+                 workers=1, use_threads=False, stats=None, updated=None, filename_dates=False):
+        """
+        stats is an optional DatasetStats from a DatasetInventory. When given,
+        the files index is not queried for the file statistics.
+
+        updated is the optional result of a state store check which has
+        already been made, e.g. with StateStore.has_updated_many
+        """
 
         # Preset values
         self.total_files = None
-        self.results = []
+        self.total_size = None
+        self.fingerprint = None
         self.updated = False
 
         # helper values
         self._conf = conf
-        self._builder = CCICatalogBuilder()
-        self._es = CEDAElasticsearchClient(headers={'x-api-key':conf.get('elasticsearch', 'api_key')})
+        self._builder = get_catalog_builder()
+        self._es = get_es_client(conf)
         self._files_index = self._conf.get('elasticsearch', 'files_index')
 
         # Set main values
@@ -53,10 +67,23 @@ class DRSDataset:
         self.force = force
         self.wms = wms
         self.aggregate = aggregate
+        self.incremental = incremental
+        self.workers = workers
+        self.use_threads = use_threads
+        self.filename_dates = filename_dates
 
         # Get processed attributes
-        self._get_file_count()
-        self._get_state()
+        if stats is None:
+            stats = self._get_stats()
+
+        self.total_files = stats.file_count
+        self.total_size = stats.total_size
+        self.fingerprint = stats.fingerprint
+
+        if updated is None:
+            self._get_state()
+        else:
+            self.updated = updated
         self.catalog_path = f'{self._conf.get("output", "thredds_catalog_repo_path")}/data/catalog/datasets/{self.id}.xml'
         self.ncml_root = f'{self._conf.get("output", "thredds_catalog_repo_path")}/data/aggregations/'
 
@@ -72,7 +99,8 @@ class DRSDataset:
             dataset=self.id,
             file_count=self.total_files,
             aggregate=self.aggregate,
-            wms=self.wms
+            wms=self.wms,
+            fingerprint=self.fingerprint
         )
 
     def _get_query(self):
@@ -103,50 +131,61 @@ class DRSDataset:
             }
         }
 
-    def _get_file_count(self):
+    def _get_stats(self):
         """
-        Number of files in the dataset, according to files index
+        Statistics for the files in the dataset, according to files index
+
+        :return: DatasetStats
         """
-        query = self._get_query()
-        self.total_files = self._es.count(index=self._files_index, body=query)['count']
+        inventory = DatasetInventory(self._files_index, es=self._es)
+        return inventory.get_stats([self.id]).get(self.id, EMPTY_STATS)
 
-    def _get_file_list(self):
+    def _iter_file_paths(self):
         """
-        Query elasticsearch for all netCDF files which match dataset ID
+        Query elasticsearch for all netCDF files which match dataset ID.
+        Paths are yielded as the results are scrolled so that the full
+        response is never held in memory.
+
+        :return: generator of file paths
         """
 
         query = self._get_query()
 
         # Reduce data sent back in scan
         query['_source'] = {
-            'includes': ['info.directory', 'info.name', 'info.size']
+            'includes': ['info.directory', 'info.name']
         }
 
-        results = scan(self._es, query=query, index=self._files_index)
-
-        self.results = [
-            {
-                'directory': result['_source']['info']['directory'],
-                'name': result['_source']['info']['name'],
-                'size': result['_source']['info']['size']
-
-            }
-            for result in results
-        ]
+        for result in scan(self._es, query=query, index=self._files_index):
+            info = result['_source']['info']
+            yield os.path.join(info['directory'], info['name'])
 
     def _build_catalog(self):
         """
-        Build the catalog record
+        Build the catalog record, including the aggregation if requested, and
+        write it in one pass
         """
 
         # If there is a change compared to state store or told to create regardless
         # and > 0 file
         if (self.updated or self.force) and self.total_files:
-            # Get the file list to work with
-            self._get_file_list()
-
-            catalog = self._builder.dataset_catalog(ds_id=self.id, opendap=True)
+            xml_dataset = None
+            aggregation = None
+
+            if self.aggregate:
+                xml_dataset = self._thredds_dataset()
+                aggregation = xml_dataset.build_aggregation(add_wms=self.wms, agg_dir=self.ncml_root)
+
+            catalog = self._builder.dataset_catalog(
+                ds_id=self.id,
+                opendap=True,
+                aggregated=self.aggregate,
+                aggregation=aggregation,
+                wms=self.aggregate and self.wms,
+                wcs=xml_dataset is not None and xml_dataset.do_wcs
+            )
 
+            # The aggregation is already written, before the catalog which points to it
             # Write the catalog file to disk
             write_catalog(catalog, self.catalog_path)
         else:
@@ -158,35 +197,31 @@ class DRSDataset:
         """
         os.remove(self.catalog_path)
 
-    def _build_aggregation(self):
+    def _thredds_dataset(self):
         """
-        Build the NCML aggregation
-        """
-
-        # There need to be files and the aggregation flag set. Then either there needs to be a change
-        # or the force flag is set
-        if all([self.aggregate, self.total_files]) and (self.updated or self.force):
-            netcdf_files = [
-                os.path.join(result['directory'], result['name'])
-                for result in self.results
-            ]
-
-            # Prepare the Dataset Object
-            xml_dataset = ThreddsXMLDataset(
-                aggregations_dir=self._conf.get('remote', 'aggregations_dir'),
-                thredds_server=self._conf.get('remote', 'thredds_server'),
-                do_wcs=True,
-                netcdf_files=netcdf_files
-            )
+        ThreddsXMLDataset for the files of this dataset. The NCML aggregation
+        is created by calling build_aggregation on the result.
 
-            # Read in the catalog file to modify
-            xml_dataset.read(self.catalog_path)
-
-            # Add the aggregations and wms (if requested)
-            xml_dataset.all_changes(create_aggs=True, add_wms=self.wms)
-
-            # Write out the changes
-            xml_dataset.write(self.catalog_path, agg_dir=self.ncml_root)
+        :return: ThreddsXMLDataset
+        """
+        # The aggregation needs to go over the files several times, so this
+        # is the one list of paths which is kept in memory
+        netcdf_files = list(self._iter_file_paths())
+
+        return ThreddsXMLDataset(
+            aggregations_dir=self._conf.get('remote', 'aggregations_dir'),
+            thredds_server=self._conf.get('remote', 'thredds_server'),
+            do_wcs=True,
+            netcdf_files=netcdf_files,
+            metadata_cache=self._conf.get('aggregation', 'metadata_cache', fallback=None),
+            # A forced run always rebuilds from scratch
+            existing_aggregations_dir=self.ncml_root if self.incremental and not self.force else None,
+            workers=self.workers,
+            use_threads=self.use_threads,
+            dataset_id=self.id,
+            catalog_path=self.catalog_path,
+            filename_dates=self.filename_dates
+        )
 
     def _delete_aggregation(self):
         """
@@ -197,17 +232,36 @@ class DRSDataset:
         aggregation_path = os.path.join(self.ncml_root, agg_subdir, f'{self.id}.ncml')
         os.remove(aggregation_path)
 
-    def publish(self):
+        # Written alongside for incremental builds
+        if os.path.exists(file_stats_path(aggregation_path)):
+            os.remove(file_stats_path(aggregation_path))
+
+    def state_row(self):
+        """
+        Current details of the dataset in the form used by the state store
+
+        :return: (dataset, count, aggregate, wms, fingerprint)
+        :rtype: tuple
+        """
+        return self.id, self.total_files, self.aggregate, self.wms, self.fingerprint
+
+    def publish(self, update_state=True):
         """
         Generate an aggregation for the DRS Dataset
+
+        :param update_state: Write the new state to the state store. If False,
+                             the caller is responsible for updating the state
+                             (e.g. in bulk with StateStore.update_many)
+        :return: Whether the dataset has changed since the last run
+        :rtype: bool
         """
 
         self._build_catalog()
 
-        self._build_aggregation()
+        if self.updated and update_state:
+            self.state.update(*self.state_row())
 
-        if self.updated:
-            self.state.update(self.id, self.total_files, self.aggregate, self.wms)
+        return self.updated
 
     def unpublish(self):
         """
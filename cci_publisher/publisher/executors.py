@@ -0,0 +1,288 @@
+# encoding: utf-8
+"""
+Executors to run the publication of a list of datasets.
+
+- SerialExecutor runs each dataset in turn in the current process
+- LocalProcessExecutor runs datasets concurrently in separate processes on
+  the local machine, with a per-dataset timeout
+- SlurmExecutor submits SLURM job arrays. Small datasets are packed into
+  batches which share an array task, large datasets get a task to
+  themselves. Batches with similar estimated costs share an array, sized to
+  suit them.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from collections import deque
+from datetime import datetime
+from multiprocessing.connection import wait
+import importlib.util
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+import traceback
+
+from .cost import CostModel, format_time
+from .tasks import TaskResult, publish_task, write_manifest
+
+
+class SerialExecutor:
+    """
+    Publish each dataset in turn in the current process. A dataset which
+    fails does not stop the rest.
+    """
+
+    def __init__(self, conf, state):
+        self.conf = conf
+        self.state = state
+
+    def run(self, tasks):
+        """
+        :param tasks: list of PublishTask
+        :return: generator of TaskResult
+        """
+        for task in tasks:
+            start = time.time()
+            try:
+                result = publish_task(task, self.conf, self.state)
+            except Exception:
+                result = TaskResult(task.dataset_id, False, None, traceback.format_exc(), time.time() - start)
+
+            yield result
+
+
+def _run_child(task, conf, conn):
+    """
+    Entry point for the child processes of LocalProcessExecutor. Errors are
+    sent back to the parent instead of being raised.
+
+    The child leads its own process group, which the pool of file readers it
+    may start joins, so the parent can stop them all together.
+    """
+    _new_process_group(0)
+
+    start = time.time()
+    try:
+        result = publish_task(task, conf)
+    except Exception:
+        result = TaskResult(task.dataset_id, False, None, traceback.format_exc(), time.time() - start)
+
+    conn.send(result)
+    conn.close()
+
+
+def _new_process_group(pid):
+    """
+    Make a process the leader of a new process group. Called by both the
+    parent and the child, whichever runs first, so the group exists before
+    either relies on it.
+
+    :param pid: Process ID, 0 for the current process
+    """
+    try:
+        os.setpgid(pid, 0)
+    except OSError:
+        # The child has already done it, or has exited
+        pass
+
+
+def _stop(process):
+    """
+    Stop a child of LocalProcessExecutor and any processes it started
+
+    :param process: multiprocessing.Process
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except OSError:
+        # The process group has gone
+        process.terminate()
+
+    process.join()
+
+
+class LocalProcessExecutor:
+    """
+    Publish datasets concurrently, each in its own process. A dataset which
+    fails or exceeds the timeout does not affect the others. A dataset which
+    exceeds the timeout is stopped along with any processes it started.
+
+    Instance Parameters:
+
+        :arg conf: ConfigParser config object
+        :arg processes: Number of datasets to publish at once
+        :arg timeout: Seconds after which a dataset is stopped. None for no limit.
+    """
+
+    # Seconds between checks for timed out processes
+    POLL_INTERVAL = 1
+
+    def __init__(self, conf, processes=None, timeout=None):
+        self.conf = conf
+        self.processes = processes or os.cpu_count()
+        self.timeout = timeout
+
+    def _start(self, task):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        # Not a daemon, so the task can start its own pool of file readers
+        process = multiprocessing.Process(target=_run_child, args=(task, self.conf, sender))
+        process.start()
+        _new_process_group(process.pid)
+
+        # Only the child should hold the sending end
+        sender.close()
+
+        return receiver, (task, process, time.time())
+
+    def run(self, tasks):
+        """
+        :param tasks: list of PublishTask
+        :return: generator of TaskResult in order of completion
+        """
+        pending = deque(tasks)
+        running = {}
+
+        try:
+            yield from self._run(pending, running)
+        finally:
+            # Only left running if the caller stopped early
+            for receiver, (task, process, start) in running.items():
+                _stop(process)
+                receiver.close()
+
+    def _run(self, pending, running):
+        while pending or running:
+            while pending and len(running) < self.processes:
+                receiver, info = self._start(pending.popleft())
+                running[receiver] = info
+
+            for receiver in wait(list(running), timeout=self.POLL_INTERVAL):
+                task, process, start = running.pop(receiver)
+
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    process.join()
+                    result = TaskResult(task.dataset_id, False, None,
+                                        f'Process exited with code {process.exitcode}', time.time() - start)
+
+                receiver.close()
+                process.join()
+                yield result
+
+            if self.timeout is None:
+                continue
+
+            now = time.time()
+            for receiver, (task, process, start) in list(running.items()):
+                if now - start > self.timeout:
+                    _stop(process)
+                    receiver.close()
+                    del running[receiver]
+                    yield TaskResult(task.dataset_id, False, None,
+                                     f'Timed out after {self.timeout} seconds', now - start)
+
+
+class SlurmExecutor:
+    """
+    Submit SLURM job arrays to run scripts/aggregate.py for each dataset.
+    The tasks are packed into batches of up to batch_seconds, according to
+    the cost model, and written to a manifest. Each array task picks its
+    batch from the manifest and publishes the datasets in one process, which
+    saves the start up cost for each of the many small datasets. The jobs
+    update the state store themselves.
+
+    The time and memory for each array come from the cost model. Batches are
+    grouped by their resource requests, and the groups and the batches within
+    them are submitted longest first.
+
+    Instance Parameters:
+
+        :arg conf: ConfigParser config object
+        :arg cost_model: CostModel used to size the jobs
+        :arg array_limit: Maximum number of array tasks running at once. None for no limit.
+        :arg max_array_size: Maximum number of tasks in one array, see MaxArraySize
+                             in slurm.conf. Larger lists are split across several arrays.
+        :arg manifest_dir: Directory to write the manifests to
+        :arg batch_seconds: Target estimated runtime of a batch of small datasets
+    """
+
+    def __init__(self, conf, cost_model=None, array_limit=None, max_array_size=1000,
+                 manifest_dir='manifests', batch_seconds=1800):
+        self.conf = conf
+        self.cost_model = cost_model or CostModel()
+        self.array_limit = array_limit
+        self.max_array_size = max_array_size
+        self.manifest_dir = manifest_dir
+        self.batch_seconds = batch_seconds
+
+    def array_command(self, manifest, n_tasks, time_limit, memory):
+        """
+        Build the sbatch command to submit a job array for a manifest
+
+        :param manifest: Path to the manifest file
+        :param n_tasks: Number of batches in the manifest
+        :param time_limit: Time limit for each batch in seconds
+        :param memory: Memory for each batch in MB
+        :return: command
+        :rtype: str
+        """
+        script_path = importlib.util.find_spec('cci_publisher.scripts.aggregate').origin
+        script_dir = os.path.dirname(script_path)
+        task = f'{script_dir}/publish_aggregations.sh {script_path} --manifest {manifest}'
+
+        array = f'0-{n_tasks - 1}'
+        if self.array_limit:
+            array = f'{array}%{self.array_limit}'
+
+        # %A is the job ID of the array and %a the index of the task
+        return (f'sbatch --array={array} --time {format_time(time_limit)} --mem {int(memory)}M '
+                f'-e errors/%A_%a.err {task}')
+
+    def group_batches(self, tasks):
+        """
+        Pack the tasks into batches and group the batches by the resources
+        they need
+
+        :param tasks: list of PublishTask
+        :return: list of ((time limit, memory), batches), longest first
+        """
+        groups = {}
+        for batch in self.cost_model.pack(tasks, self.batch_seconds):
+            groups.setdefault(self.cost_model.batch_limits(batch), []).append(batch)
+
+        return sorted(groups.items(), reverse=True)
+
+    def run(self, tasks):
+        """
+        :param tasks: list of PublishTask
+        :return: generator of TaskResult, one per task submitted
+        """
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        n_manifests = 0
+
+        for (time_limit, memory), group in self.group_batches(tasks):
+            for i in range(0, len(group), self.max_array_size):
+                start = time.time()
+                chunk = group[i:i + self.max_array_size]
+
+                manifest = os.path.abspath(os.path.join(self.manifest_dir, f'publish_{timestamp}_{n_manifests}.jsonl'))
+                write_manifest(chunk, manifest)
+                n_manifests += 1
+
+                # Submit job
+                command = self.array_command(manifest, len(chunk), time_limit, memory)
+                print(command)
+                returncode = subprocess.call(command, shell=True)
+
+                error = None if returncode == 0 else f'sbatch exited with code {returncode}'
+                duration = time.time() - start
+                for batch in chunk:
+                    for task in batch:
+                        yield TaskResult(task.dataset_id, returncode == 0, None, error, duration)
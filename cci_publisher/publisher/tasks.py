@@ -0,0 +1,120 @@
+# encoding: utf-8
+"""
+Tasks to publish a single dataset, which are run by the executors.
+
+Tasks for SLURM job arrays are passed to scripts/aggregate.py in a manifest.
+This is a JSON lines file with one batch of tasks per line. Each array task
+picks the line matching its index and publishes the datasets in it one after
+another.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.utils import DatasetStats
+from .drs_dataset import DRSDataset
+from .cost import CostModel
+from collections import namedtuple
+import json
+import time
+
+
+class PublishTask(namedtuple('PublishTask', ['dataset_id', 'wms', 'aggregate', 'force', 'incremental',
+                                             'workers', 'use_threads', 'stats', 'updated', 'filename_dates'])):
+    """
+    namedtuple to store everything needed to publish a single dataset
+    - dataset_id  - DRS ID
+    - wms         - Provide WMS access
+    - aggregate   - Whether or not to aggregate the dataset
+    - force       - Ignore state when deciding to aggregate
+    - incremental - Extend the existing aggregation rather than rebuilding it
+    - workers     - Number of files to read concurrently
+    - use_threads - Check the metadata cache in threads
+    - stats       - DatasetStats for the dataset
+    - updated     - Whether the dataset has changed according to the state store
+    - filename_dates - Take the coordinate values from the filenames
+    """
+
+
+# namedtuple only takes defaults from Python 3.7
+PublishTask.__new__.__defaults__ = (False,)
+
+
+class TaskResult(namedtuple('TaskResult', ['dataset_id', 'success', 'state_row', 'error', 'duration'])):
+    """
+    namedtuple to store the outcome of a PublishTask
+    - dataset_id - DRS ID
+    - success    - Whether the task completed
+    - state_row  - (dataset, count, aggregate, wms, fingerprint) to write to the state
+                   store, or None if the state does not need updating here
+    - error      - Error message if the task failed
+    - duration   - Wall time in seconds
+    """
+
+
+def publish_task(task, conf, state=None):
+    """
+    Publish a single dataset
+
+    :param task: PublishTask
+    :param conf: ConfigParser config object
+    :param state: StateStore. Not needed as the task carries the result of
+                  the state check.
+    :return: TaskResult
+    """
+    start = time.time()
+
+    ds = DRSDataset(task.dataset_id, state, conf, force=task.force, wms=task.wms, aggregate=task.aggregate,
+                    incremental=task.incremental, workers=task.workers, use_threads=task.use_threads,
+                    stats=task.stats, updated=task.updated, filename_dates=task.filename_dates)
+
+    state_row = ds.state_row() if ds.publish(update_state=False) else None
+    duration = time.time() - start
+
+    # Keep the runtime to improve the estimate next time
+    CostModel.from_config(conf).record(task, duration)
+
+    return TaskResult(task.dataset_id, True, state_row, None, duration)
+
+
+def _task_entry(task):
+    entry = task._asdict()
+    if task.stats is not None:
+        entry['stats'] = task.stats._asdict()
+    return entry
+
+
+def _entry_task(entry):
+    if entry['stats'] is not None:
+        entry['stats'] = DatasetStats(**entry['stats'])
+    return PublishTask(**entry)
+
+
+def write_manifest(batches, path):
+    """
+    Write batches of tasks to a manifest file
+
+    :param batches: list of batches, each a list of PublishTask
+    :param path: Path to the manifest file
+    """
+    with open(path, 'w') as writer:
+        for batch in batches:
+            writer.write(json.dumps([_task_entry(task) for task in batch]) + '\n')
+
+
+def read_manifest_batch(path, index):
+    """
+    Read a single batch of tasks from a manifest file
+
+    :param path: Path to the manifest file
+    :param index: Zero-based line number of the batch
+    :return: list of PublishTask
+    """
+    with open(path) as reader:
+        for i, line in enumerate(reader):
+            if i == index:
+                return [_entry_task(entry) for entry in json.loads(line)]
+
+    raise IndexError(f'Manifest {path} has no batch {index}')
@@ -1,7 +1,11 @@
 # encoding: utf-8
 """
-Script to generate the aggregation for a single dataset.
-To be used in a batch pattern
+Script to generate the aggregations for one or more datasets in a single
+process. To be used in a batch pattern, either with dataset IDs or as a task
+in a SLURM job array which reads a batch of datasets from a manifest.
+
+A dataset which fails does not stop the rest. The exit status is non-zero if
+any dataset failed.
 """
 __author__ = 'Richard Smith'
 __date__ = '21 May 2020'
@@ -10,10 +14,14 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 from cci_publisher.publisher.drs_dataset import DRSDataset
+from cci_publisher.publisher.tasks import publish_task, read_manifest_batch
+from cci_publisher.state_store import SQLiteStateStore
 from cci_publisher.utils import get_state_store
 
 import argparse
 import os
+import sys
+import traceback
 from configparser import ConfigParser
 
 
@@ -22,10 +30,20 @@ def main():
     base_path = os.path.dirname(__file__)
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('-d', dest='dataset', help='Dataset ID to aggregate')
+    parser.add_argument('-d', dest='datasets', nargs='+', default=[], help='Dataset IDs to aggregate')
     parser.add_argument('--wms', action='store_true', help='Boolean to determine whether to generate wms link')
     parser.add_argument('--conf', help='config file', default=os.path.join(base_path, '../config/cci_publisher_config.ini'))
     parser.add_argument('--force', action='store_true', help='force generation of aggregation even if no state change')
+    parser.add_argument('--incremental', action='store_true', help='extend the existing aggregation with new files')
+    parser.add_argument('--workers', type=int, default=1, help='number of files to read concurrently')
+    parser.add_argument('--threads', action='store_true',
+                        help='check the metadata cache in threads. Files are always read in processes, '
+                             'as netCDF4/HDF5 are not thread safe')
+    parser.add_argument('--filename-dates', action='store_true',
+                        help='take the time coordinates from the filenames, checked against a sample of the files')
+    parser.add_argument('--manifest', help='manifest of batches written by publish_aggregations. Replaces the other options')
+    parser.add_argument('--index', type=int, default=os.environ.get('SLURM_ARRAY_TASK_ID'),
+                        help='batch to run from the manifest. Default: $SLURM_ARRAY_TASK_ID')
 
     args = parser.parse_args()
 
@@ -34,9 +52,41 @@ def main():
 
     state = get_state_store(conf)
 
-    ds = DRSDataset(args.dataset, state, conf, force=args.force, wms=args.wms)
-    ds.publish()
+    failed = []
+
+    if args.manifest:
+        if args.index is None:
+            parser.error('--index is required with --manifest outside of a SLURM job array')
+
+        if isinstance(state, SQLiteStateStore):
+            parser.error('--manifest cannot be used with the sqlite state store, '
+                         'use the elasticsearch backend for SLURM job arrays')
+
+        for task in read_manifest_batch(args.manifest, args.index):
+            try:
+                result = publish_task(task, conf)
+                if result.state_row:
+                    state.update(*result.state_row)
+            except Exception:
+                traceback.print_exc()
+                failed.append(task.dataset_id)
+
+    else:
+        if not args.datasets:
+            parser.error('one of -d or --manifest is required')
+
+        for dataset in args.datasets:
+            try:
+                ds = DRSDataset(dataset, state, conf, force=args.force, wms=args.wms, incremental=args.incremental,
+                                workers=args.workers, use_threads=args.threads, filename_dates=args.filename_dates)
+                ds.publish()
+            except Exception:
+                traceback.print_exc()
+                failed.append(dataset)
 
+    if failed:
+        print(f'Failed to publish: {", ".join(failed)}', file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+# encoding: utf-8
+"""
+Script to report the size of the NcML aggregations in a directory with the
+coordinate values written for every file and with a regular time axis
+written as a start and increment, to show the effect of the compact form
+for each dataset.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.aggregation.compact import compact_aggregation, expand_aggregation, local_name
+from cci_publisher.datasets.threddsdataset import indent
+
+import argparse
+import copy
+import json
+import os
+import xml.etree.cElementTree as ET
+
+NCML_NS = 'http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2'
+
+
+def document_size(root):
+    """
+    Size of the document as ThreddsXMLBase.write would write it
+
+    :param root: Root element
+    :return: int
+    """
+    indent(root)
+    declaration = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    return len(declaration) + len(ET.tostring(root, encoding='UTF-8', xml_declaration=False)) + 1
+
+
+def aggregation_sizes(path):
+    """
+    :param path: Path to an NcML aggregation
+    :return: dict with the number of files, whether the compact form is used
+             and the size of the document in each form
+    """
+    root = ET.parse(path).getroot()
+
+    aggregation = next((child for child in root if local_name(child.tag) == 'aggregation'), None)
+    if aggregation is None:
+        return None
+
+    dimension = aggregation.get('dimName')
+    files = sum(1 for entry in aggregation if local_name(entry.tag) == 'netcdf')
+
+    expand_aggregation(root, dimension)
+    explicit_size = document_size(root)
+
+    compact_root = copy.deepcopy(root)
+    is_compact = compact_aggregation(compact_root, dimension).compact
+    compact_size = document_size(compact_root)
+
+    return {
+        'dataset': os.path.basename(path)[:-len('.ncml')],
+        'files': files,
+        'compact': is_compact,
+        'explicit_bytes': explicit_size,
+        'compact_bytes': compact_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('aggregations_dir', help='Directory containing the NcML aggregations')
+    parser.add_argument('--output', help='Also write the results to this file, one JSON object per line')
+
+    args = parser.parse_args()
+
+    ET.register_namespace('', NCML_NS)
+
+    results = []
+    for dirpath, _, filenames in os.walk(args.aggregations_dir):
+        for filename in sorted(filenames):
+            if filename.endswith('.ncml'):
+                result = aggregation_sizes(os.path.join(dirpath, filename))
+                if result:
+                    results.append(result)
+
+    results.sort(key=lambda r: r['explicit_bytes'] - r['compact_bytes'], reverse=True)
+
+    print(f'{"explicit (B)":>14} {"compact (B)":>14} {"saved":>7} {"files":>7}  dataset')
+    for r in results:
+        saved = 1 - r['compact_bytes'] / r['explicit_bytes']
+        print(f'{r["explicit_bytes"]:>14} {r["compact_bytes"]:>14} {saved:>7.1%} {r["files"]:>7}  {r["dataset"]}')
+
+    explicit_total = sum(r['explicit_bytes'] for r in results)
+    compact_total = sum(r['compact_bytes'] for r in results)
+    if explicit_total:
+        print(f'{explicit_total:>14} {compact_total:>14} {1 - compact_total / explicit_total:>7.1%} '
+              f'{sum(r["files"] for r in results):>7}  total ({sum(r["compact"] for r in results)} '
+              f'of {len(results)} datasets compact)')
+
+    if args.output:
+        with open(args.output, 'w') as writer:
+            for r in results:
+                writer.write(json.dumps(r) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# encoding: utf-8
+"""
+Script to remove the entries for files which no longer exist from the
+metadata cache set by metadata_cache in the aggregation section of the
+config.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.aggregation.cache import MetadataCache
+
+import argparse
+from configparser import ConfigParser
+import os
+import sys
+
+
+def main():
+    base_path = os.path.dirname(__file__)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefix', help='Only check files whose path starts with this, e.g. /neodc/esacci/ozone')
+    parser.add_argument('--config', help='Path to config file',
+                        default=os.path.join(base_path, '../config/cci_publisher_config.ini'))
+
+    args = parser.parse_args()
+
+    conf = ConfigParser()
+    conf.read(args.config)
+
+    path = conf.get('aggregation', 'metadata_cache', fallback=None)
+    if not path:
+        print('No metadata_cache set in the aggregation section of the config', file=sys.stderr)
+        sys.exit(1)
+
+    with MetadataCache(path) as cache:
+        removed = cache.prune(args.prefix)
+
+    print(f'Files removed: {removed}')
+
+
+if __name__ == '__main__':
+    main()
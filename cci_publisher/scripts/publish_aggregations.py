@@ -8,7 +8,7 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from cci_publisher.utils import DRSAggregation, EmptyIsTrue, DRSAggregationInfo
+from cci_publisher.utils import DRSAggregation, EmptyIsTrue, DRSAggregationInfo, get_es_client, get_mappings_snapshot
 from cci_publisher.publisher import CCIPublisher
 
 import argparse
@@ -51,11 +51,74 @@ def get_args():
         help='Force changes even if state store says it has been done before',
     )
 
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Extend existing aggregations with new files instead of rebuilding them'
+    )
+
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        default=1,
+        help='Number of files to read concurrently when building each aggregation. Default: %(default)s'
+    )
+
+    parser.add_argument(
+        '--threads',
+        dest='threads',
+        action='store_true',
+        help='Check the metadata cache in threads. Files are always read in processes, as the netCDF4 '
+             'and HDF5 libraries are not thread safe'
+    )
+
+    parser.add_argument(
+        '--filename-dates',
+        dest='filename_dates',
+        action='store_true',
+        help='Take the time coordinate of each file from the date in its filename, checked against a sample '
+             'of the files, for all datasets. Otherwise set per dataset with filename_dates in the '
+             'aggregation filter'
+    )
+
     parser.add_argument(
         '--lotus',
         dest='lotus',
         action='store_true',
-        help='Generate aggregations on lotus'
+        help='Generate aggregations on lotus. Same as --executor slurm'
+    )
+
+    parser.add_argument(
+        '--executor',
+        dest='executor',
+        choices=['serial', 'local', 'slurm'],
+        default='serial',
+        help='How to run the aggregations: one at a time, in a local process pool or as SLURM jobs. '
+             'Default: %(default)s'
+    )
+
+    parser.add_argument(
+        '--array-limit',
+        dest='array_limit',
+        type=int,
+        help='Maximum number of SLURM array tasks to run at once. Default: array_limit in the lotus '
+             'section of the config file, otherwise no limit'
+    )
+
+    parser.add_argument(
+        '--processes',
+        dest='processes',
+        type=int,
+        help='Number of datasets to publish at once with the local executor. Default: number of CPUs'
+    )
+
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        help='Seconds after which a dataset is abandoned with the local executor. Default: no limit'
     )
 
     parser.add_argument(
@@ -65,6 +128,13 @@ def get_args():
         help='Do not run the unpublish step'
     )
 
+    parser.add_argument(
+        '--force-unpublish',
+        dest='force_unpublish',
+        action='store_true',
+        help='Unpublish even if far fewer datasets are found than there are aggregations on disk'
+    )
+
     parser.add_argument(
         '--skip-publish',
         dest='skip_publish',
@@ -83,7 +153,9 @@ def main():
     conf.read(args.config)
 
     if args.datasets == 'all':
-        datasets = DRSAggregation(conf.get('elasticsearch', 'collections_index')).get_aggregations()
+        datasets = DRSAggregation(conf.get('elasticsearch', 'collections_index'),
+                                  es=get_es_client(conf),
+                                  mappings=get_mappings_snapshot(conf)).get_aggregations()
     else:
         datasets = [DRSAggregationInfo(ds, wms=args.wms) for ds in args.datasets]
 
@@ -0,0 +1,49 @@
+# encoding: utf-8
+"""
+Script to copy the aggregation state between the local SQLite state store
+and the Elasticsearch state index.
+
+export: make the Elasticsearch index match the SQLite database
+import: make the SQLite database match the Elasticsearch index
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.utils import get_state_store
+
+import argparse
+from configparser import ConfigParser
+import os
+
+
+def main():
+    base_path = os.path.dirname(__file__)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('direction', choices=['export', 'import'],
+                        help='export: SQLite to Elasticsearch, import: Elasticsearch to SQLite')
+    parser.add_argument('--config', help='Path to config file',
+                        default=os.path.join(base_path, '../config/cci_publisher_config.ini'))
+
+    args = parser.parse_args()
+
+    conf = ConfigParser()
+    conf.read(args.config)
+
+    sqlite_store = get_state_store(conf, backend='sqlite')
+    es_store = get_state_store(conf, backend='elasticsearch')
+
+    if args.direction == 'export':
+        written, removed = sqlite_store.mirror(es_store)
+    else:
+        written, removed = es_store.mirror(sqlite_store)
+
+    print(f'Rows written: {written}')
+    print(f'Rows removed: {removed}')
+
+
+if __name__ == '__main__':
+    main()
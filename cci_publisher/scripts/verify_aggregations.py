@@ -0,0 +1,102 @@
+# encoding: utf-8
+"""
+Script to check that THREDDS can serve the NcML aggregations in a directory
+without opening the files. Every file in an aggregation needs its coordinate
+values, either in coordValue or from a regular axis on the coordinate
+variable, and files in a joinExisting aggregation also need ncoords.
+
+Aggregations which would make THREDDS scan the files are listed, and the exit
+status is non-zero if there are any.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from cci_publisher.aggregation.compact import local_name, regular_axis_values
+
+import argparse
+import json
+import os
+import sys
+import xml.etree.cElementTree as ET
+
+
+def files_to_scan(path):
+    """
+    :param path: Path to an NcML aggregation
+    :return: dict with the number of files in the aggregation and the number
+             THREDDS would need to open for their coordinate values or their
+             number of coordinates
+    """
+    root = ET.parse(path).getroot()
+
+    aggregation = next((child for child in root if local_name(child.tag) == 'aggregation'), None)
+    if aggregation is None:
+        return None
+
+    dimension = aggregation.get('dimName')
+    join_existing = aggregation.get('type') == 'joinExisting'
+    regular_axis = regular_axis_values(root, dimension) is not None
+
+    files = missing_values = missing_ncoords = 0
+    for entry in aggregation:
+        if local_name(entry.tag) != 'netcdf':
+            continue
+
+        files += 1
+        if not regular_axis and not entry.get('coordValue'):
+            missing_values += 1
+        if join_existing and not entry.get('ncoords'):
+            missing_ncoords += 1
+
+    return {
+        'dataset': os.path.basename(path)[:-len('.ncml')],
+        'files': files,
+        'missing_values': missing_values,
+        'missing_ncoords': missing_ncoords,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('aggregations_dir', help='Directory containing the NcML aggregations')
+    parser.add_argument('--output', help='Also write the aggregations which need a scan to this file, '
+                                         'one JSON object per line')
+
+    args = parser.parse_args()
+
+    checked = 0
+    failed = []
+    for dirpath, _, filenames in os.walk(args.aggregations_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith('.ncml'):
+                continue
+
+            result = files_to_scan(os.path.join(dirpath, filename))
+            if result is None:
+                continue
+
+            checked += 1
+            if result['missing_values'] or result['missing_ncoords']:
+                failed.append(result)
+
+    if failed:
+        print(f'{"files":>7} {"no values":>9} {"no ncoords":>10}  dataset')
+        for r in failed:
+            print(f'{r["files"]:>7} {r["missing_values"]:>9} {r["missing_ncoords"]:>10}  {r["dataset"]}')
+
+    print(f'{len(failed)} of {checked} aggregations would need THREDDS to open the files')
+
+    if args.output:
+        with open(args.output, 'w') as writer:
+            for r in failed:
+                writer.write(json.dumps(r) + '\n')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,4 +9,5 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 
-from .state_store import StateStore
\ No newline at end of file
+from .state_store import StateStore, BaseStateStore
+from .sqlite_store import SQLiteStateStore
@@ -0,0 +1,204 @@
+# encoding: utf-8
+"""
+State store kept in a local SQLite database rather than in Elasticsearch.
+
+Reads and writes do not need a network round trip, so the change plan for a
+whole run is computed locally and tests do not need a cluster. The database
+uses write-ahead logging so that concurrent processes can read while another
+writes. WAL relies on shared memory, so the database must be on a local
+filesystem and not on NFS or similar.
+
+Use StateStore.mirror / SQLiteStateStore.mirror, or the sync_state_store.py
+script, to copy the rows to or from the Elasticsearch index.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from .state_store import AggregationState, BaseStateStore
+import os
+import sqlite3
+
+
+class SQLiteStateStore(BaseStateStore):
+    """
+    SQLite backed state store with the same interface as StateStore.
+
+    Instance Parameters:
+
+        :arg path: Path to the SQLite database file. Created if it does not exist.
+        :arg timeout: Seconds to wait for a lock held by another process
+    """
+
+    # SQLite limits the number of parameters in a statement
+    CHUNK_SIZE = 500
+
+    def __init__(self, path, timeout=60):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+
+        self._conn = None
+        self._pid = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS aggregation_state ('
+                'id TEXT PRIMARY KEY, '
+                'file_count INTEGER NOT NULL, '
+                'aggregate INTEGER NOT NULL, '
+                'wms INTEGER NOT NULL, '
+                'fingerprint TEXT)'
+            )
+
+    @property
+    def conn(self):
+        """
+        Connection for the current process. SQLite connections must not be
+        shared with forked processes, so each process opens its own.
+        """
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    @staticmethod
+    def _to_state(row):
+        """
+        :param row: (id, file_count, aggregate, wms, fingerprint) from the table
+        :return: AggregationState
+        """
+        dataset, count, aggregate, wms, fingerprint = row
+        return AggregationState(**BaseStateStore._row_body(dataset, count, bool(aggregate), bool(wms), fingerprint))
+
+    @staticmethod
+    def _to_params(dataset, count, aggregate, wms, fingerprint=None):
+        return dataset, count, int(bool(aggregate)), int(bool(wms)), fingerprint
+
+    def add_row(self, dataset, count, aggregate, wms, fingerprint=None):
+        """
+        Add the specified dataset to the state store
+
+        :param dataset: DRS ID
+        :type dataset: str
+
+        :param count: Total files
+        :type count: int
+
+        :param aggregate: Boolean
+        :type aggregate: Bool
+
+        :param wms: Boolean
+        :type wms: Bool
+
+        :param fingerprint: Fingerprint of the files
+        :type fingerprint: str
+        """
+        self.update_many([(dataset, count, aggregate, wms, fingerprint)])
+
+    def delete_row(self, dataset):
+        """
+        Delete the specified dataset from the state store
+
+        :param dataset: DRS
+        :type dataset: str
+        """
+        self.clear_unused([dataset])
+
+    def get_dataset(self, dataset):
+        """
+        Get the specified dataset from the state store
+
+        :param dataset: DRS
+        :type dataset: str
+
+        :return: AggregationState | None
+        """
+        if dataset in self._preloaded:
+            return self._preloaded[dataset]
+
+        row = self.conn.execute(
+            'SELECT id, file_count, aggregate, wms, fingerprint FROM aggregation_state WHERE id = ?',
+            (dataset,)
+        ).fetchone()
+
+        return self._to_state(row) if row else None
+
+    def get_datasets(self, datasets):
+        """
+        Get the specified datasets from the state store
+
+        :param datasets: DRS IDs
+        :type datasets: list
+
+        :return: Mapping of DRS ID to AggregationState | None
+        :rtype: dict
+        """
+        states = dict.fromkeys(datasets)
+
+        for chunk in self._chunks(list(states), self.CHUNK_SIZE):
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = self.conn.execute(
+                'SELECT id, file_count, aggregate, wms, fingerprint FROM aggregation_state '
+                f'WHERE id IN ({placeholders})',
+                chunk
+            )
+
+            for row in cursor:
+                states[row[0]] = self._to_state(row)
+
+        return states
+
+    def update_many(self, rows):
+        """
+        Update details for many datasets in a single transaction
+
+        :param rows: (dataset, count, aggregate, wms, fingerprint) tuples
+        :type rows: list
+        """
+        params = [self._to_params(*row) for row in rows]
+
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO aggregation_state VALUES (?, ?, ?, ?, ?)', params)
+
+        for row in params:
+            if row[0] in self._preloaded:
+                self._preloaded[row[0]] = self._to_state(row)
+
+    def clear_unused(self, ids_to_remove):
+        """
+        Clear ids which are no longer active aggregations
+
+        :param ids_to_remove: List of ids
+        :type ids_to_remove: list
+        """
+        ids_to_remove = list(ids_to_remove)
+
+        for id in ids_to_remove:
+            self._preloaded.pop(id, None)
+
+        with self.conn:
+            self.conn.executemany('DELETE FROM aggregation_state WHERE id = ?', [(id,) for id in ids_to_remove])
+
+    def rows(self):
+        """
+        All the rows in the state store
+
+        :return: generator of (dataset, count, aggregate, wms, fingerprint) tuples
+        """
+        cursor = self.conn.execute('SELECT id, file_count, aggregate, wms, fingerprint FROM aggregation_state')
+        for dataset, count, aggregate, wms, fingerprint in cursor:
+            yield dataset, count, bool(aggregate), bool(wms), fingerprint
@@ -9,7 +9,11 @@ The state store stores
 - Number of files
 - Whether or not to generate an aggregation
 - Whether or not to add WMS capabilities
+- Fingerprint of the files, see cci_publisher.utils.inventory
 
+BaseStateStore holds the logic which does not depend on where the rows are
+kept. StateStore keeps them in Elasticsearch, see sqlite_store for a local
+alternative.
 """
 __author__ = 'Richard Smith'
 __date__ = '05 May 2020'
@@ -18,6 +22,7 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 from ceda_elasticsearch_tools.elasticsearch import CEDAElasticsearchClient
+from elasticsearch.helpers import BulkIndexError, bulk, scan
 import elasticsearch
 import hashlib
 
@@ -31,13 +36,188 @@ class AggregationState:
             setattr(self, key, value)
 
 
-class StateStore:
+class BaseStateStore:
+    """
+    Methods shared by the state store backends. Subclasses implement
+    add_row, delete_row, get_dataset, get_datasets, update_many,
+    clear_unused and rows.
+    """
+
+    # Number of rows per batched read or write
+    CHUNK_SIZE = 1000
+
+    def __init__(self):
+        # States retrieved by preload(), keyed by DRS ID
+        self._preloaded = {}
+
+    @staticmethod
+    def _chunks(items, size):
+        """
+        Split a list into lists of at most size items
+        """
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    @staticmethod
+    def _row_body(dataset, count, aggregate, wms, fingerprint=None):
+        return {
+            'id': dataset,
+            'file_count': count,
+            'aggregate': aggregate,
+            'wms': wms,
+            'fingerprint': fingerprint
+        }
+
+    def preload(self, datasets):
+        """
+        Retrieve the state of many datasets in a few requests. Subsequent calls
+        to get_dataset and has_updated for these datasets do not query the
+        state store.
+
+        :param datasets: DRS IDs
+        :type datasets: list
+        """
+        self._preloaded.update(self.get_datasets(datasets))
+
+    def has_updated(self, dataset, file_count, aggregate, wms, fingerprint=None):
+        """
+        Check if the details have changed and so we need to run the
+        aggregation again.
+
+        :param dataset: DRS ID
+        :type dataset: str
+
+        :param file_count: Total files
+        :type file_count: int
+
+        :param aggregate: Boolean
+
+        :param wms: Boolean
+
+        :param fingerprint: Fingerprint of the files. If None, only the file
+                            count is compared.
+
+        :return: Boolean
+        """
+        return self._is_updated(self.get_dataset(dataset), file_count, aggregate, wms, fingerprint)
+
+    def has_updated_many(self, rows, backfill=True):
+        """
+        As has_updated for many datasets at once
+
+        :param rows: (dataset, file_count, aggregate, wms, fingerprint) tuples
+        :type rows: list
+
+        :param backfill: Store the fingerprint for unchanged datasets which were
+                         stored without one. These are compared on the file count,
+                         as before fingerprints were recorded, so the first run with
+                         fingerprints does not rebuild every dataset.
+
+        :return: Mapping of DRS ID to Boolean
+        :rtype: dict
+        """
+        rows = list(rows)
+        states = self.get_datasets([row[0] for row in rows])
+
+        updated = {}
+        missing = []
+
+        for dataset, file_count, aggregate, wms, fingerprint in rows:
+            state = states[dataset]
+            updated[dataset] = self._is_updated(state, file_count, aggregate, wms, fingerprint)
+
+            if not updated[dataset] and fingerprint and not getattr(state, 'fingerprint', None):
+                missing.append((dataset, file_count, aggregate, wms, fingerprint))
+
+        if backfill and missing:
+            self.update_many(missing)
+
+        return updated
+
+    @staticmethod
+    def _is_updated(aggregation, file_count, aggregate, wms, fingerprint=None):
+        """
+        Compare the stored state against the current details
+
+        :param aggregation: AggregationState | None
+        :return: Boolean
+        """
+
+        # No match so this is a new aggregation and need to process it
+        if not aggregation:
+            return True
+
+        # Check all the fields against the store.
+        if not all([
+            aggregation.file_count == file_count,
+            aggregation.aggregate == aggregate,
+            aggregation.wms == wms
+        ]):
+            return True
+
+        # Files can be replaced without changing the count. Rows stored
+        # without a fingerprint can only be compared on the count.
+        stored_fingerprint = getattr(aggregation, 'fingerprint', None)
+        if fingerprint and stored_fingerprint and stored_fingerprint != fingerprint:
+            return True
+
+        # The dataset is in the table and the fields are unchanged.
+        return False
+
+    def update(self, dataset, count, aggregate, wms, fingerprint=None):
+        """
+        Update details for a given dataset
+
+        :param dataset: DRS ID
+        :type dataset: str
+
+        :param count: total files
+        :type count: int
+
+        :param aggregate: Boolean
+
+        :param wms: Boolean
+
+        :param fingerprint: Fingerprint of the files
+        :type fingerprint: str
+        """
+
+        # Writing the same ID will update the row
+        self.add_row(dataset, count, aggregate, wms, fingerprint)
+
+    def mirror(self, target):
+        """
+        Make target hold the same rows as this store. Rows in target which
+        are not in this store are removed.
+
+        :param target: BaseStateStore
+        :return: (rows written, rows removed)
+        """
+        rows = list(self.rows())
+        ids = {row[0] for row in rows}
+        unused = [row[0] for row in target.rows() if row[0] not in ids]
+
+        for chunk in self._chunks(rows, self.CHUNK_SIZE):
+            target.update_many(chunk)
+
+        target.clear_unused(unused)
+
+        return len(rows), len(unused)
+
+
+class StateStore(BaseStateStore):
     """
     Interface to the the state store for CCI Aggregations.
     """
 
-    def __init__(self, index, **kwargs):
-        self.session = CEDAElasticsearchClient(**kwargs)
+    def __init__(self, index, session=None, **kwargs):
+        """
+        :param index: State store index
+        :param session: Elasticsearch client to use. If not given, a new
+                        client is created using kwargs
+        """
+        super().__init__()
+        self.session = session if session is not None else CEDAElasticsearchClient(**kwargs)
         self.index = index
 
         # Create and index, if it doesn't exist
@@ -56,7 +236,7 @@ class StateStore:
         """
         return hashlib.sha1(id.encode('utf-8')).hexdigest()
 
-    def add_row(self, dataset, count, aggregate, wms):
+    def add_row(self, dataset, count, aggregate, wms, fingerprint=None):
         """
         Add the specified dataset to the state store
 
@@ -71,14 +251,16 @@ class StateStore:
 
         :param wms: Boolean
         :type wms: Bool
+
+        :param fingerprint: Fingerprint of the files
+        :type fingerprint: str
         """
 
-        self.session.index(index=self.index, id=self._generate_id(dataset), body={
-            'id': dataset,
-            'file_count': count,
-            'aggregate': aggregate,
-            'wms': wms
-        })
+        body = self._row_body(dataset, count, aggregate, wms, fingerprint)
+        self.session.index(index=self.index, id=self._generate_id(dataset), body=body)
+
+        if dataset in self._preloaded:
+            self._preloaded[dataset] = AggregationState(**body)
 
     def delete_row(self, dataset):
         """
@@ -87,6 +269,8 @@ class StateStore:
         :param dataset: DRS
         :type dataset: str
         """
+        self._preloaded.pop(dataset, None)
+
         try:
             self.session.delete(index=self.index, id=self._generate_id(dataset))
         except elasticsearch.exceptions.NotFoundError:
@@ -101,6 +285,8 @@ class StateStore:
 
         :return: AggregationState | None
         """
+        if dataset in self._preloaded:
+            return self._preloaded[dataset]
 
         try:
             response = self.session.get(index=self.index, id=self._generate_id(dataset))
@@ -109,57 +295,51 @@ class StateStore:
         except elasticsearch.exceptions.NotFoundError:
             return None
 
-    def has_updated(self, dataset, file_count, aggregate, wms):
+    def get_datasets(self, datasets):
         """
-        Check if the details have changed and so we need to run the
-        aggregation again.
+        Get the specified datasets from the state store using multi-get
 
-        :param dataset: DRS ID
-        :type dataset: str
+        :param datasets: DRS IDs
+        :type datasets: list
 
-        :param file_count: Total files
-        :type file_count: int
-
-        :param aggregate: Boolean
-
-        :param wms: Boolean
-
-        :return: Boolean
+        :return: Mapping of DRS ID to AggregationState | None
+        :rtype: dict
         """
-        aggregation = self.get_dataset(dataset)
+        states = {}
 
-        # No match so this is a new aggregation and need to process it
-        if not aggregation:
-            return True
+        for chunk in self._chunks(list(datasets), self.CHUNK_SIZE):
+            response = self.session.mget(index=self.index, body={
+                'ids': [self._generate_id(dataset) for dataset in chunk]
+            })
 
-        # Check all the fields against the store.
-        if not all([
-            aggregation.file_count == file_count,
-            aggregation.aggregate == aggregate,
-            aggregation.wms == wms
-        ]):
-            return True
+            for dataset, doc in zip(chunk, response['docs']):
+                states[dataset] = AggregationState(**doc['_source']) if doc.get('found') else None
 
-        # The dataset is in the table and the fields are unchanged.
-        return False
+        return states
 
-    def update(self, dataset, count, aggregate, wms):
+    def update_many(self, rows):
         """
-        Update details for a given dataset
+        Update details for many datasets using the bulk API
 
-        :param dataset: DRS ID
-        :type dataset: str
+        :param rows: (dataset, count, aggregate, wms, fingerprint) tuples
+        :type rows: list
+        """
+        actions = []
 
-        :param count: total files
-        :type count: int
+        for row in rows:
+            dataset = row[0]
+            body = self._row_body(*row)
+            actions.append({
+                '_op_type': 'index',
+                '_index': self.index,
+                '_id': self._generate_id(dataset),
+                '_source': body
+            })
 
-        :param aggregate: Boolean
+            if dataset in self._preloaded:
+                self._preloaded[dataset] = AggregationState(**body)
 
-        :param wms: Boolean
-        """
-
-        # Indexing to the same ID will update the row
-        self.add_row(dataset, count, aggregate, wms)
+        bulk(self.session, actions, chunk_size=self.CHUNK_SIZE)
 
     def clear_unused(self, ids_to_remove):
         """
@@ -168,5 +348,30 @@ class StateStore:
         :param ids_to_remove: List of ids
         :type ids_to_remove: list
         """
+        actions = []
+
         for id in ids_to_remove:
-            self.delete_row(id)
+            self._preloaded.pop(id, None)
+            actions.append({
+                '_op_type': 'delete',
+                '_index': self.index,
+                '_id': self._generate_id(id)
+            })
+
+        _, errors = bulk(self.session, actions, chunk_size=self.CHUNK_SIZE, raise_on_error=False)
+
+        # Ids which are not in the store are reported as errors and can be ignored
+        errors = [error for error in errors if error.get('delete', {}).get('result') != 'not_found']
+        if errors:
+            raise BulkIndexError(f'{len(errors)} document(s) failed to delete.', errors)
+
+    def rows(self):
+        """
+        All the rows in the state store
+
+        :return: generator of (dataset, count, aggregate, wms, fingerprint) tuples
+        """
+        for doc in scan(self.session, index=self.index, query={'query': {'match_all': {}}}):
+            source = doc['_source']
+            yield (source['id'], source['file_count'], source['aggregate'], source['wms'],
+                   source.get('fingerprint'))
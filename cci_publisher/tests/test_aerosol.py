@@ -0,0 +1,73 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from datetime import datetime, timezone
+import unittest
+
+from cci_publisher.aggregation.aerosol import CCIAerosolDatasetReader
+
+
+def strptime_datetime(date_str):
+    for fmt in CCIAerosolDatasetReader.time_formats:
+        try:
+            return datetime.strptime(date_str, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+
+
+class Attributes:
+    """
+    Global attributes of a dataset, recording which are read
+    """
+
+    def __init__(self, **attributes):
+        self.attributes = attributes
+        self.read = []
+
+    def getncattr(self, name):
+        self.read.append(name)
+        try:
+            return self.attributes[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class TestAerosolDates(unittest.TestCase):
+
+    def setUp(self):
+        CCIAerosolDatasetReader._last_format = None
+        CCIAerosolDatasetReader._last_time_attr_names = None
+
+    def test_same_as_strptime(self):
+        for date_str in ['20020724T043133Z', '2002-07-24T04:31:33Z', '24-JUL-2002 04:31:33.070626',
+                         '24-JUL-2002', '20020724', '2002724', '20020724', '20020724T043133Z']:
+            self.assertEqual(CCIAerosolDatasetReader.get_datetime(date_str), strptime_datetime(date_str))
+
+    def test_invalid(self):
+        for date_str in ['20021324', '20020230T000000Z', 'unknown', '20020724\n', '20020724T043133Z\n']:
+            with self.assertRaises(ValueError):
+                CCIAerosolDatasetReader.get_datetime(date_str)
+
+
+    def test_time_attr_names(self):
+        reader = CCIAerosolDatasetReader('20020724-ESACCI-L3C_AEROSOL.nc')
+        reader.ds = Attributes(startdate='20020724', stopdate='20020725')
+
+        expected = [datetime(2002, 7, 24, tzinfo=timezone.utc), datetime(2002, 7, 25, tzinfo=timezone.utc)]
+        self.assertEqual(reader.get_start_end_date(), expected)
+        self.assertEqual(CCIAerosolDatasetReader._last_time_attr_names, ('startdate', 'stopdate'))
+
+        # The next file starts with the attributes found last time
+        reader.ds.read.clear()
+        self.assertEqual(reader.get_start_end_date(), expected)
+        self.assertEqual(reader.ds.read, ['startdate', 'stopdate'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import unittest
+import xml.etree.ElementTree as ET
+
+from cci_publisher.datasets.create_catalog import CCICatalogBuilder
+from cci_publisher.datasets.threddsdataset import CatalogAggregation
+
+NS = {'t': 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0',
+      'ncml': 'http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2'}
+
+DATASET_ID = 'esacci.TEST.day.L3C.SST.multi-sensor.multi-platform.AVHRR.v1-0.r1'
+
+
+class TestDatasetCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = CCICatalogBuilder()
+
+    def render(self, **kwargs):
+        return ET.fromstring(self.builder.dataset_catalog(DATASET_ID, opendap=True, **kwargs).encode('utf-8'))
+
+    def test_no_aggregation(self):
+        root = self.render()
+
+        self.assertEqual([s.get('name') for s in root.findall('t:service', NS)], ['HTTPServer', 'OpenDAPServer'])
+        self.assertEqual(len(root.findall('t:dataset/t:metadata', NS)), 1)
+        self.assertIsNone(root.find('t:dataset/t:dataset', NS))
+
+    def test_aggregation(self):
+        aggregation = CatalogAggregation(url_path=DATASET_ID, ncml_path=f'/aggregations/{DATASET_ID}.ncml',
+                                         services=['opendap', 'wms', 'wcs'], wms_viewer=True)
+        root = self.render(aggregated=True, aggregation=aggregation, wms=True, wcs=True)
+
+        self.assertEqual([s.get('name') for s in root.findall('t:service', NS)],
+                         ['wcs', 'wms', 'HTTPServer', 'OpenDAPServer'])
+
+        top_level = root.find('t:dataset', NS)
+        self.assertEqual(top_level.find('t:metadata[2]/t:authority', NS).text, 'pml.ac.uk:')
+        self.assertEqual([a.get('serviceName') for a in top_level.findall('t:access', NS)], aggregation.services)
+
+        aggregated = top_level.find('t:dataset', NS)
+        self.assertEqual(aggregated.get('urlPath'), DATASET_ID)
+        self.assertEqual([a.get('serviceName') for a in aggregated.findall('t:access', NS)], aggregation.services)
+        self.assertEqual(aggregated.find('ncml:netcdf', NS).get('location'), aggregation.ncml_path)
+        self.assertIn('request=GetCapabilities', aggregated.find('t:property', NS).get('value'))
+
+    def test_failed_aggregation(self):
+        root = self.render(aggregated=True)
+
+        self.assertEqual(len(root.findall('t:dataset/t:metadata', NS)), 2)
+        self.assertIsNone(root.find('t:dataset/t:access', NS))
+
+
+if __name__ == '__main__':
+    unittest.main()
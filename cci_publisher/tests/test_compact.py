@@ -0,0 +1,136 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+import xml.etree.cElementTree as ET
+
+from cci_publisher.aggregation.compact import RegularAxis, compact_aggregation, expand_aggregation
+from cci_publisher.aggregation.incremental import ExistingAggregation
+
+
+def aggregation(coord_values, agg_type='joinExisting'):
+    root = ET.Element('netcdf', xmlns='http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2')
+    ET.SubElement(root, 'attribute', name='id', value='esacci.TEST')
+    agg = ET.SubElement(root, 'aggregation', dimName='time', type=agg_type)
+    for i, values in enumerate(coord_values):
+        entry = ET.SubElement(agg, 'netcdf', location=f'/neodc/{i:03d}.nc')
+        if agg_type == 'joinExisting':
+            entry.set('ncoords', str(len(values.split(','))))
+        entry.set('coordValue', values)
+    return root
+
+
+def coord_values(root):
+    return [entry.get('coordValue') for entry in root.find('aggregation')]
+
+
+class TestRegularAxis(unittest.TestCase):
+
+    def axis(self, coord_values):
+        axis = RegularAxis('time')
+        for values in coord_values:
+            axis.add(values)
+        return axis
+
+    def test_daily(self):
+        axis = self.axis([str(10957.5 + i) for i in range(100)])
+
+        self.assertTrue(axis.compact)
+        self.assertEqual((axis.start, axis.increment, axis.count), ('10957.5', '1.0', 100))
+
+    def test_integer(self):
+        axis = self.axis([f'{7305 + 8 * i},{7306 + 8 * i}' for i in range(50)])
+
+        self.assertFalse(axis.regular)
+
+        axis = self.axis([str(7305 + 8 * i) for i in range(50)])
+
+        self.assertTrue(axis.compact)
+        self.assertEqual((axis.start, axis.increment), ('7305', '8'))
+
+    def test_monthly(self):
+        days = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334] * 5
+        axis = self.axis([str(10957.0 + d) for d in days])
+
+        self.assertFalse(axis.compact)
+
+    def test_missing_values(self):
+        axis = self.axis([str(10957.5 + i) for i in range(100)] + [None])
+
+        self.assertFalse(axis.compact)
+
+    def test_not_smaller(self):
+        self.assertFalse(self.axis(['10957.5', '10958.5']).compact)
+
+
+class TestCompactAggregation(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [str(10957.5 + i) for i in range(50)]
+        root = aggregation(values, agg_type='joinNew')
+
+        self.assertTrue(compact_aggregation(root, 'time').compact)
+        self.assertEqual(coord_values(root), [None] * 50)
+        self.assertEqual(root.find('variable/values').attrib, {'start': '10957.5', 'increment': '1.0'})
+        self.assertEqual(list(root).index(root.find('variable')), 1)
+
+        self.assertTrue(expand_aggregation(root, 'time'))
+        self.assertEqual(coord_values(root), values)
+        self.assertIsNone(root.find('variable'))
+
+    def test_join_new(self):
+        values = [str(7305 + i) for i in range(50)]
+        root = aggregation(values, agg_type='joinNew')
+        variable = ET.Element('variable', name='time', type='int', shape='time')
+        root.insert(1, variable)
+
+        compact_aggregation(root, 'time')
+
+        self.assertEqual(variable.find('values').attrib, {'start': '7305', 'increment': '1'})
+
+        expand_aggregation(root, 'time')
+
+        self.assertEqual(coord_values(root), values)
+        self.assertIs(root.find('variable'), variable)
+
+    def test_join_existing(self):
+        values = [f'{10957.0 + 2 * i},{10958.0 + 2 * i}' for i in range(50)]
+        root = aggregation(values)
+
+        self.assertFalse(compact_aggregation(root, 'time').compact)
+        self.assertEqual(coord_values(root), values)
+        self.assertIsNone(root.find('variable'))
+
+    def test_irregular(self):
+        values = [str(10957.5 + i * i) for i in range(50)]
+        root = aggregation(values, agg_type='joinNew')
+
+        self.assertFalse(compact_aggregation(root, 'time').compact)
+        self.assertEqual(coord_values(root), values)
+        self.assertFalse(expand_aggregation(root, 'time'))
+
+    def test_existing_aggregation(self):
+        root = aggregation([str(10957.5 + i) for i in range(50)], agg_type='joinNew')
+        compact_aggregation(root, 'time')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'agg.ncml')
+            ET.ElementTree(root).write(path)
+
+            existing = ExistingAggregation(path)
+
+        self.assertEqual(existing.coord_values['/neodc/001.nc'], ['10958.5'])
+        self.assertEqual(existing.attributes['id'], 'esacci.TEST')
+
+
+if __name__ == '__main__':
+    unittest.main()
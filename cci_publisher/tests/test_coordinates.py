@@ -0,0 +1,214 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from netCDF4 import Dataset
+from tds_utils.aggregation import CoordinatesError
+
+from cci_publisher.aggregation.base import CCIAggregationCreator, filename_date
+from cci_publisher.aggregation.cache import MetadataCache, cache_namespace, read_file_metadata
+
+UNITS = 'hours since 1990-01-01 00:00:00'
+
+# Hours from 1990-01-01 to 2000-01-01
+HOURS_2000 = 87648
+
+
+def write_file(path, hours=None, coverage=None, steps=1, **attributes):
+    with Dataset(path, 'w') as ds:
+        ds.setncatts(attributes)
+        ds.createDimension('time', steps)
+        if hours is not None:
+            time = ds.createVariable('time', 'f8', ('time',))
+            time.units = UNITS
+            time[:] = hours
+        if coverage:
+            ds.time_coverage_start, ds.time_coverage_end = coverage
+
+
+class TestFilenameDate(unittest.TestCase):
+
+    def test_filename_date(self):
+        self.assertEqual(filename_date('/neodc/20000102-ESACCI-L3C_SST.nc'),
+                         datetime(2000, 1, 2, tzinfo=timezone.utc))
+        self.assertEqual(filename_date('20000102063000-ESACCI-L2P.nc'),
+                         datetime(2000, 1, 2, 6, 30, tzinfo=timezone.utc))
+        self.assertEqual(filename_date('200003-ESACCI-L3S.nc'), datetime(2000, 3, 1, tzinfo=timezone.utc))
+        self.assertIsNone(filename_date('ESACCI-L4-20000102.nc'))
+        self.assertIsNone(filename_date('20001302-ESACCI-L3C.nc'))
+
+
+class TestCoordinateFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        # The first file has no time variable, but does have its time coverage
+        self.files = [self.path('20000101-ESACCI-TEST.nc'), self.path('20000102-ESACCI-TEST.nc')]
+        write_file(self.files[0], coverage=('20000101T000000Z', '20000101T235959Z'))
+        write_file(self.files[1])
+
+        for day in range(2, 5):
+            self.files.append(self.path(f'2000010{day + 1}-ESACCI-TEST.nc'))
+            write_file(self.files[-1], hours=HOURS_2000 + 24 * day + 12)
+
+        self.creator = CCIAggregationCreator('time')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, filename):
+        return os.path.join(self.tmpdir.name, filename)
+
+    def test_find_coordinate_units(self):
+        self.assertEqual(self.creator.find_coordinate_units(self.files), UNITS)
+        self.assertIsNone(self.creator.find_coordinate_units(self.files[:2]))
+
+        # Only the first files are tried
+        self.creator.FILENAME_SAMPLE_SIZE = 2
+        self.assertIsNone(self.creator.find_coordinate_units(self.files))
+
+    def test_derived_values(self):
+        self.creator.set_coordinate_units(UNITS)
+
+        with mock.patch.object(CCIAggregationCreator, 'get_global_attrs', return_value={}):
+            root = self.creator.create_aggregation('esacci.TEST', '', self.files, cache=True)
+
+        self.assertEqual(self.creator.derived_coordinates, set(self.files[:2]))
+
+        # The midpoint of the time coverage and the date in the filename
+        entries = root.find('aggregation').findall('netcdf')
+        self.assertAlmostEqual(float(entries[0].get('coordValue')), HOURS_2000 + 12 - 1 / 7200, places=6)
+        self.assertEqual(float(entries[1].get('coordValue')), HOURS_2000 + 24)
+        self.assertTrue(all(e.get('ncoords') == '1' for e in entries))
+
+    def test_several_steps(self):
+        write_file(self.files[1], steps=2)
+        self.creator.set_coordinate_units(UNITS)
+
+        with self.creator.dataset_reader_cls(self.files[1]) as reader:
+            self.assertRaises(CoordinatesError, reader.get_coord_values, 'time')
+
+
+class TestFilenameCoordinates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.creator = CCIAggregationCreator('time')
+        self.creator.FILENAME_SAMPLE_SIZE = 5
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_files(self, filenames, hours, **attributes):
+        files = []
+        for filename, value in zip(filenames, hours):
+            files.append(os.path.join(self.tmpdir.name, filename))
+            write_file(files[-1], hours=value, **attributes)
+        return files
+
+    def aggregate(self, files):
+        with mock.patch.object(CCIAggregationCreator, 'get_global_attrs', return_value={}):
+            root = self.creator.create_aggregation('esacci.TEST', '', files, cache=True)
+        return [entry.get('coordValue') for entry in root.find('aggregation').findall('netcdf')]
+
+    def test_daily(self):
+        # Midday on each day
+        files = self.make_files([f'200001{day + 1:02d}-ESACCI-TEST.nc' for day in range(30)],
+                                [HOURS_2000 + 24 * day + 12 for day in range(30)])
+        expected = self.aggregate(files)
+
+        self.creator = CCIAggregationCreator('time')
+        self.creator.FILENAME_SAMPLE_SIZE = 5
+        with mock.patch('cci_publisher.aggregation.base.read_file_metadata', wraps=read_file_metadata) as read:
+            self.assertTrue(self.creator.use_filename_coordinates(files, UNITS, seed=1))
+
+        # Only the sample, which includes the first and last files, is opened
+        sampled = {args[1] for args, _ in read.call_args_list}
+        self.assertEqual(len(sampled), 7)
+        self.assertTrue({files[0], files[-1]} <= sampled)
+
+        for filename in set(files) - sampled:
+            os.remove(filename)
+
+        self.assertEqual(self.aggregate(files), expected)
+
+    def test_sample_attributes(self):
+        files = self.make_files([f'200001{day + 1:02d}-ESACCI-TEST.nc' for day in range(30)],
+                                [HOURS_2000 + 24 * day + 12 for day in range(30)],
+                                platform='Envisat', title='Test')
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertTrue(self.creator.use_filename_coordinates(files, UNITS, seed=1))
+
+        self.assertIn('WARNING: platform removed from the aggregation as 23 files were not opened',
+                      stderr.getvalue())
+
+        # Files outside the sample do not repeat the sampled values
+        derived = [m.attributes for f, m in self.creator.known_metadata.items() if 'platform' not in m.attributes]
+        self.assertEqual(len(derived), 23)
+        self.assertTrue(all(attributes == {'title': 'Test'} for attributes in derived))
+
+        with mock.patch.object(CCIAggregationCreator, 'get_global_attrs', return_value={}):
+            root = self.creator.create_aggregation('esacci.TEST', '', files, cache=True)
+
+        self.assertEqual([e.get('name') for e in root.findall('remove')][-1], 'platform')
+        self.assertNotIn('platform', [e.get('name') for e in root.findall('attribute')])
+
+    def test_all_sampled(self):
+        files = self.make_files([f'200001{day + 1:02d}-ESACCI-TEST.nc' for day in range(5)],
+                                [HOURS_2000 + 24 * day + 12 for day in range(5)],
+                                platform='Envisat')
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertTrue(self.creator.use_filename_coordinates(files, UNITS, seed=1))
+
+        self.assertEqual(stderr.getvalue(), '')
+        self.assertEqual(self.creator.unaggregated_attrs, set())
+
+    def test_metadata_cache(self):
+        files = self.make_files([f'200001{day + 1:02d}-ESACCI-TEST.nc' for day in range(30)],
+                                [HOURS_2000 + 24 * day + 12 for day in range(30)],
+                                platform='Envisat')
+
+        with MetadataCache(os.path.join(self.tmpdir.name, 'cache.db')) as cache:
+            namespace = cache_namespace(self.creator.dataset_reader_cls, 'time')
+            for filename in files:
+                cache.put(filename, namespace, read_file_metadata(self.creator.dataset_reader_cls, filename, 'time'))
+
+            # Every file is cached, so every file has its platform
+            creator = CCIAggregationCreator('time', metadata_cache=cache)
+            self.assertFalse(creator.use_filename_coordinates(files, UNITS, seed=1))
+            self.assertEqual(creator.unaggregated_attrs, set())
+            self.assertTrue(all(m.attributes['platform'] == 'Envisat' for m in creator.known_metadata.values()))
+
+    def test_monthly(self):
+        # The middle of each month is not a fixed offset from the first day
+        lengths = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+        middles = [24 * (sum(lengths[:month]) + lengths[month] / 2) for month in range(12)]
+        files = self.make_files([f'2000{month + 1:02d}-ESACCI-TEST.nc' for month in range(12)],
+                                [HOURS_2000 + middle for middle in middles])
+
+        self.assertFalse(self.creator.use_filename_coordinates(files, UNITS, seed=1))
+
+        self.assertEqual(self.aggregate(files), [str(HOURS_2000 + middle) for middle in middles])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+
+from cci_publisher.publisher.cost import CostModel, RuntimeHistory, format_time
+from cci_publisher.publisher.tasks import PublishTask
+from cci_publisher.utils import DatasetStats
+
+
+def make_task(dataset_id, file_count, total_size=0, incremental=False):
+    return PublishTask(dataset_id, False, True, False, incremental, 1, False, DatasetStats(file_count, total_size), True)
+
+
+class TestCostModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = RuntimeHistory(os.path.join(self.tmpdir.name, 'history.jsonl'))
+        self.model = CostModel(overhead=10, seconds_per_file=1, seconds_per_gb=0, history=self.history)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_estimate(self):
+        self.assertEqual(self.model.estimate(make_task('a', 100)).seconds, 110)
+
+    def test_history_scaled_by_file_count(self):
+        self.model.record(make_task('a', 100), 50)
+
+        history = RuntimeHistory(self.history.path)
+        model = CostModel(overhead=10, seconds_per_file=1, seconds_per_gb=0, history=history)
+        self.assertEqual(model.estimate(make_task('a', 200)).seconds, 100)
+
+    def test_history_mode(self):
+        self.model.record(make_task('a', 100, incremental=True), 5)
+        self.assertEqual(self.model.estimate(make_task('a', 100, incremental=True)).seconds, 5)
+
+        # An incremental run says nothing about a full rebuild
+        self.assertEqual(self.model.estimate(make_task('a', 100)).seconds, 110)
+
+        # A full read is an upper bound for the other modes
+        self.model.record(make_task('b', 100), 50)
+        self.assertEqual(self.model.estimate(make_task('b', 100, incremental=True)).seconds, 50)
+
+    def test_history_without_mode(self):
+        with open(self.history.path, 'w') as writer:
+            writer.write('{"dataset_id": "a", "file_count": 100, "duration": 5}\n')
+
+        self.assertEqual(self.model.estimate(make_task('a', 100)).seconds, 110)
+
+    def test_history_compacted(self):
+        history = RuntimeHistory(self.history.path, max_bytes=1000)
+        for i in range(100):
+            history.record(f'dataset{i % 5}', i, i)
+
+        self.assertLessEqual(os.path.getsize(history.path), 1000)
+
+        history = RuntimeHistory(self.history.path)
+        self.assertEqual(history.get('dataset4'), (99, 99))
+        self.assertEqual(history.get('dataset0'), (95, 95))
+
+    def test_order(self):
+        tasks = [make_task('small', 1), make_task('large', 1000), make_task('medium', 10)]
+        self.assertEqual([task.dataset_id for task in self.model.order(tasks)], ['large', 'medium', 'small'])
+
+    def test_pack(self):
+        tasks = [make_task('large', 1000)] + [make_task(f'small{i}', 10) for i in range(10)]
+        batches = self.model.pack(tasks, target=60)
+
+        self.assertEqual(batches[0], [tasks[0]])
+        self.assertEqual(sorted(len(batch) for batch in batches[1:]), [1, 3, 3, 3])
+        self.assertCountEqual([task for batch in batches for task in batch], tasks)
+
+    def test_limits(self):
+        time_limit, memory = self.model.limits(make_task('a', 1000))
+        self.assertEqual(format_time(time_limit), '01:00:00')
+        self.assertEqual(memory, 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
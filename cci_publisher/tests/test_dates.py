@@ -0,0 +1,43 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import unittest
+
+from cci_publisher.aggregation.base import min_date, max_date, to_datetime64, VECTORISE_MIN_DATES
+
+
+def padded(dates):
+    """
+    Repeat the middle date so that the list is long enough to use numpy
+    """
+    return dates + [dates[len(dates) // 2]] * VECTORISE_MIN_DATES
+
+
+class TestDateReduction(unittest.TestCase):
+
+    def test_mixed_layouts(self):
+        dates = padded(['20000102T000000Z', '1999-12-31T23:59:59Z', '200001050000Z'])
+
+        self.assertIsNotNone(to_datetime64(dates))
+        self.assertEqual(min_date(dates), '19991231T235959Z')
+        self.assertEqual(max_date(dates), '20000105T000000Z')
+
+    def test_fallback(self):
+        dates = padded(['20000102T000000Z', '26-DEC-2016 00:00:00.000000', '20000101T000000Z'])
+
+        self.assertIsNone(to_datetime64(dates))
+        self.assertEqual(max_date(dates), '20161226T000000Z')
+
+    def test_invalid_date(self):
+        self.assertIsNone(to_datetime64(padded(['20001301T000000Z'])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import unittest
+from unittest import mock
+
+from cci_publisher.utils.drs_id_aggregation import AggregationFilterIndex, DRSAggregation
+
+FILTERS = {
+    '/neodc/esacci/cloud': [
+        {'pattern': r'esacci\.CLOUD\.mon\..*', 'wms': True},
+        {'pattern': r'esacci\.CLOUD\.(day|mon)\..*'},
+    ],
+    '/neodc/esacci/ozone': [
+        {'pattern': r'esacci\.OZONE\.(\w+)\.\1\..*'},
+        {'pattern': r'esacci\.OZONE\..*', 'wms': True},
+    ],
+}
+
+
+class Mappings:
+
+    def __init__(self):
+        self.lookups = 0
+
+    def get_aggregations(self, path):
+        self.lookups += 1
+        return FILTERS.get(path)
+
+
+class TestAggregationFilterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.mappings = Mappings()
+        self.index = AggregationFilterIndex(self.mappings)
+
+    def test_first_match_wins(self):
+        self.assertTrue(self.index.match('/neodc/esacci/cloud', 'esacci.CLOUD.mon.v3')['wms'])
+        self.assertNotIn('wms', self.index.match('/neodc/esacci/cloud', 'esacci.CLOUD.day.v3'))
+        self.assertIsNone(self.index.match('/neodc/esacci/cloud', 'esacci.CLOUD.yr.v3'))
+
+    def test_back_reference(self):
+        self.assertNotIn('wms', self.index.match('/neodc/esacci/ozone', 'esacci.OZONE.L3.L3.v1'))
+        self.assertTrue(self.index.match('/neodc/esacci/ozone', 'esacci.OZONE.L3.L4.v1')['wms'])
+
+    def test_path_without_filters(self):
+        self.assertIsNone(self.index.match('/neodc/esacci/sst', 'esacci.SST.day.v2'))
+
+    def test_lookup_once_per_path(self):
+        for _ in range(3):
+            self.index.match('/neodc/esacci/cloud', 'esacci.CLOUD.mon.v3')
+            self.index.match('/neodc/esacci/sst', 'esacci.SST.day.v2')
+
+        self.assertEqual(self.mappings.lookups, 2)
+
+
+class TestDRSAggregation(unittest.TestCase):
+
+    def test_mappings_without_save(self):
+        es = mock.Mock()
+        es.search.return_value = {'aggregations': {'drsid': {'buckets': [
+            {'key': {'drs': 'esacci.CLOUD.mon.v3', 'path': '/neodc/esacci/cloud'}},
+            {'key': {'drs': 'esacci.SST.day.v2', 'path': '/neodc/esacci/sst'}},
+        ]}}}
+
+        drs_ids = DRSAggregation('collections', es=es, mappings=Mappings()).get_aggregations()
+
+        self.assertEqual([drs.id for drs in drs_ids], ['esacci.CLOUD.mon.v3'])
+        self.assertTrue(drs_ids[0].wms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+
+from cci_publisher.aggregation.base import unique_strings
+from cci_publisher.aggregation.incremental import ExistingAggregation, spread_items, write_file_stats
+
+NCML = """<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+  <attribute name="time_coverage_duration" value="P1D"/>
+  <attribute name="time_coverage_start" value="20000101T000000Z"/>
+  <attribute name="time_coverage_end" value="20000102T235959Z"/>
+  <attribute name="start_time" value="20000101T000000Z"/>
+  <attribute name="stop_time" value="20000102T235959Z"/>
+  <attribute name="geospatial_lat_max" value="89.5"/>
+  <attribute name="platform" value="Envisat"/>
+  <attribute name="source" value="src A,src B"/>
+  <aggregation dimName="time" type="joinExisting">
+    <netcdf location="/neodc/a.nc" ncoords="1" coordValue="10957.0"/>
+    <netcdf location="/neodc/b.nc" ncoords="2" coordValue="10958.0,10958.5"/>
+  </aggregation>
+</netcdf>
+"""
+
+
+class TestExistingAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'agg.ncml')
+        with open(path, 'w') as writer:
+            writer.write(NCML)
+
+        self.existing = ExistingAggregation(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_coord_values(self):
+        self.assertEqual(self.existing.coord_values['/neodc/b.nc'], ['10958.0', '10958.5'])
+
+    def test_covers(self):
+        self.assertTrue(self.existing.covers(['/neodc/a.nc', '/neodc/b.nc', '/neodc/c.nc']))
+        self.assertFalse(self.existing.covers(['/neodc/b.nc', '/neodc/c.nc']))
+
+    def test_seed_attributes(self):
+        attributes = self.existing.seed_attributes()
+
+        self.assertEqual(attributes['geospatial_lat_max'], 89.5)
+        self.assertEqual(attributes['platform'], 'Envisat')
+        self.assertIn('start_time', attributes)
+        self.assertNotIn('time_coverage_start', attributes)
+        self.assertNotIn('time_coverage_duration', attributes)
+
+    def test_file_metadata_unique_strings(self):
+        metadata = self.existing.file_metadata('days since 1970-01-01')
+        sources = [m.attributes['source'] for m in metadata.values()]
+
+        self.assertEqual(unique_strings(sources + ['src A']), 'src A,src B')
+        self.assertEqual(unique_strings(sources + ['src C']), 'src A,src B,src C')
+
+    def test_spread_items(self):
+        self.assertEqual(spread_items('one,two', 3), ['one', 'two', 'one'])
+        self.assertEqual(spread_items('one,two,three', 2), ['one,three', 'two'])
+        self.assertEqual(spread_items('one', 2), ['one', 'one'])
+
+    def test_changed_files(self):
+        # Neither file exists
+        self.assertEqual(sorted(self.existing.changed_files()), ['/neodc/a.nc', '/neodc/b.nc'])
+
+        location = os.path.join(self.tmpdir.name, 'a.nc')
+        with open(location, 'w') as writer:
+            writer.write('original')
+        os.utime(location, ns=(10 ** 18, 10 ** 18))
+        self.existing.coord_values = {location: ['10957.0']}
+
+        # No stats written with the NcML
+        self.assertEqual(self.existing.changed_files(), [location])
+
+        write_file_stats(self.existing.path, [location])
+        self.assertEqual(self.existing.changed_files(), [])
+
+    def test_replaced_file_keeps_mtime(self):
+        location = os.path.join(self.tmpdir.name, 'a.nc')
+        with open(location, 'w') as writer:
+            writer.write('original')
+        os.utime(location, ns=(10 ** 18, 10 ** 18))
+
+        write_file_stats(self.existing.path, [location])
+        self.existing.coord_values = {location: ['10957.0']}
+
+        # Replaced as by rsync -a, in a catalog checked out after the file was written
+        with open(location, 'w') as writer:
+            writer.write('reprocessed')
+        os.utime(location, ns=(10 ** 18, 10 ** 18))
+        os.utime(self.existing.path)
+
+        self.assertGreater(os.stat(self.existing.path).st_mtime_ns, os.stat(location).st_mtime_ns)
+        self.assertEqual(self.existing.changed_files(), [location])
+
+if __name__ == '__main__':
+    unittest.main()
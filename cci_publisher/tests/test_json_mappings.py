@@ -0,0 +1,93 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cci_publisher.utils.json_mappings import MappingsSnapshot, json_tagger_root
+
+FILTERS = [{'pattern': r'esacci\.CLOUD\..*', 'wms': True}]
+
+
+class Mappings:
+
+    def get_aggregations(self, path):
+        return FILTERS if path == '/neodc/esacci/cloud' else []
+
+
+class TestMappingsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, 'json')
+        os.mkdir(self.root)
+        self._write_json('{}')
+
+        self.path = os.path.join(self.tmpdir.name, 'snapshot.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_json(self, content):
+        with open(os.path.join(self.root, 'cloud.json'), 'w') as writer:
+            writer.write(content)
+
+    def _snapshot(self):
+        snapshot = MappingsSnapshot(self.path, root=self.root)
+        snapshot._mappings = Mappings()
+        snapshot.get_aggregations('/neodc/esacci/cloud')
+        snapshot.get_aggregations('/neodc/esacci/sst')
+        snapshot.save()
+
+    def test_reload(self):
+        self._snapshot()
+
+        snapshot = MappingsSnapshot(self.path, root=self.root)
+        self.assertEqual(snapshot.get_aggregations('/neodc/esacci/cloud'), FILTERS)
+        self.assertIsNone(snapshot.get_aggregations('/neodc/esacci/sst'))
+
+        # Answered from the snapshot without loading the JSON tree
+        self.assertIsNone(snapshot._mappings)
+
+    def test_invalidated_by_change(self):
+        self._snapshot()
+        self._write_json('{"aggregations": []}')
+
+        snapshot = MappingsSnapshot(self.path, root=self.root)
+        self.assertEqual(snapshot.aggregations, {})
+
+    def test_no_json_files(self):
+        os.remove(os.path.join(self.root, 'cloud.json'))
+
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            snapshot = MappingsSnapshot(self.path, root=self.root)
+        self.assertIn('Not using the JSON mappings snapshot', stderr.getvalue())
+        self.assertIsNone(snapshot.key)
+
+        # Paths are loaded directly and nothing is saved
+        snapshot._mappings = Mappings()
+        self.assertEqual(snapshot.get_aggregations('/neodc/esacci/cloud'), FILTERS)
+        snapshot.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_root(self):
+        with mock.patch.dict(os.environ, {'JSON_TAGGER_ROOT': self.root}):
+            self.assertEqual(json_tagger_root(), self.root)
+
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(json_tagger_root())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from netCDF4 import Dataset
+from tds_utils.aggregation import NetcdfDatasetReader
+
+from cci_publisher.aggregation.cache import MetadataCache, cached_reader, cache_namespace, read_file_metadata, \
+    prefetch_metadata
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.nc_file = os.path.join(self.tmpdir.name, '20000101-TEST.nc')
+
+        with Dataset(self.nc_file, 'w') as ds:
+            ds.createDimension('time', None)
+            time = ds.createVariable('time', 'f4', ('time',))
+            time.units = 'days since 1970-01-01'
+            time[:] = [10957.5]
+            ds.platform = 'Envisat'
+            ds.geospatial_lat_max = np.float32(89.9)
+
+        self.namespace = cache_namespace(NetcdfDatasetReader, 'time')
+        self.cache = MetadataCache(os.path.join(self.tmpdir.name, 'cache.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        metadata = read_file_metadata(NetcdfDatasetReader, self.nc_file, 'time')
+        self.cache.put(self.nc_file, self.namespace, metadata)
+
+        cached = self.cache.get(self.nc_file, self.namespace)
+
+        self.assertEqual(cached.units, metadata.units)
+        self.assertEqual(cached.values.dtype, metadata.values.dtype)
+        self.assertEqual(str(cached.attributes['geospatial_lat_max']),
+                         str(metadata.attributes['geospatial_lat_max']))
+        self.assertEqual(cached.attributes['platform'], 'Envisat')
+
+    def test_changed_file_is_invalidated(self):
+        metadata = read_file_metadata(NetcdfDatasetReader, self.nc_file, 'time')
+        self.cache.put(self.nc_file, self.namespace, metadata)
+
+        stat = os.stat(self.nc_file)
+        os.utime(self.nc_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertIsNone(self.cache.get(self.nc_file, self.namespace))
+
+    def test_cached_reader_only_opens_once(self):
+        reader_cls = cached_reader(NetcdfDatasetReader, 'time', self.cache)
+
+        with mock.patch('cci_publisher.aggregation.cache.read_file_metadata',
+                        wraps=read_file_metadata) as read:
+            for _ in range(2):
+                with reader_cls(self.nc_file) as reader:
+                    units, values = reader.get_coord_values('time')
+                    self.assertEqual(reader.ds.platform, 'Envisat')
+
+            self.assertEqual(read.call_count, 1)
+
+        self.assertEqual(units, 'days since 1970-01-01')
+        self.assertEqual(list(values), [10957.5])
+
+
+    def test_prune(self):
+        metadata = read_file_metadata(NetcdfDatasetReader, self.nc_file, 'time')
+        self.cache.put(self.nc_file, self.namespace, metadata)
+
+        self.assertEqual(self.cache.prune(), 0)
+
+        os.rename(self.nc_file, self.nc_file + '.old')
+        self.assertEqual(self.cache.prune('/other'), 0)
+        self.assertEqual(self.cache.prune(self.tmpdir.name), 1)
+
+        os.rename(self.nc_file + '.old', self.nc_file)
+        self.assertIsNone(self.cache.get(self.nc_file, self.namespace))
+
+    def test_visible_to_other_connections(self):
+        metadata = read_file_metadata(NetcdfDatasetReader, self.nc_file, 'time')
+        self.cache.put(self.nc_file, self.namespace, metadata)
+
+        with MetadataCache(self.cache.path) as other:
+            self.assertIsNotNone(other.get(self.nc_file, self.namespace))
+
+
+class TestPrefetchMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = []
+
+        for day in range(6):
+            path = os.path.join(self.tmpdir.name, f'2000010{day + 1}-TEST.nc')
+            with Dataset(path, 'w') as ds:
+                ds.createDimension('time', None)
+                time = ds.createVariable('time', 'f8', ('time',))
+                time.units = 'days since 1970-01-01'
+                time[:] = [10957.5 + day]
+                ds.platform = f'Platform{day % 2}'
+                ds.geospatial_lat_max = np.float32(89.9 - day)
+            self.files.append(path)
+
+        self.expected = {path: read_file_metadata(NetcdfDatasetReader, path, 'time') for path in self.files}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertMatches(self, metadata):
+        self.assertEqual(list(metadata), self.files)
+
+        for path, expected in self.expected.items():
+            self.assertEqual(metadata[path].units, expected.units)
+            np.testing.assert_array_equal(metadata[path].values, expected.values)
+            self.assertEqual(metadata[path].attributes['platform'], expected.attributes['platform'])
+            self.assertEqual(metadata[path].attributes['geospatial_lat_max'],
+                             expected.attributes['geospatial_lat_max'])
+
+    def test_processes(self):
+        self.assertMatches(prefetch_metadata(NetcdfDatasetReader, 'time', self.files, workers=3))
+
+    def test_threads_with_cache(self):
+        with MetadataCache(os.path.join(self.tmpdir.name, 'cache.db')) as cache:
+            first = prefetch_metadata(NetcdfDatasetReader, 'time', self.files, workers=3,
+                                      use_threads=True, cache=cache)
+
+            with mock.patch('cci_publisher.aggregation.cache.ProcessPoolExecutor') as executor:
+                second = prefetch_metadata(NetcdfDatasetReader, 'time', self.files, workers=3,
+                                           use_threads=True, cache=cache)
+                executor.assert_not_called()
+
+        self.assertMatches(first)
+        self.assertMatches(second)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+from configparser import ConfigParser
+
+from cci_publisher.state_store import SQLiteStateStore
+from cci_publisher.utils import get_state_store
+
+
+class TestSQLiteStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SQLiteStateStore(os.path.join(self.tmpdir.name, 'state.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_has_updated(self):
+        self.assertTrue(self.store.has_updated('a.b', 10, True, True))
+
+        self.store.add_row('a.b', 10, True, True)
+
+        self.assertFalse(self.store.has_updated('a.b', 10, True, True))
+        self.assertTrue(self.store.has_updated('a.b', 12, True, False))
+
+    def test_delete_row(self):
+        self.store.add_row('a.b', 10, True, True)
+
+        self.store.delete_row('a.b')
+
+        self.assertIsNone(self.store.get_dataset('a.b'))
+
+    def test_fingerprint(self):
+        self.store.update('a.h', 10, True, True, 'abc')
+
+        self.assertFalse(self.store.has_updated('a.h', 10, True, True, 'abc'))
+        self.assertTrue(self.store.has_updated('a.h', 10, True, True, 'def'))
+
+    def test_has_updated_many_backfill(self):
+        self.store.update_many([('a.e', 10, True, True, 'abc'), ('a.i', 10, True, False, None)])
+
+        has_updated = self.store.has_updated_many([
+            ('a.e', 10, True, True, 'abc'), ('a.f', 10, True, True, 'abc'), ('a.i', 10, True, False, 'abc')
+        ])
+
+        self.assertEqual(has_updated, {'a.e': False, 'a.f': True, 'a.i': False})
+        self.assertEqual(self.store.get_dataset('a.i').fingerprint, 'abc')
+        self.assertIs(self.store.get_dataset('a.i').wms, False)
+
+    def test_get_datasets_chunked(self):
+        rows = [(f'a.{i}', i, True, False, None) for i in range(self.store.CHUNK_SIZE + 10)]
+        self.store.update_many(rows)
+
+        states = self.store.get_datasets([row[0] for row in rows] + ['missing'])
+
+        self.assertEqual(len(states), len(rows) + 1)
+        self.assertEqual(states[rows[-1][0]].file_count, rows[-1][1])
+        self.assertIsNone(states['missing'])
+
+    def test_preload(self):
+        self.store.add_row('a.g', 10, True, True)
+        self.store.preload(['a.g'])
+
+        self.store.update('a.g', 12, True, True)
+
+        self.assertEqual(self.store.get_dataset('a.g').file_count, 12)
+
+    def test_clear_unused(self):
+        self.store.update_many([('a.g', 10, True, True, None)])
+
+        self.store.clear_unused(['a.g', 'does.not.exist'])
+
+        self.assertIsNone(self.store.get_dataset('a.g'))
+
+    def test_mirror(self):
+        target = SQLiteStateStore(os.path.join(self.tmpdir.name, 'target.sqlite'))
+        target.update_many([('a.old', 1, True, True, None), ('a.b', 1, True, True, None)])
+
+        self.store.update_many([('a.b', 10, True, False, 'abc'), ('a.c', 5, False, False, None)])
+
+        self.assertEqual(self.store.mirror(target), (2, 1))
+        self.assertEqual(sorted(target.rows()), sorted(self.store.rows()))
+
+        target.close()
+
+    def test_get_state_store(self):
+        conf = ConfigParser()
+        conf.read_dict({'state_store': {'backend': 'sqlite', 'path': self.store.path}})
+        self.store.add_row('a.b', 10, True, True)
+
+        store = get_state_store(conf)
+
+        self.assertIsInstance(store, SQLiteStateStore)
+        self.assertTrue(store.get_dataset('a.b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,10 @@ __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
 import unittest
+from unittest import mock
+
+from elasticsearch.helpers import BulkIndexError
+
 from cci_publisher.state_store.state_store import StateStore
 
 TEST_INDEX = 'opensearch-aggregation-state-test'
@@ -61,6 +65,62 @@ class TestStateStore(unittest.TestCase):
 
         self.assertFalse(self.store.get_dataset('a.b'))
 
+    def test_update_many(self):
+        self.store.update_many([('a.c', 10, True, True, None), ('a.d', 5, True, False, None)])
+
+        self.assertTrue(self.store.get_dataset('a.c'))
+        self.assertTrue(self.store.get_dataset('a.d'))
+
+    def test_has_updated_many(self):
+        self.store.update_many([('a.e', 10, True, True, 'abc')])
+
+        has_updated = self.store.has_updated_many([('a.e', 10, True, True, 'abc'), ('a.f', 10, True, True, 'abc')])
+
+        self.assertEqual(has_updated, {'a.e': False, 'a.f': True})
+
+    def test_fingerprint(self):
+        self.store.update('a.h', 10, True, True, 'abc')
+
+        self.assertFalse(self.store.has_updated('a.h', 10, True, True, 'abc'))
+        self.assertTrue(self.store.has_updated('a.h', 10, True, True, 'def'))
+
+    def test_has_updated_many_backfill(self):
+        self.store.update_many([('a.i', 10, True, True, None)])
+
+        has_updated = self.store.has_updated_many([('a.i', 10, True, True, 'abc')])
+
+        self.assertEqual(has_updated, {'a.i': False})
+        self.assertEqual(self.store.get_dataset('a.i').fingerprint, 'abc')
+
+    def test_clear_unused(self):
+        self.store.update_many([('a.g', 10, True, True, None)])
+
+        self.store.clear_unused(['a.g', 'does.not.exist'])
+
+        self.assertFalse(self.store.get_dataset('a.g'))
+
+
+class TestClearUnusedErrors(unittest.TestCase):
+
+    def setUp(self):
+        self.store = StateStore(index=TEST_INDEX, session=mock.Mock())
+
+    def test_not_found_ignored(self):
+        errors = [{'delete': {'_id': 'x', 'status': 404, 'result': 'not_found'}}]
+        with mock.patch('cci_publisher.state_store.state_store.bulk', return_value=(1, errors)):
+            self.store.clear_unused(['a.g', 'does.not.exist'])
+
+    def test_other_errors_raised(self):
+        errors = [
+            {'delete': {'_id': 'x', 'status': 404, 'result': 'not_found'}},
+            {'delete': {'_id': 'y', 'status': 429, 'error': {'type': 'es_rejected_execution_exception'}}},
+        ]
+        with mock.patch('cci_publisher.state_store.state_store.bulk', return_value=(0, errors)):
+            with self.assertRaises(BulkIndexError) as cm:
+                self.store.clear_unused(['a.g', 'a.h'])
+
+        self.assertEqual(cm.exception.errors, errors[1:])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from netCDF4 import Dataset
+
+from cci_publisher.aggregation.aerosol import CCIAerosolAggregationCreator
+from cci_publisher.aggregation.base import CCIAggregationCreator
+from cci_publisher.datasets.threddsdataset import NcMLStreamWriter, ThreddsXMLBase
+
+GLOBAL_ATTRS = {'history': 'test', 'id': 'esacci.TEST', 'tracking_id': '0', 'date_created': '20000101T000000Z'}
+
+N_FILES = 12
+
+
+def write_file(path, i, aerosol=False, irregular=False):
+    with Dataset(path, 'w') as ds:
+        if not aerosol:
+            ds.createDimension('time', None)
+            time = ds.createVariable('time', 'f8', ('time',))
+            time.units = 'days since 1970-01-01 00:00:00'
+            time[:] = [10957.5 + i * (i if irregular else 1)]
+
+        ds.platform = ['Envisat', 'ERS-2', 'Envisat,Terra'][i % 3]
+        ds.sensor = 'AATSR'
+        ds.source = ['AATSR L1b', 'ATSR-2 L1b'][i // 7]
+        ds.time_coverage_start = f'200001{i + 1:02d}T000000Z'
+        ds.time_coverage_end = f'200001{i + 1:02d}T235959Z'
+        ds.geospatial_lat_min = -80. - i
+        ds.geospatial_lat_max = 80. + (i % 5)
+        ds.geospatial_lon_min = -180.
+        ds.geospatial_lon_max = 180.
+
+
+class TestStreamingAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_files(self, aerosol, irregular):
+        files = []
+        for i in range(N_FILES):
+            path = os.path.join(self.tmpdir.name, f'200001{i + 1:02d}-ESACCI-TEST.nc')
+            write_file(path, i, aerosol, irregular)
+            files.append(path)
+        return files
+
+    def compare(self, creator_cls, aerosol=False, irregular=False):
+        files = self.make_files(aerosol, irregular)
+
+        with mock.patch.object(creator_cls, 'get_global_attrs', return_value=GLOBAL_ATTRS):
+            in_memory = ThreddsXMLBase()
+            in_memory.set_root(creator_cls('time').create_aggregation('esacci.TEST', '', files, cache=True))
+            expected = os.path.join(self.tmpdir.name, 'expected.ncml')
+            in_memory.write(expected)
+
+            creator = creator_cls('time')
+            creator.STREAM_CHUNK_SIZE = 5
+            streamed = os.path.join(self.tmpdir.name, 'streamed', 'agg.ncml')
+            creator.write_aggregation('esacci.TEST', '', list(reversed(files)), NcMLStreamWriter(streamed), cache=True)
+
+        with open(expected) as reader:
+            expected_ncml = reader.read()
+        with open(streamed) as reader:
+            streamed_ncml = reader.read()
+
+        self.assertEqual(streamed_ncml, expected_ncml)
+        self.assertEqual(os.listdir(os.path.dirname(streamed)), ['agg.ncml'])
+        # Only the regular axis of a joinNew aggregation is written as a start and increment
+        self.assertEqual('coordValue' in streamed_ncml, irregular or not aerosol)
+
+    def test_time_aggregation(self):
+        self.compare(CCIAggregationCreator)
+
+    def test_irregular_time_aggregation(self):
+        self.compare(CCIAggregationCreator, irregular=True)
+
+    def test_aerosol_aggregation(self):
+        self.compare(CCIAerosolAggregationCreator, aerosol=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
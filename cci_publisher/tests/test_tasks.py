@@ -0,0 +1,232 @@
+# encoding: utf-8
+"""
+
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+
+from cci_publisher.publisher.cci_publisher import CCIPublisher
+from cci_publisher.publisher.executors import LocalProcessExecutor, SerialExecutor
+from cci_publisher.publisher.tasks import PublishTask, TaskResult, write_manifest, read_manifest_batch
+from cci_publisher.utils import DatasetStats, DRSAggregationInfo
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'manifest.jsonl')
+
+        self.tasks = [
+            PublishTask(f'esacci.TEST.{i}', False, True, False, False, 1, False, DatasetStats(i, 100 * i), True)
+            for i in range(3)
+        ]
+        write_manifest([self.tasks[:2], self.tasks[2:]], self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_batch(self):
+        self.assertEqual(read_manifest_batch(self.path, 0), self.tasks[:2])
+        self.assertEqual(read_manifest_batch(self.path, 1), self.tasks[2:])
+
+    def test_index_out_of_range(self):
+        with self.assertRaises(IndexError):
+            read_manifest_batch(self.path, 2)
+
+
+class TestGetExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        conf = ConfigParser()
+        conf.read_dict({'state_store': {'backend': 'sqlite', 'path': os.path.join(self.tmpdir.name, 'state.sqlite')}})
+
+        args = argparse.Namespace(lotus=False, executor='serial')
+        self.publisher = CCIPublisher(args, [], config=conf)
+
+    def tearDown(self):
+        self.publisher.state.close()
+        self.tmpdir.cleanup()
+
+    def test_sqlite_serial(self):
+        self.assertIsInstance(self.publisher.get_executor(), SerialExecutor)
+
+    def test_sqlite_slurm(self):
+        self.publisher.args.lotus = True
+        with self.assertRaises(ValueError):
+            self.publisher.get_executor()
+
+        self.publisher.args.lotus = False
+        self.publisher.args.executor = 'slurm'
+        with self.assertRaises(ValueError):
+            self.publisher.get_executor()
+
+
+class TestSerialExecutor(unittest.TestCase):
+
+    def test_failure(self):
+        tasks = [
+            PublishTask(f'esacci.TEST.{i}', False, True, False, False, 1, False, DatasetStats(i, 100 * i), True)
+            for i in range(3)
+        ]
+
+        def publish(task, conf, state):
+            if task.dataset_id == 'esacci.TEST.1':
+                raise RuntimeError('failed')
+            return TaskResult(task.dataset_id, True, (task.dataset_id, 1, True, False, None), None, 0)
+
+        with mock.patch('cci_publisher.publisher.executors.publish_task', publish):
+            results = list(SerialExecutor(None, None).run(tasks))
+
+        self.assertEqual([r.success for r in results], [True, False, True])
+        self.assertIn('RuntimeError: failed', results[1].error)
+        self.assertEqual(results[1].dataset_id, 'esacci.TEST.1')
+
+
+def publish_in_child(task, conf):
+    """
+    Stand in for publish_task in the children of LocalProcessExecutor. The
+    number in the dataset ID says what to do.
+    """
+    number = int(task.dataset_id.split('.')[-1])
+
+    if number == 1:
+        raise RuntimeError('failed')
+
+    if number == 2:
+        # Start a process of its own, as the pool of file readers does, then hang
+        with subprocess.Popen(['sleep', '60']) as sleep:
+            with open(os.path.join(conf, 'pid'), 'w') as writer:
+                writer.write(str(sleep.pid))
+            time.sleep(60)
+
+    if number == 3:
+        time.sleep(1)
+
+    return TaskResult(task.dataset_id, True, None, None, 0)
+
+
+def is_running(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as reader:
+            # Zombies are only waiting for their parent to collect them
+            return reader.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+class TestLocalProcessExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        patcher = mock.patch('cci_publisher.publisher.executors.publish_task', publish_in_child)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_tasks(self, numbers, **kwargs):
+        tasks = [
+            PublishTask(f'esacci.TEST.{i}', False, True, False, False, 1, False, DatasetStats(i, 100 * i), True)
+            for i in numbers
+        ]
+        executor = LocalProcessExecutor(self.tmpdir.name, **kwargs)
+        executor.POLL_INTERVAL = 0.1
+        return list(executor.run(tasks))
+
+    def test_failure(self):
+        results = self.run_tasks([0, 1, 4], processes=1)
+
+        self.assertEqual([(r.dataset_id, r.success) for r in results],
+                         [('esacci.TEST.0', True), ('esacci.TEST.1', False), ('esacci.TEST.4', True)])
+        self.assertIn('RuntimeError: failed', results[1].error)
+
+    def test_out_of_order(self):
+        results = self.run_tasks([3, 0], processes=2)
+
+        self.assertEqual([r.dataset_id for r in results], ['esacci.TEST.0', 'esacci.TEST.3'])
+        self.assertTrue(all(r.success for r in results))
+
+    def test_timeout(self):
+        start = time.time()
+        results = self.run_tasks([2, 0], processes=2, timeout=2)
+
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual([(r.dataset_id, r.success) for r in results],
+                         [('esacci.TEST.0', True), ('esacci.TEST.2', False)])
+        self.assertIn('Timed out', results[1].error)
+
+        # The process started by the task is stopped with it
+        with open(os.path.join(self.tmpdir.name, 'pid')) as reader:
+            pid = int(reader.read())
+
+        deadline = time.time() + 5
+        while is_running(pid) and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertFalse(is_running(pid))
+
+
+class TestUnpublish(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        conf = ConfigParser()
+        conf.read_dict({
+            'state_store': {'backend': 'sqlite', 'path': os.path.join(self.tmpdir.name, 'state.sqlite')},
+            'output': {'thredds_catalog_repo_path': self.tmpdir.name}
+        })
+
+        datasets_dir = os.path.join(self.tmpdir.name, 'data', 'catalog', 'datasets')
+        os.makedirs(datasets_dir)
+        for i in range(4):
+            with open(os.path.join(datasets_dir, f'esacci.TEST.{i}.xml'), 'w'):
+                pass
+
+        self.args = argparse.Namespace(datasets='all', force_unpublish=False)
+        self.conf = conf
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def unpublish(self, dataset_ids):
+        publisher = CCIPublisher(self.args, [DRSAggregationInfo(i) for i in dataset_ids], config=self.conf)
+
+        with mock.patch('cci_publisher.publisher.cci_publisher.DRSDataset') as dataset:
+            publisher.unpublish_datasets()
+
+        publisher.state.close()
+        return sorted(call[0][0] for call in dataset.call_args_list)
+
+    def test_catalog_dir(self):
+        deleted = self.unpublish(['esacci.TEST.0', 'esacci.TEST.1', 'esacci.TEST.2'])
+        self.assertEqual(deleted, ['esacci.TEST.3'])
+
+    def test_refuse_empty(self):
+        self.assertEqual(self.unpublish([]), [])
+
+    def test_refuse_partial(self):
+        self.assertEqual(self.unpublish(['esacci.TEST.0']), [])
+
+        self.args.force_unpublish = True
+        self.assertEqual(self.unpublish(['esacci.TEST.0']), ['esacci.TEST.1', 'esacci.TEST.2', 'esacci.TEST.3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,12 +8,17 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from cci_publisher.state_store.state_store import StateStore
+from cci_publisher.state_store import StateStore, SQLiteStateStore
 import argparse
 import pathlib
+from .es import get_es_client, set_es_client
 from .drs_id_aggregation import DRSAggregation, DRSAggregationInfo
+from .json_mappings import MappingsSnapshot, get_mappings_snapshot
+from .inventory import DatasetInventory, DatasetStats, EMPTY_STATS
 import os
 
+DEFAULT_STATE_DB = os.path.join(os.path.expanduser('~'), '.cache', 'cci_publisher', 'state.sqlite')
+
 
 def write_catalog(catalog, output_path):
     """
@@ -61,14 +66,29 @@ def get_all_catalog_files(catalog_dir):
     return path.glob('esacci*.xml')
 
 
-def get_state_store(config):
+def get_state_store(config, backend=None):
     """
-    Initialise the StateStore
+    Initialise the state store. The backend is set by the backend option in
+    the state_store section of the config:
+
+    - elasticsearch - StateStore using the state_index (default)
+    - sqlite        - SQLiteStateStore using the database at path
+
+    The sqlite backend is only for runs on a single host. SLURM array tasks
+    write to the state store from the compute nodes, so cannot use it.
 
     :param config: ConfigParser config object
-    :return: StateStore instance
+    :param backend: Overrides the backend in the config
+    :return: StateStore | SQLiteStateStore instance
     """
+    backend = backend or config.get('state_store', 'backend', fallback='elasticsearch')
+
+    if backend == 'sqlite':
+        path = config.get('state_store', 'path', fallback=DEFAULT_STATE_DB)
+        return SQLiteStateStore(os.path.expanduser(path))
+
+    if backend == 'elasticsearch':
+        index = config.get('elasticsearch', 'state_index')
+        return StateStore(index=index, session=get_es_client(config))
 
-    index = config.get('elasticsearch', 'state_index')
-    api_key = config.get('elasticsearch', 'api_key')
-    return StateStore(index=index, headers={'x-api-key': api_key})
\ No newline at end of file
+    raise ValueError(f'Unknown state store backend: {backend}')
\ No newline at end of file
@@ -8,8 +8,8 @@ __copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
 __license__ = 'BSD - see LICENSE file in top-level package directory'
 __contact__ = 'richard.d.smith@stfc.ac.uk'
 
-from ceda_elasticsearch_tools.elasticsearch import CEDAElasticsearchClient
-from json_tagger import DatasetJSONMappings
+from .es import get_es_client
+from .json_mappings import get_mappings_snapshot
 import re
 
 
@@ -17,21 +17,141 @@ class DRSAggregationInfo:
     """
     Container class to hold and represent the DRS Aggregation information
     """
-    def __init__(self, id, aggregate=True, wms=False):
+    def __init__(self, id, aggregate=True, wms=False, filename_dates=False):
         self.id = id
         self.aggregate = aggregate
         self.wms = wms
+        self.filename_dates = filename_dates
 
     def __repr__(self):
         return self.id
 
+class AggregationFilterIndex:
+    """
+    Matches DRS IDs against the aggregation filters for their dataset path.
+
+    The filters are looked up once per path and the patterns in them are
+    compiled once per distinct set of filters. Where possible, the patterns
+    are combined into a single alternation so that each DRS ID is matched in
+    one pass. The first filter to match wins, as with matching each pattern
+    in turn.
+    """
+
+    # Patterns with back references or named groups cannot be combined as
+    # combining them changes the group numbering
+    UNSAFE_TO_COMBINE = re.compile(r'\\[1-9]|\(\?P[<=]')
+
+    def __init__(self, mappings):
+        """
+        :param mappings: Object with a get_aggregations(path) method which
+                         returns the aggregation filters for a dataset path,
+                         e.g. DatasetJSONMappings
+        """
+        self.mappings = mappings
+
+        # Matcher for each path
+        self._paths = {}
+
+        # Matcher for each tuple of patterns
+        self._matchers = {}
+
+    def _compile(self, patterns):
+        """
+        Build a function which returns the index of the first pattern to
+        match a string, or None
+
+        :param patterns: tuple of regular expressions
+        :return: function
+        """
+        compiled = [re.compile(pattern) for pattern in patterns]
+
+        def match_each(drs_id):
+            for i, regex in enumerate(compiled):
+                if regex.match(drs_id):
+                    return i
+
+        if len(compiled) < 2 or any(self.UNSAFE_TO_COMBINE.search(pattern) for pattern in patterns):
+            return match_each
+
+        # Each alternative is followed by an empty marker group. The marker
+        # is the last group to close, so lastindex identifies the filter.
+        markers = {}
+        group = 0
+        for i, regex in enumerate(compiled):
+            group += regex.groups + 1
+            markers[group] = i
+
+        try:
+            combined = re.compile('|'.join(f'(?:{pattern})()' for pattern in patterns))
+        except re.error:
+            # e.g. global flags which are only allowed at the start
+            return match_each
+
+        def match_combined(drs_id):
+            m = combined.match(drs_id)
+            if m:
+                return markers[m.lastindex]
+
+        return match_combined
+
+    def _get_matcher(self, path):
+        """
+        Get the filters and matcher for a dataset path
+
+        :param path: Dataset path
+        :return: (filters, matcher) or None if the path is not aggregated
+        """
+        if path not in self._paths:
+            filters = self.mappings.get_aggregations(path)
+
+            if not filters:
+                self._paths[path] = None
+            else:
+                patterns = tuple(filter['pattern'] for filter in filters)
+                if patterns not in self._matchers:
+                    self._matchers[patterns] = self._compile(patterns)
+
+                self._paths[path] = (filters, self._matchers[patterns])
+
+        return self._paths[path]
+
+    def match(self, path, drs_id):
+        """
+        Find the aggregation filter for a DRS ID
+
+        :param path: Dataset path
+        :param drs_id: DRS ID
+        :return: The first filter which matches or None
+        :rtype: dict
+        """
+        matcher = self._get_matcher(path)
+        if not matcher:
+            return None
+
+        filters, match = matcher
+        index = match(drs_id)
+
+        if index is not None:
+            return filters[index]
+
+
 class DRSAggregation:
     """
     Generates a list of DRS IDs from the OpenSearch collections index.
     """
 
-    def __init__(self, index):
-        self.es = CEDAElasticsearchClient()
+    # Buckets per page
+    PAGE_SIZE = 1000
+
+    def __init__(self, index, es=None, mappings=None):
+        """
+        :param index: Collections index
+        :param es: Elasticsearch client. Defaults to the shared client.
+        :param mappings: MappingsSnapshot, or anything else with get_aggregations(path)
+                         such as DatasetJSONMappings. Defaults to the snapshot
+                         in the default location.
+        """
+        self.es = es if es is not None else get_es_client()
         self.query = {
             "query": {
                 "term": {"is_published": "true"}
@@ -40,6 +160,7 @@ class DRSAggregation:
             "aggs": {
                 "drsid": {
                     "composite": {
+                        "size": self.PAGE_SIZE,
                         "sources": [
                             {
                                 "drs": {
@@ -64,7 +185,8 @@ class DRSAggregation:
         self.drs_ids = []
         self.page = None
         self.index = index
-        self.dataset_json = DatasetJSONMappings()
+        self.dataset_json = mappings if mappings is not None else get_mappings_snapshot()
+        self.filter_index = AggregationFilterIndex(self.dataset_json)
 
     def _add_after_key(self, after_key):
         """
@@ -91,22 +213,17 @@ class DRSAggregation:
             id = bucket['key']['drs']
             path = bucket['key']['path']
 
-            aggregation_filters = self.dataset_json.get_aggregations(path)
+            # None if intent to aggregate not specified in JSON files, or no pattern matches
+            filter = self.filter_index.match(path, id)
 
-            # Move on if intent to aggregate not specified in JSON files
-            if not aggregation_filters:
-                continue
-
-            for filter in aggregation_filters:
-                m = re.match(filter['pattern'], id)
-                if m:
-                    ids_to_aggregate.append(
-                        DRSAggregationInfo(
-                            id=id,
-                            wms=filter.get('wms', False)
-                        )
+            if filter:
+                ids_to_aggregate.append(
+                    DRSAggregationInfo(
+                        id=id,
+                        wms=filter.get('wms', False),
+                        filename_dates=filter.get('filename_dates', False)
                     )
-                    break
+                )
 
         self.drs_ids.extend(ids_to_aggregate)
 
@@ -142,4 +259,10 @@ class DRSAggregation:
             self._scroll_aggregations()
             after_key = self.page['aggregations']['drsid'].get('after_key')
 
+        # Keep any paths which were not in the snapshot for next time. A
+        # plain DatasetJSONMappings has nothing to save.
+        save = getattr(self.dataset_json, 'save', None)
+        if save is not None:
+            save()
+
         return self.drs_ids
@@ -0,0 +1,74 @@
+# encoding: utf-8
+"""
+Process-wide registry of Elasticsearch clients.
+
+Every component which talks to Elasticsearch gets its client from here so
+that the connection pool, and the TCP/TLS sessions in it, are shared rather
+than being set up again for each dataset.
+
+set_es_client replaces the client everywhere, e.g. with the in-memory
+stand-in used by the benchmarks.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from ceda_elasticsearch_tools.elasticsearch import CEDAElasticsearchClient
+import os
+
+# Connections kept open per host. Raise this when running concurrent workers
+# in one process.
+DEFAULT_POOL_SIZE = 10
+
+_clients = {}
+
+# Client used in place of CEDAElasticsearchClient, see set_es_client
+_override = None
+
+
+def set_es_client(client):
+    """
+    Use the given client for all subsequent calls to get_es_client. The
+    client is inherited by forked processes.
+
+    :param client: Object with the Elasticsearch client API, or None to go
+                   back to CEDAElasticsearchClient
+    """
+    global _override
+    _override = client
+
+
+def get_es_client(conf=None):
+    """
+    Return the shared Elasticsearch client for the given configuration,
+    creating it on first use.
+
+    Connection pools cannot be shared across a fork, so each process gets its
+    own client.
+
+    :param conf: ConfigParser config object. The api_key and
+                 connection_pool_size options in the elasticsearch section are used.
+    :return: CEDAElasticsearchClient
+    """
+    if _override is not None:
+        return _override
+
+    api_key = None
+    pool_size = DEFAULT_POOL_SIZE
+
+    if conf is not None:
+        api_key = conf.get('elasticsearch', 'api_key', fallback=None)
+        pool_size = conf.getint('elasticsearch', 'connection_pool_size', fallback=DEFAULT_POOL_SIZE)
+
+    key = (os.getpid(), api_key, pool_size)
+
+    if key not in _clients:
+        kwargs = {'maxsize': pool_size}
+        if api_key:
+            kwargs['headers'] = {'x-api-key': api_key}
+
+        _clients[key] = CEDAElasticsearchClient(**kwargs)
+
+    return _clients[key]
@@ -0,0 +1,195 @@
+# encoding: utf-8
+"""
+Helper class to get file statistics for all DRS datasets from the files index
+in a few requests, rather than querying each dataset separately.
+
+The statistics include a fingerprint of the files in each dataset, computed
+by Elasticsearch. It changes when a file is added, removed, renamed, resized
+or modified, so it can be used to detect changes which leave the file count
+the same.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from collections import namedtuple
+import hashlib
+from .es import get_es_client
+
+
+class DatasetStats(namedtuple('DatasetStats', ['file_count', 'total_size', 'fingerprint'])):
+    """
+    namedtuple to store the file statistics for a DRS dataset
+    - file_count  - number of NetCDF files
+    - total_size  - sum of the file sizes in bytes
+    - fingerprint - hash of the file count, total size, latest modification
+                    time and file paths. None if not known.
+    """
+
+
+# namedtuple only takes defaults from Python 3.7
+DatasetStats.__new__.__defaults__ = (None,)
+
+
+# Statistics for a dataset with no files in the index
+EMPTY_STATS = DatasetStats(file_count=0, total_size=0)
+
+# Painless scripts for an order independent hash of the file paths in a
+# bucket. Each path is hashed, mixed up to 64 bits and the results summed,
+# so the sum does not depend on the order the documents are visited in.
+PATH_HASH_SCRIPT = {
+    'init_script': 'state.hash = 0L',
+    'map_script': """
+        if (doc['info.directory.keyword'].size() > 0 && doc['info.name.keyword'].size() > 0) {
+            long h = (doc['info.directory.keyword'].value + '/' + doc['info.name.keyword'].value).hashCode();
+            h = h * -7046029254386353131L;
+            state.hash += h ^ (h >>> 29);
+        }
+    """,
+    'combine_script': 'return state.hash',
+    # Returned as a string as JSON numbers lose precision above 2^53
+    'reduce_script': 'long total = 0L; for (s in states) { if (s != null) { total += s } } return Long.toString(total)'
+}
+
+
+class DatasetInventory:
+    """
+    Runs a composite aggregation over the DRS IDs in the files index to
+    collect DatasetStats for every dataset.
+    """
+
+    # Buckets per page
+    PAGE_SIZE = 1000
+
+    def __init__(self, index, es=None):
+        """
+        :param index: Files index
+        :param es: Elasticsearch client. Defaults to the shared client.
+        """
+        self.es = es if es is not None else get_es_client()
+        self.index = index
+
+    def _get_query(self, drs_ids=None):
+        """
+        Returns the aggregation query
+
+        :param drs_ids: Optional list of DRS IDs to restrict the query to
+        :return: es query
+        :rtype: dict
+        """
+        filters = [
+            {
+                'term': {
+                    'info.format.keyword': {
+                        'value': 'NetCDF'
+                    }
+                }
+            }
+        ]
+
+        if drs_ids is not None:
+            filters.append({
+                'terms': {
+                    'projects.opensearch.drsId.keyword': list(drs_ids)
+                }
+            })
+
+        return {
+            'query': {
+                'bool': {
+                    'filter': filters
+                }
+            },
+            'size': 0,
+            'aggs': {
+                'datasets': {
+                    'composite': {
+                        'size': self.PAGE_SIZE,
+                        'sources': [
+                            {
+                                'drs': {
+                                    'terms': {
+                                        'field': 'projects.opensearch.drsId.keyword'
+                                    }
+                                }
+                            }
+                        ]
+                    },
+                    'aggs': {
+                        'total_size': {
+                            'sum': {
+                                'field': 'info.size'
+                            }
+                        },
+                        'last_modified': {
+                            'max': {
+                                'field': 'info.last_modified'
+                            }
+                        },
+                        'path_hash': {
+                            'scripted_metric': PATH_HASH_SCRIPT
+                        }
+                    }
+                }
+            }
+        }
+
+    @staticmethod
+    def _fingerprint(file_count, total_size, last_modified, path_hash):
+        """
+        Combine the statistics into a fingerprint
+
+        :return: sha1 hex
+        :rtype: str
+        """
+        key = f'{file_count}:{total_size}:{last_modified}:{path_hash}'
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _extract_stats(cls, bucket):
+        """
+        Convert an aggregation bucket into DatasetStats
+        """
+        file_count = bucket['doc_count']
+        total_size = int(bucket['total_size']['value'] or 0)
+
+        return DatasetStats(
+            file_count=file_count,
+            total_size=total_size,
+            fingerprint=cls._fingerprint(
+                file_count,
+                total_size,
+                bucket['last_modified']['value'],
+                bucket['path_hash']['value']
+            )
+        )
+
+    def get_stats(self, drs_ids=None):
+        """
+        Get the statistics for each DRS dataset. Datasets with no files do
+        not appear in the result, use EMPTY_STATS for these.
+
+        :param drs_ids: Optional list of DRS IDs to restrict the query to
+        :return: Mapping of DRS ID to DatasetStats
+        :rtype: dict
+        """
+        query = self._get_query(drs_ids)
+        composite = query['aggs']['datasets']['composite']
+        stats = {}
+
+        while True:
+            page = self.es.search(index=self.index, body=query)
+            aggregation = page['aggregations']['datasets']
+
+            for bucket in aggregation['buckets']:
+                stats[bucket['key']['drs']] = self._extract_stats(bucket)
+
+            after_key = aggregation.get('after_key')
+            if not after_key or not aggregation['buckets']:
+                break
+
+            composite['after'] = after_key
+
+        return stats
@@ -0,0 +1,232 @@
+# encoding: utf-8
+"""
+Snapshot of the aggregation mappings from the cci_tagger_json tree.
+
+Loading DatasetJSONMappings walks and parses every JSON file under
+JSON_TAGGER_ROOT. cci_publisher only needs the aggregation filters for the
+dataset paths in the collections index, so these are saved to a small JSON
+snapshot. The full mappings are only loaded when a path is not in the
+snapshot.
+
+The snapshot is keyed on the git revision of the JSON tree, or on the
+modification times and sizes of the JSON files if the tree is not a clean
+git checkout. It is discarded when the key changes. If there are no JSON
+files under the root, the root is probably wrong and the key would never
+change, so the snapshot is not used.
+"""
+__author__ = 'Richard Smith'
+__date__ = '16 Oct 2026'
+__copyright__ = 'Copyright 2018 United Kingdom Research and Innovation'
+__license__ = 'BSD - see LICENSE file in top-level package directory'
+__contact__ = 'richard.d.smith@stfc.ac.uk'
+
+from json_tagger import DatasetJSONMappings
+import hashlib
+import importlib
+import json
+import json_tagger
+import os
+import subprocess
+import sys
+import tempfile
+
+# Increment when the format of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.expanduser('~'), '.cache', 'cci_publisher', 'json_mappings.json')
+
+
+def _git_revision(root):
+    """
+    Git revision of the tree at root
+
+    :param root: Directory
+    :return: Commit hash, or None if root is not a clean git checkout
+    """
+    try:
+        revision = subprocess.run(['git', '-C', root, 'rev-parse', 'HEAD'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True, check=True).stdout.strip()
+        status = subprocess.run(['git', '-C', root, 'status', '--porcelain'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    if revision and not status:
+        return revision
+
+
+def _json_files(root):
+    """
+    Paths of the JSON files under root
+
+    :param root: Directory
+    :return: generator of paths
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip .git etc.
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith('.')]
+
+        for filename in filenames:
+            if filename.endswith('.json'):
+                yield os.path.join(dirpath, filename)
+
+
+def _stat_signature(root):
+    """
+    Hash of the paths, modification times and sizes of the JSON files under root
+
+    :param root: Directory
+    :return: sha1 hex
+    """
+    entries = []
+    for path in _json_files(root):
+        stat = os.stat(path)
+        entries.append(f'{path}:{stat.st_mtime_ns}:{stat.st_size}')
+
+    entries.sort()
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+
+def json_tagger_root():
+    """
+    Root of the JSON tree read by DatasetJSONMappings. Taken from
+    $JSON_TAGGER_ROOT, then the JSON_TAGGER_ROOT setting of json_tagger,
+    then the directory json_tagger is installed in, which holds the JSON
+    files when they are packaged with it.
+
+    :return: Directory or None
+    """
+    root = os.environ.get('JSON_TAGGER_ROOT')
+    if root:
+        return root
+
+    for module_name in ('json_tagger.settings', 'json_tagger'):
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+
+        root = getattr(module, 'JSON_TAGGER_ROOT', None)
+        if root:
+            return root
+
+    module_file = getattr(json_tagger, '__file__', None)
+    if module_file:
+        return os.path.dirname(os.path.abspath(module_file))
+
+
+def tree_key(root):
+    """
+    Key which changes whenever the JSON tree at root changes
+
+    :param root: JSON_TAGGER_ROOT
+    :return: str or None if root is not set or has no JSON files
+    """
+    if not root or next(_json_files(root), None) is None:
+        return None
+
+    revision = _git_revision(root)
+    if revision:
+        return f'git:{revision}'
+
+    return f'stat:{_stat_signature(root)}'
+
+
+class MappingsSnapshot:
+    """
+    Provides get_aggregations(path) from a snapshot, falling back to
+    DatasetJSONMappings for paths which are not in it. Call save() to write
+    any new paths back to the snapshot.
+
+    Instance Parameters:
+
+        :arg path: Snapshot file. None to keep the lookups in memory only.
+        :arg root: Root of the JSON tree. Defaults to json_tagger_root(). If not
+                   known, or it has no JSON files, the snapshot cannot be
+                   checked and is not used.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT, root=None):
+        self.path = path
+        self.root = root or json_tagger_root()
+        self.key = tree_key(self.root) if path else None
+
+        if path and not self.key:
+            print(f'Not using the JSON mappings snapshot {path}: cannot find the JSON files '
+                  f'under {self.root!r}, set JSON_TAGGER_ROOT', file=sys.stderr)
+
+        # Aggregation filters, or None, for each dataset path
+        self.aggregations = {}
+        self._mappings = None
+        self._changed = False
+
+        if self.key:
+            self._load()
+
+    def _load(self):
+        """
+        Read the snapshot, if it exists and matches the JSON tree
+        """
+        try:
+            with open(self.path) as reader:
+                snapshot = json.load(reader)
+        except (OSError, ValueError):
+            return
+
+        if snapshot.get('version') == SNAPSHOT_VERSION and snapshot.get('key') == self.key:
+            self.aggregations = snapshot['aggregations']
+
+    @property
+    def mappings(self):
+        """
+        The full DatasetJSONMappings, loaded on first use
+        """
+        if self._mappings is None:
+            self._mappings = DatasetJSONMappings()
+        return self._mappings
+
+    def get_aggregations(self, path):
+        """
+        :param path: Dataset path
+        :return: Aggregation filters for the path
+        """
+        if path not in self.aggregations:
+            self.aggregations[path] = self.mappings.get_aggregations(path) or None
+            self._changed = True
+
+        return self.aggregations[path]
+
+    def save(self):
+        """
+        Write the snapshot if there are new paths. The file is replaced
+        atomically so concurrent runs do not see a partial snapshot.
+        """
+        if not (self.key and self._changed):
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as writer:
+            json.dump({'version': SNAPSHOT_VERSION, 'key': self.key, 'aggregations': self.aggregations}, writer)
+
+        os.replace(tmp_path, self.path)
+        self._changed = False
+
+
+def get_mappings_snapshot(conf=None):
+    """
+    Create a MappingsSnapshot using the json_mappings_snapshot option in the
+    aggregation section of the config. An empty value disables the snapshot.
+
+    :param conf: ConfigParser config object
+    :return: MappingsSnapshot
+    """
+    path = DEFAULT_SNAPSHOT
+    if conf is not None:
+        path = conf.get('aggregation', 'json_mappings_snapshot', fallback=DEFAULT_SNAPSHOT) or None
+
+    return MappingsSnapshot(os.path.expanduser(path) if path else None)